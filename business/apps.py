@@ -0,0 +1,11 @@
+# business/apps.py
+
+from django.apps import AppConfig
+
+
+class BusinessConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'business'
+
+    def ready(self):
+        from . import signals  # noqa: F401
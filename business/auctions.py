@@ -0,0 +1,153 @@
+# File location: business/auctions.py
+
+"""
+Bid placement and auction settlement.
+
+`place_bid` validates and inserts a bid with the product row locked, so
+concurrent bids are serialized and every accepted bid clears the previous
+leader by the full increment.
+
+Both publish to open product and business pages through business.live.
+
+Settlement is run by the `settle_auctions` worker.
+Due auctions are claimed in batches with SELECT ... FOR UPDATE SKIP LOCKED,
+so several workers can run side by side without settling the same product
+twice. Settle lag (settled_at - end_time) is tracked per worker process;
+see `stats()`. Those counters live in the worker, not the web processes, so
+the metrics endpoint reports `backlog()` instead, read from the database:
+how many auctions are due and how long the oldest has been waiting.
+"""
+import logging
+import threading
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import live
+from .models import Bid, Product
+
+logger = logging.getLogger(__name__)
+
+SETTLE_BATCH_SIZE = 100
+
+_lock = threading.Lock()
+_stats = {
+    "batches": 0,
+    "settled": 0,
+    "with_winner": 0,
+    "expired": 0,
+    "last_lag_seconds": None,
+    "max_lag_seconds": None,
+}
+
+
+def place_bid(product_id, bidder, amount):
+    """
+    Place a bid in one transaction: lock the product row, re-check that
+    bidding is open and that amount clears the current minimum, insert the
+    bid and update the product's leader columns.
+    Returns (bid, product) with product reflecting the new leader.
+    Raises Product.DoesNotExist for unknown products and ValidationError
+    when the bid is rejected.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+
+        if not product.is_bidding_open():
+            raise ValidationError("Bidding is not open for this product.")
+        if bidder.pk == product.owner_id:
+            raise ValidationError("You cannot bid on your own product")
+
+        min_bid = product.get_minimum_bid()
+        if amount < min_bid:
+            raise ValidationError(f"Bid must be at least ${min_bid:.2f}.")
+
+        bid = Bid.objects.create(product=product, bidder=bidder, amount=amount)
+
+        # We hold the row lock and the bid cleared the minimum, so it leads
+        product.highest_bid = bid
+        product.highest_bid_amount = bid.amount
+        product.bid_count += 1
+
+        live.publish('bid', live.bid_payload(product), product_id=product.pk, owner_id=product.owner_id)
+
+    return bid, product
+
+
+def due_auctions(now=None):
+    """Products whose bidding window has closed but which haven't been settled."""
+    now = now or timezone.now()
+    return Product.objects.filter(
+        enable_bidding=True,
+        status='listed',
+        winning_bid__isnull=True,
+        end_time__lte=now,
+    )
+
+
+def backlog(now=None):
+    """
+    Auctions awaiting settlement, from the database so every process sees
+    the same numbers: {"due": count, "oldest_lag_seconds": seconds since the
+    oldest of them ended, 0 when none are due}.
+    """
+    now = now or timezone.now()
+    row = due_auctions(now).order_by().aggregate(due=Count('pk'), oldest=Min('end_time'))
+    oldest_lag = (now - row['oldest']).total_seconds() if row['oldest'] else 0
+    return {"due": row['due'], "oldest_lag_seconds": oldest_lag}
+
+
+def settle_due_auctions(batch_size=SETTLE_BATCH_SIZE):
+    """
+    Claim and settle up to batch_size due auctions in one transaction.
+    Rows locked by another worker are skipped rather than waited on.
+    Returns the settle lag in seconds for each product settled.
+    """
+    lags = []
+    winners = 0
+
+    with transaction.atomic():
+        products = list(
+            due_auctions()
+            .order_by('end_time')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        for product in products:
+            has_winner = product.settle_auction()
+            if has_winner:
+                winners += 1
+            lags.append((timezone.now() - product.end_time).total_seconds())
+            live.publish(
+                'settled',
+                {'product_id': product.pk, 'status': product.status, 'has_winner': has_winner},
+                product_id=product.pk,
+                owner_id=product.owner_id,
+            )
+
+    if lags:
+        _record(lags, winners)
+        logger.info(
+            "Settled %d auctions (%d with a winner), max lag %.1fs",
+            len(lags), winners, max(lags),
+        )
+    return lags
+
+
+def _record(lags, winners):
+    with _lock:
+        _stats["batches"] += 1
+        _stats["settled"] += len(lags)
+        _stats["with_winner"] += winners
+        _stats["expired"] += len(lags) - winners
+        _stats["last_lag_seconds"] = lags[-1]
+        batch_max = max(lags)
+        if _stats["max_lag_seconds"] is None or batch_max > _stats["max_lag_seconds"]:
+            _stats["max_lag_seconds"] = batch_max
+
+
+def stats():
+    """Snapshot of this process's settlement counters and lag."""
+    with _lock:
+        return dict(_stats)
@@ -209,7 +209,7 @@ class BidForm(forms.ModelForm):
         if amount < min_bid:
             raise forms.ValidationError(
                 f"Bid must be at least ${min_bid:.2f}. "
-                f"{'Current highest bid' if self.product.get_highest_bid() else 'Minimum price'}: ${min_bid:.2f}"
+                f"{'Current highest bid' if self.product.highest_bid_id else 'Minimum price'}: ${min_bid:.2f}"
             )
         
         # Check if user is the product owner
@@ -0,0 +1,139 @@
+# File location: business/geo.py
+
+"""
+Spatial helpers for map lookups.
+
+Products store a geohash of their coordinates so nearby searches can narrow
+the candidate rows to a bounding box inside the database before the exact
+Haversine distance check runs.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371
+
+# 7 characters is roughly a 150m x 150m cell, plenty for a storefront
+GEOHASH_PRECISION = 7
+
+# Upper bound on the number of prefixes OR'd together in one lookup
+MAX_COVERING_CELLS = 32
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    """
+    Encode a coordinate pair into a geohash string of the given precision.
+    """
+    lat = float(lat)
+    lng = float(lng)
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Return (min_lat, max_lat, min_lng, max_lng) enclosing a circle of
+    radius_km around the given point.
+
+    A box that crosses the antimeridian wraps: min_lng > max_lng, and the box
+    covers min_lng..180 plus -180..max_lng. Use `longitude_ranges` to split it.
+    """
+    lat = float(lat)
+    lng = float(lng)
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+
+    min_lat = max(lat - delta_lat, -90.0)
+    max_lat = min(lat + delta_lat, 90.0)
+
+    # Longitude degrees shrink towards the poles; widest at the edge nearest a pole
+    widest_lat = max(abs(min_lat), abs(max_lat))
+    cos_lat = math.cos(math.radians(widest_lat))
+    if cos_lat <= 1e-9:
+        return min_lat, max_lat, -180.0, 180.0
+
+    delta_lng = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if delta_lng >= 180:
+        return min_lat, max_lat, -180.0, 180.0
+
+    min_lng = lng - delta_lng
+    max_lng = lng + delta_lng
+    if min_lng < -180.0:
+        min_lng += 360.0
+    elif max_lng > 180.0:
+        max_lng -= 360.0
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def longitude_ranges(min_lng, max_lng):
+    """The (low, high) longitude spans of a box, two when it wraps the antimeridian."""
+    if min_lng <= max_lng:
+        return [(min_lng, max_lng)]
+    return [(min_lng, 180.0), (-180.0, max_lng)]
+
+
+def _cell_size(precision):
+    """Return (lat_height, lng_width) in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def covering_cells(min_lat, max_lat, min_lng, max_lng, max_cells=MAX_COVERING_CELLS):
+    """
+    Return the set of geohash prefixes whose cells cover the bounding box.
+
+    Uses the finest precision that stays within max_cells prefixes. Returns an
+    empty set when the box is too large to be worth a prefix filter. Boxes
+    wrapping the antimeridian (min_lng > max_lng) get cells on both sides.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_height, lng_width = _cell_size(precision)
+        lat_cells = int(180 / lat_height)
+        lng_cells = int(360 / lng_width)
+
+        row_start = min(int((min_lat + 90) // lat_height), lat_cells - 1)
+        row_end = min(int((max_lat + 90) // lat_height), lat_cells - 1)
+        columns = []
+        for low, high in longitude_ranges(min_lng, max_lng):
+            col_start = min(int((low + 180) // lng_width), lng_cells - 1)
+            col_end = min(int((high + 180) // lng_width), lng_cells - 1)
+            columns.append(range(col_start, col_end + 1))
+
+        if (row_end - row_start + 1) * sum(len(cols) for cols in columns) > max_cells:
+            continue
+
+        cells = set()
+        for row in range(row_start, row_end + 1):
+            cell_lat = -90 + (row + 0.5) * lat_height
+            for cols in columns:
+                for col in cols:
+                    cell_lng = -180 + (col + 0.5) * lng_width
+                    cells.add(encode_geohash(cell_lat, cell_lng, precision))
+        return cells
+
+    return set()
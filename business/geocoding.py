@@ -0,0 +1,317 @@
+# File location: business/geocoding.py
+
+"""
+Cached geocoding for business addresses and ZIP codes.
+
+Lookups go through three layers before touching Nominatim:
+  1. an in-process memory cache
+  2. the GeocodeCache table (shared by every worker, with TTL and
+     negative caching for addresses Nominatim could not resolve)
+  3. for ZIP codes, the offline ZipCodeCentroid gazetteer
+     (load it with `manage.py import_zip_gazetteer`)
+
+Hit/miss counters are kept per process; see `stats()`. An address or ZIP
+Nominatim doesn't know gives None; Nominatim being down or slow raises
+GeocoderUnavailable instead, so callers can tell "not found" from "try again".
+
+Business registrations are geocoded once, off the request path, by
+`schedule_business_geocode` (or the `geocode_businesses` command for
+backfills); products and listings copy the stored coordinates.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .geo import encode_geohash
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {
+    'User-Agent': 'LastBite-App/1.0'  # Required by Nominatim
+}
+
+MEMORY_CACHE_SIZE = 1024
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_counters = Counter()
+
+
+class GeocoderUnavailable(Exception):
+    """Nominatim couldn't be reached or answered with an error; nothing was cached."""
+
+
+def _ttl():
+    return getattr(settings, "GEOCODE_CACHE_TTL", timedelta(days=30))
+
+
+def _negative_ttl():
+    return getattr(settings, "GEOCODE_NEGATIVE_TTL", timedelta(days=1))
+
+
+def normalize_address(address_string):
+    """Lowercase, drop periods and collapse whitespace so equivalent spellings share a key."""
+    value = (address_string or "").lower().replace(".", "")
+    value = re.sub(r"\s*,\s*", ", ", value)
+    return " ".join(value.split())
+
+
+def normalize_zipcode(zip_code):
+    """Reduce ZIP or ZIP+4 input to the 5-digit ZIP."""
+    digits = re.sub(r"\D", "", zip_code or "")
+    return digits[:5]
+
+
+def stats():
+    """Snapshot of this process's cache counters."""
+    with _lock:
+        snapshot = dict(_counters)
+    for key in ("memory_hits", "db_hits", "gazetteer_hits", "negative_hits", "misses", "errors"):
+        snapshot.setdefault(key, 0)
+    snapshot["memory_entries"] = len(_memory)
+    return snapshot
+
+
+def clear_memory_cache():
+    with _lock:
+        _memory.clear()
+
+
+def _count(key):
+    with _lock:
+        _counters[key] += 1
+
+
+def _memory_get(key):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return entry
+
+
+def _memory_set(key, result, ttl):
+    with _lock:
+        _memory[key] = (time.monotonic() + ttl.total_seconds(), result)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _cached_lookup(kind, query, fetch):
+    """
+    Resolve (kind, query) through memory, then the GeocodeCache table, then fetch().
+    fetch() returns a result dict, None when nothing was found, or raises on
+    network failure. Failures are not cached and raise GeocoderUnavailable.
+    """
+    from .models import GeocodeCache
+
+    key = (kind, query)
+    entry = _memory_get(key)
+    if entry is not None:
+        _count("memory_hits")
+        return entry[1]
+
+    now = timezone.now()
+    row = GeocodeCache.objects.filter(kind=kind, query=query, expires_at__gt=now).first()
+    if row is not None:
+        result = row.as_result()
+        _count("db_hits" if row.found else "negative_hits")
+        _memory_set(key, result, row.expires_at - now)
+        return result
+
+    _count("misses")
+    try:
+        result = fetch()
+    except Exception as e:
+        _count("errors")
+        logger.warning("Geocoding %s %r failed: %s", kind, query, e)
+        raise GeocoderUnavailable(f"Geocoding {kind} {query!r} failed: {e}") from e
+
+    ttl = _ttl() if result else _negative_ttl()
+    GeocodeCache.store(kind, query, result, now + ttl)
+    _memory_set(key, result, ttl)
+    return result
+
+
+def _nominatim(params):
+    response = requests.get(
+        NOMINATIM_URL,
+        params={**params, 'format': 'json', 'limit': 1},
+        headers=NOMINATIM_HEADERS,
+        timeout=5,
+    )
+    response.raise_for_status()
+    data = response.json()
+    return data[0] if data else None
+
+
+def _fetch_address(address_string):
+    result = _nominatim({'q': address_string, 'addressdetails': 1})
+    if not result:
+        return None
+
+    address_details = result.get('address', {})
+
+    # Extract address components
+    street_number = address_details.get('house_number', '')
+    street = address_details.get('road', '')
+    street_address = f"{street_number} {street}".strip() if street_number else street
+
+    return {
+        'latitude': float(result['lat']),
+        'longitude': float(result['lon']),
+        'address': street_address or address_details.get('street', ''),
+        'city': address_details.get('city') or address_details.get('town') or address_details.get('village', ''),
+        'state': address_details.get('state', ''),
+        'zip_code': address_details.get('postcode', ''),
+        'display_name': result.get('display_name', ''),
+    }
+
+
+def _fetch_zipcode(zip_code):
+    result = _nominatim({'postalcode': zip_code, 'country': 'US'})
+    if not result:
+        return None
+    return {
+        'latitude': float(result['lat']),
+        'longitude': float(result['lon']),
+        'address': '',
+        'city': '',
+        'state': '',
+        'zip_code': zip_code,
+        'display_name': result.get('display_name', ''),
+    }
+
+
+def geocode_address(address_string):
+    """
+    Geocode an address string to lat/lng.
+    Returns: dict with 'latitude', 'longitude', 'address', 'city', 'state',
+    'zip_code' and 'display_name', or None if the address can't be resolved.
+    Raises GeocoderUnavailable when Nominatim can't be reached.
+    """
+    if not address_string or not address_string.strip():
+        return None
+
+    query = normalize_address(address_string)
+    return _cached_lookup("address", query, lambda: _fetch_address(address_string))
+
+
+def geocode_zipcode(zip_code):
+    """
+    Resolve a US ZIP code to its centroid. The offline gazetteer is checked
+    first, so imported ZIPs never need the network.
+    Returns the same dict shape as geocode_address, or None; raises
+    GeocoderUnavailable like it.
+    """
+    from .models import ZipCodeCentroid
+
+    query = normalize_zipcode(zip_code)
+    if len(query) != 5:
+        return None
+
+    entry = _memory_get(("zip", query))
+    if entry is not None:
+        _count("memory_hits")
+        return entry[1]
+
+    centroid = ZipCodeCentroid.objects.filter(zip_code=query).first()
+    if centroid is not None:
+        _count("gazetteer_hits")
+        result = centroid.as_result()
+        _memory_set(("zip", query), result, _ttl())
+        return result
+
+    return _cached_lookup("zip", query, lambda: _fetch_zipcode(query))
+
+
+def geocode_business(business_id):
+    """
+    Geocode a BusinessRegistration's address and store the result on it, then
+    copy the location onto the owner's products and listings.
+    Returns True if the registration now has coordinates. Raises
+    GeocoderUnavailable when Nominatim can't be reached.
+    """
+    from users.models import BusinessRegistration
+    from .models import Listing, Product
+
+    business = BusinessRegistration.objects.filter(pk=business_id).first()
+    if business is None or not business.address:
+        return False
+
+    location = geocode_address(business.address)
+    if not location:
+        return False
+
+    latitude = round(location['latitude'], 6)
+    longitude = round(location['longitude'], 6)
+    fields = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'address': location['address'][:255],
+        'city': location['city'][:100],
+        'state': location['state'][:50],
+        'zip_code': location['zip_code'][:10],
+    }
+
+    with transaction.atomic():
+        # Guard against the address changing while we were geocoding
+        updated = BusinessRegistration.objects.filter(pk=business_id, address=business.address).update(
+            latitude=latitude,
+            longitude=longitude,
+            normalized_address=fields['address'],
+            city=fields['city'],
+            state=fields['state'],
+            zip_code=fields['zip_code'],
+            geocoded_at=timezone.now(),
+        )
+        if not updated:
+            return False
+
+        if business.user_id:
+            Product.objects.filter(owner_id=business.user_id).update(
+                geohash=encode_geohash(latitude, longitude), **fields
+            )
+            Listing.objects.filter(owner_id=business.user_id).update(**fields)
+
+    return True
+
+
+def schedule_business_geocode(business_id):
+    """
+    Geocode a business registration in a background thread once the current
+    transaction commits, so registration never waits on Nominatim.
+    Anything missed (e.g. the process exiting) is picked up by
+    `manage.py geocode_businesses`.
+    """
+    def start():
+        threading.Thread(target=_geocode_business_in_thread, args=(business_id,), daemon=True).start()
+
+    transaction.on_commit(start)
+
+
+def _geocode_business_in_thread(business_id):
+    try:
+        geocode_business(business_id)
+    except GeocoderUnavailable:
+        # Already logged; `manage.py geocode_businesses` retries it later
+        pass
+    except Exception:
+        logger.exception("Background geocoding failed for business %s", business_id)
+    finally:
+        connection.close()
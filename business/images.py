@@ -0,0 +1,234 @@
+# File location: business/images.py
+
+"""
+Resized variants of uploaded product, listing and business logo images.
+
+Uploads are stored as-is, then a background thread (scheduled from
+business/signals.py once the save commits) renders:
+
+  - a JPEG thumbnail THUMB_WIDTH wide, used as the <img src> fallback
+  - WebP copies at each of WIDTHS, offered through srcset
+
+No image is scaled up, and each keeps its aspect ratio within a
+width x width box. Their storage names go into the model's variants JSON
+field (see FIELDS), together with the source file name they were made
+from, so a stale set is easy to spot:
+
+    {"source": "products/a.jpg", "thumb": "variants/products/a-320.jpg",
+     "webp": [[160, "variants/products/a-160.webp"], ...]}
+
+An image Pillow can't read gets {"source": ...} only, and pages keep
+serving the original. Until the variants exist, pages serve the original
+too. `manage.py build_image_variants` catches up on anything the threads
+missed. Counters are kept per process; see `stats()`.
+"""
+import io
+import logging
+import posixpath
+import threading
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (160, 320, 640)
+THUMB_WIDTH = 320
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+# Decompression-bomb guard: refuse anything bigger than this many pixels
+MAX_PIXELS = 40_000_000
+
+VARIANTS_DIR = "variants"
+
+# model label -> (file field, variants field)
+FIELDS = {
+    "business.Product": ("image", "image_variants"),
+    "business.Listing": ("image", "image_variants"),
+    "users.BusinessRegistration": ("logo", "logo_variants"),
+}
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def stats():
+    """Snapshot of this process's variant counters."""
+    with _lock:
+        snapshot = dict(_counters)
+    for key in ("built", "cleared", "unreadable", "errors"):
+        snapshot.setdefault(key, 0)
+    return snapshot
+
+
+def _count(key):
+    with _lock:
+        _counters[key] += 1
+
+
+def _fields(instance):
+    return FIELDS[instance._meta.label]
+
+
+def is_stale(instance):
+    """Whether instance's variants were made from a different file than it has now."""
+    file_field, variants_field = _fields(instance)
+    source = getattr(instance, file_field).name or ""
+    variants = getattr(instance, variants_field) or {}
+    return variants.get("source", "") != source
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=quality, optimize=fmt == "JPEG")
+    return buffer.getvalue()
+
+
+def _store(name, data):
+    return default_storage.save(name, ContentFile(data))
+
+
+def render(source):
+    """
+    Render and store the variants of the file stored as source; return the
+    variants dict. Raises UnidentifiedImageError (or Image.DecompressionBombError)
+    for files that aren't usable images.
+    """
+    with default_storage.open(source, "rb") as f:
+        image = Image.open(f)
+        if image.width * image.height > MAX_PIXELS:
+            raise Image.DecompressionBombError(f"{source} is {image.width}x{image.height}")
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    stem = posixpath.join(VARIANTS_DIR, posixpath.splitext(source)[0])
+    variants = {"source": source, "webp": []}
+    seen = set()
+    for width in sorted(set(WIDTHS) | {THUMB_WIDTH}):
+        resized = image.copy()
+        resized.thumbnail((width, width), Image.Resampling.LANCZOS)
+        if width in WIDTHS and resized.width not in seen:
+            # Small originals give the same size for several widths; keep one
+            seen.add(resized.width)
+            name = _store(f"{stem}-{width}.webp", _encode(resized, "WEBP", WEBP_QUALITY))
+            variants["webp"].append([resized.width, name])
+        if width == THUMB_WIDTH:
+            # JPEG has no alpha; flatten onto white
+            if resized.mode == "RGBA":
+                flat = Image.new("RGB", resized.size, "white")
+                flat.paste(resized, mask=resized.getchannel("A"))
+                resized = flat
+            variants["thumb"] = _store(f"{stem}-{width}.jpg", _encode(resized, "JPEG", JPEG_QUALITY))
+    return variants
+
+
+def _files(variants):
+    names = [name for _, name in (variants or {}).get("webp", [])]
+    if (variants or {}).get("thumb"):
+        names.append(variants["thumb"])
+    return names
+
+
+def _owner_id(instance):
+    return getattr(instance, "owner_id", None) or getattr(instance, "user_id", None)
+
+
+def build_variants(label, pk, force=False):
+    """
+    Bring one row's variants up to date with its current file (or rebuild
+    them regardless, with force). Returns True when the row was changed. The stored variants only replace the old ones
+    if the file is still the one they were made from, so a second upload
+    that lands meanwhile wins; files that end up unreferenced are deleted.
+    """
+    model = apps.get_model(label)
+    file_field, variants_field = FIELDS[label]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not (force or is_stale(instance)):
+        return False
+
+    source = getattr(instance, file_field).name or ""
+    old = getattr(instance, variants_field) or {}
+    if not source:
+        variants = {}
+    else:
+        try:
+            variants = render(source)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            logger.warning("Can't make variants of %s %s (%s): %s", label, pk, source, e)
+            _count("unreadable")
+            variants = {"source": source}
+
+    current = Q(**{file_field: source}) if source else Q(**{file_field: ""}) | Q(**{f"{file_field}__isnull": True})
+    updated = model.objects.filter(current, pk=pk).update(**{variants_field: variants})
+    if not updated:
+        _delete(_files(variants))
+        return False
+
+    _delete([name for name in _files(old) if name not in _files(variants)])
+    _count("built" if source else "cleared")
+
+    # The cached business pages embed image URLs; the update above skipped the signals
+    owner_id = _owner_id(instance)
+    if owner_id:
+        page_cache.bump(owner_id)
+    return True
+
+
+def _delete(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning("Couldn't delete image variant %s", name)
+
+
+def schedule(instance):
+    """
+    Build instance's variants in a background thread once the current
+    transaction commits, if its file changed since they were made, so
+    uploads never wait on Pillow.
+    """
+    if set(_fields(instance)) & instance.get_deferred_fields() or not is_stale(instance):
+        return
+    label, pk = instance._meta.label, instance.pk
+
+    def start():
+        threading.Thread(target=_build_in_thread, args=(label, pk), daemon=True).start()
+
+    transaction.on_commit(start)
+
+
+def _build_in_thread(label, pk):
+    try:
+        build_variants(label, pk)
+    except Exception:
+        _count("errors")
+        logger.exception("Building image variants failed for %s %s", label, pk)
+    finally:
+        connection.close()
+
+
+def variant_url(file, variants):
+    """URL of the thumbnail, or of the original until there is one; None without a file."""
+    if not file:
+        return None
+    thumb = (variants or {}).get("thumb")
+    if thumb and variants.get("source") == file.name:
+        return default_storage.url(thumb)
+    return file.url
+
+
+def srcset(file, variants):
+    """The srcset value for the WebP variants of file, or "" while there are none."""
+    if not file or (variants or {}).get("source") != file.name:
+        return ""
+    return ", ".join(f"{default_storage.url(name)} {width}w" for width, name in variants.get("webp", []))
@@ -0,0 +1,398 @@
+# File location: business/live.py
+
+"""
+Live bid and price updates for product and business pages.
+
+Writers call `publish`; the SSE views in business/views.py hold a
+`subscribe`d queue per open page and turn its messages into server-sent
+events with `stream`. Messages are addressed to keys: product:<id> for a
+product page and owner:<user id> for a business page.
+
+Two backends, picked by settings.LIVE_UPDATES_BACKEND:
+
+- "local": fan out inside this process once the transaction commits.
+  Fine for runserver or a single worker.
+- "postgres": publish with pg_notify on the writer's connection, so the
+  message goes out at commit. Every process runs one listener thread
+  (LISTEN on its own connection) that hands messages to its local
+  subscribers, so a bid placed in one worker reaches pages held by any
+  other worker or by the settle_auctions process.
+
+Price tiers change with time rather than on a write, so `stream` also
+wakes at each product's next tier boundary and pushes the new price.
+
+Under WSGI (runserver, gunicorn gthread) each open stream holds a worker
+thread, so a process holds at most settings.LIVE_THREAD_STREAMS of them;
+`subscribe` raises TooManyStreams past that and the view answers 503, after
+which the page tries again later. Under ASGI (gunicorn with uvicorn
+workers) the views use `astream` instead, which waits on the event loop, so
+open streams cost no threads and aren't capped.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'lastbite_live'
+KEEPALIVE_SECONDS = 15
+# Streams end after this long and EventSource reconnects, so a worker
+# thread is never pinned to one client indefinitely
+STREAM_MAX_SECONDS = 300
+RETRY_MILLISECONDS = 3000
+# How long a page turned away by TooManyStreams waits before trying again
+BUSY_RETRY_SECONDS = 30
+
+# Minutes before end_time at which Product.get_current_price changes tier
+PRICE_TIER_MINUTES = (60, 30, 0)
+PRICE_QUANTUM = Decimal('0.01')
+
+
+def product_key(product_id):
+    return f"product:{product_id}"
+
+
+def owner_key(user_id):
+    return f"owner:{user_id}"
+
+
+class TooManyStreams(Exception):
+    """This process already holds as many thread-bound streams as it may."""
+
+
+class Subscription:
+    """A queue of messages for one open stream."""
+
+    def __init__(self, broker, keys):
+        self.broker = broker
+        self.keys = frozenset(keys)
+        self.queue = queue.SimpleQueue()
+
+    def get(self, timeout):
+        """Next message, or None if nothing arrives within timeout seconds."""
+        try:
+            return self.queue.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def put(self, message):
+        self.queue.put(message)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """A Subscription read from an event loop; create it on that loop."""
+
+    def __init__(self, broker, keys):
+        super().__init__(broker, keys)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, message):
+        # Called from the listener thread or a request thread, never the loop
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """In-process fan-out from keys to open subscriptions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._open = set()
+
+    def subscribe(self, keys, subscription_class=Subscription, limit=None):
+        """
+        Open a subscription to keys. With limit, raise TooManyStreams when that
+        many subscriptions of subscription_class are already open.
+        """
+        subscription = subscription_class(self, keys)
+        with self._lock:
+            if limit is not None and sum(type(s) is subscription_class for s in self._open) >= limit:
+                raise TooManyStreams(f"{limit} streams already open")
+            self._open.add(subscription)
+            for key in subscription.keys:
+                self._subscriptions[key].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._open.discard(subscription)
+            for key in subscription.keys:
+                self._subscriptions[key].discard(subscription)
+                if not self._subscriptions[key]:
+                    del self._subscriptions[key]
+
+    def dispatch(self, message):
+        with self._lock:
+            targets = set()
+            for key in message['keys']:
+                targets |= self._subscriptions.get(key, set())
+        for subscription in targets:
+            subscription.put(message)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._open)
+
+
+class LocalBackend:
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, message):
+        transaction.on_commit(lambda: self.broker.dispatch(message))
+
+
+class PostgresBackend:
+
+    # How often the listener wakes to check whether it should stop
+    POLL_SECONDS = 1.0
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start this process's listener thread, once."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._listen, name='live-updates-listener', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping.set()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+
+    def publish(self, message):
+        # NOTIFY is transactional: listeners see it only if and when we commit
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, json.dumps(message)])
+
+    def _connect(self):
+        import psycopg
+
+        params = connection.settings_dict
+        return psycopg.connect(
+            dbname=params['NAME'],
+            user=params['USER'],
+            password=params['PASSWORD'],
+            host=params['HOST'],
+            port=params['PORT'] or None,
+            autocommit=True,
+        )
+
+    def _listen(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    backoff = 1
+                    while not self._stopping.is_set():
+                        for notify in conn.notifies(timeout=self.POLL_SECONDS):
+                            try:
+                                self.broker.dispatch(json.loads(notify.payload))
+                            except (ValueError, KeyError):
+                                logger.warning("Ignoring malformed live update: %r", notify.payload)
+            except Exception:
+                logger.exception("Live updates listener lost its connection; retrying in %ss", backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+_broker = Broker()
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _get_backend():
+    name = settings.LIVE_UPDATES_BACKEND
+    if name == 'postgres' and connection.vendor != 'postgresql':
+        name = 'local'
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = PostgresBackend(_broker) if name == 'postgres' else LocalBackend(_broker)
+        return _backends[name]
+
+
+def publish(event, data, product_id=None, owner_id=None):
+    """
+    Send event to the pages of product_id and/or owner_id once the current
+    transaction commits (immediately outside a transaction).
+    """
+    keys = []
+    if product_id is not None:
+        keys.append(product_key(product_id))
+    if owner_id is not None:
+        keys.append(owner_key(owner_id))
+    if keys:
+        _get_backend().publish({'keys': keys, 'event': event, 'data': data})
+
+
+def subscribe(*keys, limit=None):
+    """A thread-bound Subscription to keys; raises TooManyStreams once limit are open."""
+    backend = _get_backend()
+    backend.start()
+    return _broker.subscribe(keys, limit=limit)
+
+
+def _subscribe_async(keys):
+    _get_backend().start()
+    return _broker.subscribe(keys, AsyncSubscription)
+
+
+def stop():
+    """Stop listener threads, e.g. before the database goes away."""
+    with _backends_lock:
+        backends = list(_backends.values())
+    for backend in backends:
+        backend.stop()
+
+
+def stats():
+    """Open streams in this process."""
+    return {'subscriptions': _broker.subscriber_count()}
+
+
+def bid_payload(product):
+    """Bid state of product for the `bid` event and the stream snapshot."""
+    return {
+        'product_id': product.pk,
+        'highest_bid_amount': str(product.highest_bid_amount) if product.highest_bid_amount is not None else None,
+        'minimum_bid': str(product.get_minimum_bid()),
+        'bid_count': product.bid_count,
+    }
+
+
+def price_payload(product):
+    return {
+        'product_id': product.pk,
+        'current_price': str(product.get_current_price().quantize(PRICE_QUANTUM)),
+        'base_price': str(product.base_price),
+    }
+
+
+def next_price_change(end_time, now):
+    """When the price of a product ending at end_time next changes tier, or None."""
+    if end_time is None:
+        return None
+    for minutes in PRICE_TIER_MINUTES:
+        boundary = end_time - timedelta(minutes=minutes)
+        if boundary > now:
+            return boundary
+    return None
+
+
+def _format(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _next_wait(products, deadline):
+    """(tier changes per product, seconds to wait), or None once the stream is due to end."""
+    now = timezone.now()
+    changes = [next_price_change(product.end_time, now) for product in products]
+    next_change = min((change for change in changes if change), default=None)
+
+    wait = min(KEEPALIVE_SECONDS, deadline - time.monotonic())
+    if next_change is not None:
+        wait = min(wait, (next_change - now).total_seconds())
+    if wait <= 0 and time.monotonic() >= deadline:
+        return None
+    return changes, wait
+
+
+def _tier_events(products, changes):
+    """`price` events for products whose tier change is now due, else a keepalive."""
+    now = timezone.now()
+    changed = [
+        product for product, change in zip(products, changes)
+        if change is not None and change <= now
+    ]
+    for product in changed:
+        yield _format('price', price_payload(product))
+    if not changed:
+        yield ": keepalive\n\n"
+
+
+def _opening_events(products, snapshot):
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    if snapshot:
+        for product in products:
+            yield _format('snapshot', {**bid_payload(product), **price_payload(product)})
+
+
+def stream(subscription, products, snapshot=False, max_seconds=None):
+    """
+    Server-sent events for an open subscription: published messages as they
+    arrive, a `price` event whenever one of products crosses a price tier,
+    and a comment every KEEPALIVE_SECONDS so proxies keep the connection.
+    products are Product instances; they are only read, never queried.
+    """
+    max_seconds = STREAM_MAX_SECONDS if max_seconds is None else max_seconds
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield from _opening_events(products, snapshot)
+        while (step := _next_wait(products, deadline)) is not None:
+            changes, wait = step
+            message = subscription.get(timeout=wait)
+            if message is not None:
+                yield _format(message['event'], message['data'])
+            else:
+                yield from _tier_events(products, changes)
+    finally:
+        subscription.close()
+
+
+async def astream(keys, products, snapshot=False, max_seconds=None):
+    """
+    `stream` for ASGI: the same events, for a subscription to keys that is
+    opened on the serving event loop when the response starts.
+    """
+    max_seconds = STREAM_MAX_SECONDS if max_seconds is None else max_seconds
+    deadline = time.monotonic() + max_seconds
+    subscription = _subscribe_async(keys)
+    try:
+        for chunk in _opening_events(products, snapshot):
+            yield chunk
+        while (step := _next_wait(products, deadline)) is not None:
+            changes, wait = step
+            message = await subscription.get(timeout=wait)
+            if message is not None:
+                yield _format(message['event'], message['data'])
+            else:
+                for chunk in _tier_events(products, changes):
+                    yield chunk
+    finally:
+        subscription.close()
@@ -0,0 +1,26 @@
+# File location: business/management/commands/backfill_bid_stats.py
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from business.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized highest_bid / highest_bid_amount / bid_count columns on products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Products updated per UPDATE statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Product.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        updated = 0
+        # Walk the id range so no single UPDATE locks the whole table
+        for start in range(0, max_id + 1, batch_size):
+            updated += Product.objects.filter(
+                id__gte=start, id__lt=start + batch_size
+            ).refresh_bid_stats()
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Refreshed bid stats on {updated} products"))
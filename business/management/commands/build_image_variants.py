@@ -0,0 +1,34 @@
+# File location: business/management/commands/build_image_variants.py
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from business import images
+
+
+class Command(BaseCommand):
+    help = 'Build the resized variants of product, listing and logo images that are missing or out of date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every image, not just stale ones')
+
+    def handle(self, *args, **options):
+        built = 0
+        for label, (file_field, variants_field) in images.FIELDS.items():
+            model = apps.get_model(label)
+            has_file = ~Q(**{file_field: ''}) & Q(**{f'{file_field}__isnull': False})
+            had_variants = ~Q(**{variants_field: {}})
+            rows = model.objects.filter(has_file | had_variants).only('pk', file_field, variants_field)
+
+            for instance in rows.iterator():
+                if not options['all'] and not images.is_stale(instance):
+                    continue
+                if images.build_variants(label, instance.pk, force=options['all']):
+                    built += 1
+                    self.stdout.write(f"{label} {instance.pk}: {getattr(instance, file_field).name or '(removed)'}")
+
+        counts = images.stats()
+        self.stdout.write(self.style.SUCCESS(f"✓ Updated {built} images"))
+        if counts['unreadable']:
+            self.stdout.write(self.style.WARNING(f"{counts['unreadable']} files were not readable images"))
@@ -0,0 +1,48 @@
+# File location: business/management/commands/geocode_businesses.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from business import geocoding
+from users.models import BusinessRegistration
+
+
+class Command(BaseCommand):
+    help = 'Geocode business registrations that have no stored coordinates yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-geocode every registration, not just pending ones')
+
+    def handle(self, *args, **options):
+        businesses = BusinessRegistration.objects.exclude(address="")
+        if not options['all']:
+            businesses = businesses.filter(geocoded_at__isnull=True)
+
+        total = businesses.count()
+        self.stdout.write(self.style.WARNING(f"Found {total} business registrations to geocode"))
+
+        updated_count = 0
+        failed_count = 0
+        for business_id, address in businesses.values_list('id', 'address').iterator():
+            misses_before = geocoding.stats()['misses']
+            try:
+                geocoded = geocoding.geocode_business(business_id)
+            except geocoding.GeocoderUnavailable:
+                # Already logged; a later run retries it, nothing was cached
+                geocoded = False
+            if geocoded:
+                self.stdout.write(self.style.SUCCESS(f"✓ Business {business_id}: {address}"))
+                updated_count += 1
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ Failed to geocode business {business_id}: {address}"))
+                failed_count += 1
+
+            # Be nice to Nominatim API - rate limit to 1 request per second
+            if geocoding.stats()['misses'] > misses_before:
+                time.sleep(1)
+
+        self.stdout.write("\n" + "="*50)
+        self.stdout.write(self.style.SUCCESS(f"✓ Successfully geocoded: {updated_count} businesses"))
+        self.stdout.write(self.style.ERROR(f"✗ Failed: {failed_count} businesses"))
+        self.stdout.write("="*50)
@@ -0,0 +1,109 @@
+# File location: business/management/commands/import_zip_gazetteer.py
+
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from business import geocoding
+from business.models import ZipCodeCentroid
+
+# Accepted header names, so both the Census ZCTA gazetteer
+# (tab separated, GEOID/INTPTLAT/INTPTLONG) and simple CSVs load as-is
+ZIP_COLUMNS = ("zip", "zip_code", "zipcode", "postal_code", "geoid")
+LAT_COLUMNS = ("lat", "latitude", "intptlat")
+LNG_COLUMNS = ("lng", "lon", "long", "longitude", "intptlong")
+CITY_COLUMNS = ("city", "place", "primary_city")
+STATE_COLUMNS = ("state", "state_code", "usps")
+
+
+class Command(BaseCommand):
+    help = 'Import an offline ZIP code centroid gazetteer (CSV or tab separated) for geocoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the gazetteer file')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+
+        try:
+            handle = open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        with handle:
+            sample = handle.readline()
+            handle.seek(0)
+            delimiter = '\t' if '\t' in sample else ','
+            reader = csv.DictReader(handle, delimiter=delimiter)
+            columns = self._resolve_columns(reader.fieldnames or [])
+
+            imported = 0
+            skipped = 0
+            batch = []
+            for row in reader:
+                centroid = self._parse_row(row, columns)
+                if centroid is None:
+                    skipped += 1
+                    continue
+                batch.append(centroid)
+                if len(batch) >= batch_size:
+                    imported += self._save(batch)
+                    batch = []
+            if batch:
+                imported += self._save(batch)
+
+        # Drop anything this process cached from the network before the import
+        geocoding.clear_memory_cache()
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Imported {imported} ZIP centroids"))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} rows without a valid ZIP or coordinates"))
+
+    def _resolve_columns(self, fieldnames):
+        by_name = {name.strip().lower(): name for name in fieldnames}
+
+        def pick(candidates, required=True):
+            for candidate in candidates:
+                if candidate in by_name:
+                    return by_name[candidate]
+            if required:
+                raise CommandError(f"Missing column; expected one of: {', '.join(candidates)}")
+            return None
+
+        return {
+            'zip': pick(ZIP_COLUMNS),
+            'lat': pick(LAT_COLUMNS),
+            'lng': pick(LNG_COLUMNS),
+            'city': pick(CITY_COLUMNS, required=False),
+            'state': pick(STATE_COLUMNS, required=False),
+        }
+
+    def _parse_row(self, row, columns):
+        zip_code = geocoding.normalize_zipcode(row.get(columns['zip']))
+        if len(zip_code) != 5:
+            return None
+        try:
+            latitude = Decimal(row[columns['lat']].strip()).quantize(Decimal('0.000001'))
+            longitude = Decimal(row[columns['lng']].strip()).quantize(Decimal('0.000001'))
+        except (InvalidOperation, AttributeError):
+            return None
+
+        return ZipCodeCentroid(
+            zip_code=zip_code,
+            latitude=latitude,
+            longitude=longitude,
+            city=(row.get(columns['city']) or '').strip()[:100] if columns['city'] else '',
+            state=(row.get(columns['state']) or '').strip()[:50] if columns['state'] else '',
+        )
+
+    def _save(self, batch):
+        ZipCodeCentroid.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['zip_code'],
+            update_fields=['latitude', 'longitude', 'city', 'state'],
+        )
+        return len(batch)
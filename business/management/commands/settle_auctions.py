@@ -0,0 +1,43 @@
+# File location: business/management/commands/settle_auctions.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from business import auctions
+
+
+class Command(BaseCommand):
+    help = 'Settle auctions whose end_time has passed (pick winners, expire unbid products)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=auctions.SETTLE_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds to sleep when nothing is due (with --loop)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        try:
+            while True:
+                lags = auctions.settle_due_auctions(batch_size=batch_size)
+                if lags:
+                    self.stdout.write(
+                        f"Settled {len(lags)} auctions · "
+                        f"lag avg {sum(lags) / len(lags):.1f}s, max {max(lags):.1f}s"
+                    )
+
+                # A full batch means more may be waiting; go again straight away
+                if len(lags) == batch_size:
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        stats = auctions.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Settled {stats['settled']} auctions "
+            f"({stats['with_winner']} with a winner, {stats['expired']} expired)"
+        ))
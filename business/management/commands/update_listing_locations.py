@@ -1,56 +1,15 @@
 # File location: business/management/commands/update_listing_locations.py
 
 from django.core.management.base import BaseCommand
+from business import geocoding
 from business.models import Listing
 from users.models import BusinessRegistration
-import requests
 import time
 
 
 class Command(BaseCommand):
     help = 'Update existing listings with location data from business registrations'
 
-    def geocode_address(self, address_string):
-        """Geocode an address string to lat/lng"""
-        if not address_string or not address_string.strip():
-            return None
-        
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': address_string,
-            'format': 'json',
-            'limit': 1,
-            'addressdetails': 1
-        }
-        headers = {
-            'User-Agent': 'LastBite-App/1.0'
-        }
-        
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=5)
-            data = response.json()
-            
-            if data and len(data) > 0:
-                result = data[0]
-                address_details = result.get('address', {})
-                
-                street_number = address_details.get('house_number', '')
-                street = address_details.get('road', '')
-                street_address = f"{street_number} {street}".strip() if street_number else street
-                
-                return {
-                    'latitude': float(result['lat']),
-                    'longitude': float(result['lon']),
-                    'address': street_address or address_details.get('street', ''),
-                    'city': address_details.get('city') or address_details.get('town') or address_details.get('village', ''),
-                    'state': address_details.get('state', ''),
-                    'zip_code': address_details.get('postcode', '')
-                }
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Geocoding error: {e}"))
-        
-        return None
-
     def handle(self, *args, **options):
         # Get all listings without location data
         listings_without_location = Listing.objects.filter(
@@ -81,7 +40,9 @@ class Command(BaseCommand):
                 self.stdout.write(f"Processing listing {listing.id}: {listing.title}")
                 self.stdout.write(f"  Business location: {business.address}")
                 
-                location_data = self.geocode_address(business.address)
+                misses_before = geocoding.stats()['misses']
+                location_data = geocoding.geocode_address(business.address)
+                hit_network = geocoding.stats()['misses'] > misses_before
                 
                 if location_data:
                     listing.latitude = location_data['latitude']
@@ -105,8 +66,10 @@ class Command(BaseCommand):
                     )
                     failed_count += 1
                 
-                # Be nice to Nominatim API - rate limit to 1 request per second
-                time.sleep(1)
+                # Be nice to Nominatim API - rate limit to 1 request per second.
+                # Cached addresses never reach Nominatim, so they skip the wait.
+                if hit_network:
+                    time.sleep(1)
                 
             except Exception as e:
                 self.stdout.write(
@@ -117,4 +80,5 @@ class Command(BaseCommand):
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS(f"✓ Successfully updated: {updated_count} listings"))
         self.stdout.write(self.style.ERROR(f"✗ Failed: {failed_count} listings"))
+        self.stdout.write(f"Geocode cache: {geocoding.stats()}")
         self.stdout.write("="*50)
\ No newline at end of file
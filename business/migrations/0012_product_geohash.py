@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:33
+
+from django.db import migrations, models
+
+from business.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Product = apps.get_model('business', 'Product')
+    products = Product.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    batch = []
+    for product in products.iterator(chunk_size=2000):
+        product.geohash = encode_geohash(product.latitude, product.longitude)
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0011_product_winning_bid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Geohash of latitude/longitude, kept in sync on save', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
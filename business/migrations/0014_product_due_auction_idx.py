@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0013_geocodecache_zipcodecentroid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('enable_bidding', True), ('status', 'listed'), ('winning_bid__isnull', True)), fields=['end_time'], name='business_pr_due_auction_idx'),
+        ),
+    ]
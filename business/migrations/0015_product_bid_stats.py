@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_bid_stats(apps, schema_editor):
+    Product = apps.get_model('business', 'Product')
+    Bid = apps.get_model('business', 'Bid')
+    top_bids = Bid.objects.filter(product=OuterRef('pk')).order_by('-amount', '-created_at')
+    bid_counts = (
+        Bid.objects.filter(product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Product.objects.filter(pk__in=Bid.objects.values('product')).update(
+        highest_bid=Subquery(top_bids.values('pk')[:1]),
+        highest_bid_amount=Subquery(top_bids.values('amount')[:1]),
+        bid_count=Coalesce(Subquery(bid_counts), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0014_product_due_auction_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='highest_bid',
+            field=models.ForeignKey(blank=True, help_text='Current leading bid', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='business.bid'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='highest_bid_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Amount of the current leading bid', max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
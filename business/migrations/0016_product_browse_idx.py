@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0015_product_bid_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('quantity__gt', 0), ('status', 'listed')), fields=['-created_at', '-id'], name='business_pr_browse_idx'),
+        ),
+    ]
@@ -1,13 +1,19 @@
 # File location: business/models.py 
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import ASin, Cast, Coalesce, Cos, Least, Power, Radians, Sin, Sqrt
 from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from market.models import Cart, CartItem
+from market.signals import cart_changed
 from users.models import CustomerProfile
+from . import geo
 import logging
+import math
 
 class Listing(models.Model):
     owner = models.ForeignKey(
@@ -18,6 +24,8 @@ class Listing(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     notes = models.TextField(blank=True)
     image = models.FileField(upload_to="listings/", blank=True, null=True)  
+    # Resized copies of image, filled in by a background job (business/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # Dynamic pricing fields
     min_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="Minimum bid price for barter bids")
@@ -89,6 +97,114 @@ class Listing(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class ProductQuerySet(models.QuerySet):
+
+    def browsable(self):
+        """Products a shopper can buy right now; served by business_pr_browse_idx."""
+        return self.filter(status='listed', quantity__gt=0)
+
+    def after_cursor(self, created_at, pk):
+        """
+        Keyset page boundary for the newest-first (created_at, id) ordering:
+        rows strictly after the given position, without an OFFSET scan.
+        """
+        return self.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    def within_bounding_box(self, lat, lng, radius_km):
+        """
+        Narrow to products inside the bounding box of a radius_km circle.
+        Uses the indexed geohash prefixes plus a lat/lng range so only
+        candidates near the point leave the database. Callers still need an
+        exact distance check for the corners of the box.
+        """
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius_km)
+
+        longitude_filter = Q()
+        for low, high in geo.longitude_ranges(min_lng, max_lng):
+            longitude_filter |= Q(longitude__range=(low, high))
+        qs = self.filter(
+            longitude_filter,
+            latitude__isnull=False,
+            longitude__isnull=False,
+            latitude__range=(min_lat, max_lat),
+        )
+
+        cells = geo.covering_cells(min_lat, max_lat, min_lng, max_lng)
+        if cells:
+            prefix_filter = Q()
+            for cell in cells:
+                prefix_filter |= Q(geohash__startswith=cell)
+            qs = qs.filter(prefix_filter)
+        return qs
+
+    def with_distance(self, lat, lng):
+        """
+        Annotate `distance` in km from the given point, computed in SQL with
+        the Haversine formula so it can be filtered, ordered and aggregated.
+        """
+        lat_rad = math.radians(float(lat))
+        lng_rad = math.radians(float(lng))
+        row_lat = Radians(Cast('latitude', FloatField()))
+        row_lng = Radians(Cast('longitude', FloatField()))
+
+        a = (
+            Power(Sin((row_lat - Value(lat_rad)) / Value(2.0)), 2)
+            + Value(math.cos(lat_rad)) * Cos(row_lat)
+            * Power(Sin((row_lng - Value(lng_rad)) / Value(2.0)), 2)
+        )
+        # Clamp for float rounding so ASIN never sees a value above 1
+        return self.annotate(
+            distance=Value(2.0 * geo.EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)))
+        )
+
+    def with_current_price(self, now=None):
+        """
+        Annotate `effective_price`: get_current_price() expressed as a SQL CASE
+        so lists can be filtered and ordered by the live price.
+        Discount tiers and the min_price floor must stay in step with
+        Product.get_current_price.
+        """
+        now = now or timezone.now()
+        price_field = models.DecimalField(max_digits=14, decimal_places=4)
+
+        def discounted(multiplier):
+            price = ExpressionWrapper(F('base_price') * Value(multiplier), output_field=price_field)
+            # Never go below min_price (NULL or 0 compare false, so no floor)
+            return Case(When(min_price__gt=price, then=F('min_price')), default=price, output_field=price_field)
+
+        return self.annotate(
+            effective_price=Case(
+                When(end_time__isnull=True, then=F('base_price')),
+                When(end_time__lte=now, then=F('base_price')),
+                When(end_time__lt=now + timedelta(minutes=30), then=discounted(Decimal('0.80'))),
+                When(end_time__lt=now + timedelta(minutes=60), then=discounted(Decimal('0.85'))),
+                default=discounted(Decimal('0.90')),
+                output_field=price_field,
+            )
+        )
+
+    def refresh_bid_stats(self):
+        """
+        Recompute highest_bid, highest_bid_amount and bid_count from the Bid
+        table in one UPDATE. Used to backfill or repair the denormalized columns,
+        and after a bid is edited or deleted.
+        """
+        # Ties go to the newest bid, as in Bid.save
+        top_bids = Bid.objects.filter(product=OuterRef('pk')).order_by('-amount', '-created_at', '-pk')
+        bid_counts = (
+            Bid.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return self.update(
+            highest_bid=Subquery(top_bids.values('pk')[:1]),
+            highest_bid_amount=Subquery(top_bids.values('amount')[:1]),
+            bid_count=Coalesce(Subquery(bid_counts), 0),
+        )
+
+
 class Product(models.Model):
     """
     Creating unifiied product model for items as we had listings here and bags in the market.
@@ -106,6 +222,8 @@ class Product(models.Model):
     title = models.CharField(max_length=120)
     description = models.TextField(blank=True)
     image = models.FileField(upload_to="products/", blank=True, null=True)
+    # Resized copies of image, filled in by a background job (business/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     notes = models.TextField(blank=True, help_text="Internal notes about the product.")
 
     # Pricing - Using decimal
@@ -163,6 +281,25 @@ class Product(models.Model):
         help_text="The winning bid for this product (set when bidding ends)"
     )
 
+    # Denormalized bid state, updated by Bid.save() in the same transaction
+    # as the bid insert so pages can show it without touching the Bid table
+    highest_bid = models.ForeignKey(
+        'Bid',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Current leading bid"
+    )
+    highest_bid_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Amount of the current leading bid"
+    )
+    bid_count = models.PositiveIntegerField(default=0)
+
     # Location
     address = models.CharField(max_length=255, blank=True)
     city = models.CharField(max_length=100, blank=True)
@@ -180,24 +317,59 @@ class Product(models.Model):
         null=True,
         blank=True,
     )
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Geohash of latitude/longitude, kept in sync on save"
+    )
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['owner', 'status']),
+            # Lets the settle_auctions worker find due auctions without a scan
+            models.Index(
+                fields=['end_time'],
+                name='business_pr_due_auction_idx',
+                condition=Q(enable_bidding=True, status='listed', winning_bid__isnull=True),
+            ),
+            # Keyset pagination of the market browse page, newest first
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='business_pr_browse_idx',
+                condition=Q(status='listed', quantity__gt=0),
+            ),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.owner.username})"
 
+    def save(self, *args, **kwargs):
+        # Keep the spatial index column in step with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"geohash"}
+
+        super().save(*args, **kwargs)
+
     def get_current_price(self):
         """
         Current price based on pricing_type and time.
         Returns base price if dynamic price is not configured.
+        Mirrored in SQL by ProductQuerySet.with_current_price; keep them in step.
         """
 
         if not self.end_time:
@@ -249,12 +421,11 @@ class Product(models.Model):
     
     def get_highest_bid(self):
         """Get the highest bid for this product"""
-        return self.bids.first()  # Since bids are ordered by -amount
-    
+        return self.highest_bid
+
     def get_highest_bid_amount(self):
         """Get the highest bid amount, or None if no bids"""
-        highest = self.get_highest_bid()
-        return highest.amount if highest else None
+        return self.highest_bid_amount
     
     def is_bidding_open(self):
         """Check if bidding is currently open for this product"""
@@ -264,108 +435,89 @@ class Product(models.Model):
             return False  # Bidding requires both min_price and end_time
         if not self.is_available():
             return False
-        
-        # Auto-process expiration if end_time has passed
-        now = timezone.now()
-        if now >= self.end_time:
-            # Process expiration automatically
-            self.process_expiration_if_needed()
+
+        # Settlement happens in the settle_auctions worker, never on read
+        if timezone.now() >= self.end_time:
             return False
-        
+
         return True
     
     def get_minimum_bid(self):
         """Get the minimum bid amount (highest bid + increment, or min_price)"""
-        highest = self.get_highest_bid_amount()
+        highest = self.highest_bid_amount
         if highest:
             # Minimum bid is highest bid + $0.50 increment
             return highest + Decimal('0.50')
         return self.min_price if self.min_price else self.base_price
 
-    def process_expiration_if_needed(self):
+    def is_awaiting_settlement(self):
+        """True once an auction's end_time has passed but the worker hasn't settled it yet"""
+        return bool(
+            self.enable_bidding
+            and self.end_time
+            and self.status == 'listed'
+            and self.winning_bid_id is None
+            and timezone.now() >= self.end_time
+        )
+
+    def settle_auction(self):
         """
-        Automatically process expiration and select winner if end_time has passed.
-        This is called automatically when checking bidding status or viewing products.
-        Returns True if processing occurred, False otherwise.
+        Select the winner (or expire the product) once end_time has passed.
+        Called by business.auctions.settle_due_auctions with the product row
+        locked; read paths never call this.
+        Returns True if a winner was selected, False otherwise.
         """
-        # Only process if bidding was enabled and end_time has passed
-        if not self.enable_bidding:
-            return False
-        
-        if not self.end_time:
-            return False
-        
-        now = timezone.now()
-        if now < self.end_time:
-            # Not expired yet
-            return False
-        
-        # Already processed if status is not 'listed' or winning_bid is set
-        if self.status != 'listed' or self.winning_bid:
+        if not self.is_awaiting_settlement():
             return False
-        
-        # Process expiration
+
         highest_bid = self.get_highest_bid()
-        
+
         if highest_bid:
             # Select winner
             self.winning_bid = highest_bid
             self.status = 'reserved'
             self.save(update_fields=['winning_bid', 'status'])
-        
+
             try:
-                # Get the winning bidder's customer profile
-                customer_profile = CustomerProfile.objects.get(user=highest_bid.bidder)
-                
-                # Get or create their cart
-                cart, created = Cart.objects.get_or_create(customer=customer_profile)
-                
-                # Check if item is already in cart
-                existing_item = CartItem.objects.filter(
-                    cart=cart,
-                    product=self
-                ).first()
-                
-                if existing_item:
-                    # Update quantity if already exists
-                    existing_item.quantity = 1  # or however you want to handle quantity
-                    existing_item.unit_price_cents = int(highest_bid.amount * 100)
-                    existing_item.save()
-                else:
-                    # Add new item to cart
-                    CartItem.objects.create(
+                # Savepoint so a cart failure doesn't abort the settlement batch
+                with transaction.atomic():
+                    # Get the winning bidder's customer profile
+                    customer_profile = CustomerProfile.objects.get(user=highest_bid.bidder)
+
+                    # Get or create their cart
+                    cart, created = Cart.objects.get_or_create(customer=customer_profile)
+
+                    # Update quantity if already in the cart, otherwise add it
+                    CartItem.objects.update_or_create(
                         cart=cart,
                         product=self,
-                        unit_price_cents=int(highest_bid.amount * 100),
-                        quantity=1
+                        defaults={
+                            'unit_price_cents': int(highest_bid.amount * 100),
+                            'quantity': 1,
+                        }
                     )
+                    cart_changed.send(sender=CartItem, customer_id=customer_profile.pk)
             except Exception as e:
                 # Log error but don't fail the expiration process
-                
                 logger = logging.getLogger(__name__)
                 logger.error(f"Failed to add winning bid to cart: {e}")
-            
+
             return True
 
-        else:
-            # No bids, mark as expired
-            self.status = 'expired'
-            self.save(update_fields=['status'])
-            return False
+        # No bids, mark as expired
+        self.status = 'expired'
+        self.save(update_fields=['status'])
+        return False
 
     def get_winning_bidder(self):
         """Get the winning bidder, if one exists"""
-        # Process expiration first if needed
-        self.process_expiration_if_needed()
-        if self.winning_bid:
+        if self.winning_bid_id:
             return self.winning_bid.bidder
         return None
 
     def has_winner(self):
         """Check if this product has a winning bid"""
-        self.process_expiration_if_needed()
-        return self.winning_bid is not None
-
+        return self.winning_bid_id is not None
 
 class Bid(models.Model):
     """
@@ -398,6 +550,39 @@ class Bid(models.Model):
     
     def __str__(self):
         return f"${self.amount} on {self.product.title} by {self.bidder.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                # Ties go to the newest bid, matching the -amount, -created_at ordering
+                takes_lead = Q(highest_bid_amount__isnull=True) | Q(highest_bid_amount__lte=self.amount)
+                Product.objects.filter(pk=self.product_id).update(
+                    bid_count=F('bid_count') + 1,
+                    highest_bid=Case(
+                        When(takes_lead, then=Value(self.pk)),
+                        default=F('highest_bid'),
+                        output_field=models.BigIntegerField(),
+                    ),
+                    highest_bid_amount=Case(
+                        When(takes_lead, then=Value(self.amount)),
+                        default=F('highest_bid_amount'),
+                        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+                    ),
+                )
+            else:
+                # An edit can lower the lead or move the bid to another product;
+                # recount from the Bid table rather than patch the columns
+                product_ids = {self.product_id, getattr(self, '_loaded_product_id', None)} - {None}
+                Product.objects.filter(pk__in=product_ids).refresh_bid_stats()
+            self._loaded_product_id = self.product_id
     
     def clean(self):
         """Validate bid amount"""
@@ -416,4 +601,94 @@ class Bid(models.Model):
         
         # Check if product is available
         if not self.product.is_available():
-            raise ValidationError("This product is no longer available for bidding")
\ No newline at end of file
+            raise ValidationError("This product is no longer available for bidding")
+
+class GeocodeCache(models.Model):
+    """
+    Persistent cache of geocoding results keyed by normalized query.
+    Rows with found=False are negative entries for queries that could not be
+    resolved, so they are not retried until they expire.
+    """
+    KIND_CHOICES = [
+        ("address", "Address"),
+        ("zip", "ZIP code"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    query = models.CharField(max_length=255, help_text="Normalized address or 5-digit ZIP")
+    found = models.BooleanField(default=True)
+
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    address = models.CharField(max_length=255, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=50, blank=True)
+    zip_code = models.CharField(max_length=10, blank=True)
+    display_name = models.CharField(max_length=512, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "query"], name="business_geocodecache_kind_query_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.query}"
+
+    def as_result(self):
+        """Return the cached lookup in the geocoding result dict shape, or None for negative entries."""
+        if not self.found:
+            return None
+        return {
+            'latitude': float(self.latitude),
+            'longitude': float(self.longitude),
+            'address': self.address,
+            'city': self.city,
+            'state': self.state,
+            'zip_code': self.zip_code,
+            'display_name': self.display_name,
+        }
+
+    @classmethod
+    def store(cls, kind, query, result, expires_at):
+        """Insert or refresh the cache row for (kind, query)."""
+        defaults = {"found": result is not None, "expires_at": expires_at}
+        if result:
+            defaults.update({
+                "latitude": round(result['latitude'], 6),
+                "longitude": round(result['longitude'], 6),
+                "address": (result.get('address') or '')[:255],
+                "city": (result.get('city') or '')[:100],
+                "state": (result.get('state') or '')[:50],
+                "zip_code": (result.get('zip_code') or '')[:10],
+                "display_name": (result.get('display_name') or '')[:512],
+            })
+        cls.objects.update_or_create(kind=kind, query=query, defaults=defaults)
+
+
+class ZipCodeCentroid(models.Model):
+    """
+    Offline ZIP code gazetteer, loaded with `manage.py import_zip_gazetteer`.
+    """
+    zip_code = models.CharField(max_length=5, primary_key=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=50, blank=True)
+
+    def __str__(self):
+        return self.zip_code
+
+    def as_result(self):
+        place = ", ".join(part for part in (self.city, self.state) if part)
+        return {
+            'latitude': float(self.latitude),
+            'longitude': float(self.longitude),
+            'address': '',
+            'city': self.city,
+            'state': self.state,
+            'zip_code': self.zip_code,
+            'display_name': f"{place} {self.zip_code}".strip(),
+        }
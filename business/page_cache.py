@@ -0,0 +1,118 @@
+# File location: business/page_cache.py
+
+"""
+Caching for the public business page (business.views.business_public).
+
+Entries are keyed on business id, page number and the owner's content
+version. The version is a token in the cache that business/signals.py
+replaces whenever the owner's products, bids or registration change, so
+stale entries are never read again and simply expire. Two layers:
+
+- `page_data`: the page's products, best sellers and product count, for
+  every visitor. The per-user parts of the page (owner and customer
+  buttons, CSRF tokens) are still rendered per request.
+- `get_html` / `set_html`: the whole rendered page, for anonymous
+  visitors only, since their page has nothing user-specific in it.
+
+Prices change tier with time rather than on a write, so entries also
+expire at the next tier boundary of any product they show.
+"""
+import time
+
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import transaction
+from django.utils import timezone
+
+from .live import next_price_change
+
+CACHE_TIMEOUT = 300
+PAGE_SIZE = 6
+BEST_SELLERS_COUNT = 5
+
+
+def version_key(owner_id):
+    return f"business:page:version:{owner_id}"
+
+
+def content_version(owner_id):
+    """The owner's current content version, starting one if there is none."""
+    key = version_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh token, not a counter, so a version lost to eviction can't
+        # come back and revive entries cached under it
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(owner_id):
+    """
+    Move owner_id's pages to a new version now and again once the current
+    transaction commits, so a read that lands mid-transaction can't cache
+    old content under the new version.
+    """
+    key = version_key(owner_id)
+    cache.set(key, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def _key(kind, business_id, page_number, version):
+    return f"business:page:{kind}:{business_id}:{page_number}:{version}"
+
+
+def _timeout(products, now=None):
+    """Seconds until the first tier change among products, capped at CACHE_TIMEOUT."""
+    now = now or timezone.now()
+    changes = [change for change in (next_price_change(p.end_time, now) for p in products) if change]
+    if not changes:
+        return CACHE_TIMEOUT
+    return min(CACHE_TIMEOUT, int((min(changes) - now).total_seconds()))
+
+
+def page_number(value):
+    """A positive page number from the ?page= parameter; anything else is page 1."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return 1
+    return number if number > 0 else 1
+
+
+def page_data(business_id, version, products, number):
+    """
+    (best_sellers, page_obj) for one page of products (a queryset of the
+    owner's listed products, newest first), from the cache when possible.
+    version is the owner's content_version, read before the queries run.
+    """
+    key = _key("data", business_id, number, version)
+    data = cache.get(key)
+    paginator = Paginator(products, PAGE_SIZE)
+    if data is None:
+        page_obj = paginator.get_page(number)
+        data = {
+            "best_sellers": list(products[:BEST_SELLERS_COUNT]),
+            "products": list(page_obj.object_list),
+            "number": page_obj.number,
+            "count": paginator.count,
+        }
+        timeout = _timeout(data["best_sellers"] + data["products"])
+        if timeout > 0:
+            cache.set(key, data, timeout)
+    else:
+        # Saves the COUNT query; Paginator.count is a cached_property
+        paginator.count = data["count"]
+    return data["best_sellers"], Page(data["products"], data["number"], paginator)
+
+
+def get_html(business_id, version, number):
+    """The anonymous visitor's rendered page, or None."""
+    return cache.get(_key("html", business_id, number, version))
+
+
+def set_html(business_id, version, number, html, products):
+    """Cache the anonymous page, which shows products, until one of them next changes price."""
+    timeout = _timeout(products)
+    if timeout > 0:
+        cache.set(_key("html", business_id, number, version), html, timeout)
@@ -0,0 +1,55 @@
+# File location: business/signals.py
+
+"""
+Keep the cached public business pages (business/page_cache.py), the
+resized image variants (business/images.py) and the products' bid columns
+in step with writes.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.models import BusinessRegistration
+from . import images, page_cache
+from .models import Bid, Listing, Product
+
+# Sent after product rows change through bulk paths that skip
+# post_save/post_delete (e.g. the stock UPDATE at checkout). Receivers get
+# owner_ids, the owners whose products changed.
+products_changed = Signal()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_saved(sender, instance, **kwargs):
+    page_cache.bump(instance.owner_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Listing)
+@receiver(post_save, sender=BusinessRegistration)
+def image_saved(sender, instance, **kwargs):
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Bid)
+def bid_deleted(sender, instance, **kwargs):
+    # Bid.save keeps the product's bid columns current on insert and edit;
+    # a delete has to recount them (a no-op when the product went too)
+    Product.objects.filter(pk=instance.product_id).refresh_bid_stats()
+
+
+@receiver([post_save, post_delete], sender=Bid)
+def bid_saved(sender, instance, **kwargs):
+    # Bid.save updates the product's bid columns with a plain UPDATE
+    page_cache.bump(instance.product.owner_id)
+
+
+@receiver([post_save, post_delete], sender=BusinessRegistration)
+def business_saved(sender, instance, **kwargs):
+    if instance.user_id:
+        page_cache.bump(instance.user_id)
+
+
+@receiver(products_changed)
+def bulk_products_changed(sender, owner_ids, **kwargs):
+    for owner_id in owner_ids:
+        page_cache.bump(owner_id)
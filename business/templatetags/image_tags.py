@@ -0,0 +1,32 @@
+# File location: business/templatetags/image_tags.py
+
+from django import template
+from django.utils.html import format_html
+
+from business import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(file, variants, sizes="100vw", css_class="", alt=""):
+    """
+    <picture> for an uploaded image: the WebP variants in a srcset, with the
+    JPEG thumbnail as the fallback <img>. Until the variants are built it's
+    a plain <img> of the original. Renders nothing without a file.
+
+        {% picture item.image item.image_variants sizes="80px" css_class="product-img rounded" %}
+    """
+    if not file:
+        return ""
+    img = format_html(
+        '<img src="{}" class="{}" alt="{}" loading="lazy" decoding="async">',
+        images.variant_url(file, variants), css_class, alt,
+    )
+    srcset = images.srcset(file, variants)
+    if not srcset:
+        return img
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">{}</picture>',
+        srcset, sizes, img,
+    )
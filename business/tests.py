@@ -0,0 +1,868 @@
+# business/tests.py
+
+import asyncio
+import io
+import math
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from dashboard.distance import calculate_distance
+from market.models import CartItem
+from users import roles
+from users.models import BusinessRegistration, CustomerProfile
+from . import auctions, geo, images, live, page_cache, views
+from .models import Bid, Product
+
+User = get_user_model()
+
+INCREMENT = Decimal("0.50")
+
+
+def make_auction(owner, **kwargs):
+    defaults = {
+        "owner": owner,
+        "title": "Sourdough",
+        "base_price": Decimal("10.00"),
+        "min_price": Decimal("5.00"),
+        "quantity": 1,
+        "status": "listed",
+        "enable_bidding": True,
+        "end_time": timezone.now() + timedelta(hours=2),
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class CurrentPriceAnnotationTests(TestCase):
+    """with_current_price must agree with Product.get_current_price."""
+
+    def test_annotation_matches_python_pricing(self):
+        owner = User.objects.create_user(username="baker")
+        now = timezone.now().replace(microsecond=0)
+        rng = random.Random(1234)
+
+        # Tier boundaries are hit exactly; the rest are random
+        offsets = [None, -60, 0, 1, 29 * 60, 30 * 60, 30 * 60 + 1, 59 * 60, 60 * 60, 60 * 60 + 1]
+        offsets += [rng.randint(-7200, 7200) for _ in range(60)]
+        for offset in offsets:
+            base = Decimal(rng.randint(1, 50000)) / 100
+            min_price = rng.choice([None, Decimal("0.00"), base * Decimal("0.95"), Decimal(rng.randint(0, 50000)) / 100])
+            make_auction(
+                owner,
+                base_price=base,
+                min_price=min_price.quantize(Decimal("0.01")) if min_price is not None else None,
+                end_time=None if offset is None else now + timedelta(seconds=offset),
+            )
+
+        with mock.patch("business.models.timezone.now", return_value=now):
+            products = list(Product.objects.with_current_price(now=now))
+            self.assertEqual(len(products), len(offsets))
+            for product in products:
+                self.assertEqual(
+                    product.effective_price.quantize(Decimal("0.01")),
+                    product.get_current_price().quantize(Decimal("0.01")),
+                    (product.base_price, product.min_price, product.end_time),
+                )
+
+
+def destination(lat, lng, bearing, distance_km):
+    """The point distance_km from (lat, lng) along bearing (degrees from north)."""
+    lat, lng, bearing = math.radians(lat), math.radians(lng), math.radians(bearing)
+    angle = distance_km / geo.EARTH_RADIUS_KM
+    dest_lat = math.asin(math.sin(lat) * math.cos(angle) + math.cos(lat) * math.sin(angle) * math.cos(bearing))
+    dest_lng = lng + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat),
+        math.cos(angle) - math.sin(lat) * math.sin(dest_lat),
+    )
+    return math.degrees(dest_lat), math.degrees(dest_lng)
+
+
+class GeoTests(TestCase):
+    """Geohash encoding and the bounding-box prefilter for nearby searches."""
+
+    CHICAGO = (41.8781, -87.6298)
+
+    def test_encode_geohash_matches_known_values(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, precision=11), "u4pruydqqvj")
+        self.assertEqual(geo.encode_geohash(42.6, -5.6, precision=5), "ezs42")
+        self.assertEqual(geo.encode_geohash(0, 0, precision=5), "s0000")
+        self.assertEqual(geo.encode_geohash(Decimal("57.649110"), Decimal("10.407440")), "u4pruyd")
+
+    def test_bounding_box_reaches_the_radius(self):
+        lat, lng = self.CHICAGO
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, 10)
+
+        # One degree of latitude is 111.195 km on a 6371 km sphere
+        self.assertAlmostEqual(max_lat - lat, 10 / 111.195, places=4)
+        self.assertAlmostEqual(lat - min_lat, 10 / 111.195, places=4)
+        self.assertAlmostEqual(calculate_distance(lat, lng, max_lat, lng), 10, places=6)
+        # Every point of the circle is inside the box
+        for bearing in range(0, 360, 5):
+            point_lat, point_lng = destination(lat, lng, bearing, 10)
+            self.assertTrue(min_lat <= point_lat <= max_lat and min_lng <= point_lng <= max_lng, bearing)
+
+    def test_bounding_box_near_a_pole_spans_every_longitude(self):
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(89.95, 10, 20)
+        self.assertEqual((max_lat, min_lng, max_lng), (90.0, -180.0, 180.0))
+
+    def test_bounding_box_wraps_the_antimeridian(self):
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(0, 179.95, 20)
+
+        self.assertGreater(min_lng, max_lng)
+        self.assertAlmostEqual(max_lng, -179.87, places=2)
+        self.assertEqual(geo.longitude_ranges(min_lng, max_lng), [(min_lng, 180.0), (-180.0, max_lng)])
+
+        cells = geo.covering_cells(min_lat, max_lat, min_lng, max_lng)
+        for point in ((0.1, 179.9), (-0.1, -179.9), (0, 180), (0, -180)):
+            self.assertTrue(any(geo.encode_geohash(*point).startswith(cell) for cell in cells), point)
+
+    def test_covering_cells_cover_every_point_in_the_box(self):
+        box = geo.bounding_box(*self.CHICAGO, 10)
+        cells = geo.covering_cells(*box)
+        self.assertLessEqual(len(cells), geo.MAX_COVERING_CELLS)
+
+        rng = random.Random(42)
+        for _ in range(200):
+            point = (rng.uniform(box[0], box[1]), rng.uniform(box[2], box[3]))
+            self.assertTrue(any(geo.encode_geohash(*point).startswith(cell) for cell in cells), point)
+
+        # Too big for the cell budget even at the coarsest precision
+        self.assertEqual(geo.covering_cells(-80, 80, -170, 170, max_cells=4), set())
+
+    def test_nearby_lookup_finds_products_across_the_antimeridian(self):
+        owner = User.objects.create_user(username="baker")
+        east = make_auction(owner, latitude=Decimal("0.010000"), longitude=Decimal("-179.990000"))
+        west = make_auction(owner, latitude=Decimal("0.010000"), longitude=Decimal("179.990000"))
+        make_auction(owner, latitude=Decimal("0.010000"), longitude=Decimal("179.000000"))
+
+        found = Product.objects.within_bounding_box(0, 179.995, 10)
+        self.assertEqual(set(found), {east, west})
+
+
+class PlaceBidJsonTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.bidder = User.objects.create_user(username="shopper")
+        self.product = make_auction(self.owner)
+        self.url = reverse("business:place_bid_json", args=[self.product.pk])
+        self.client.force_login(self.bidder)
+
+    def test_accepts_bid_and_returns_new_leader(self):
+        response = self.client.post(self.url, {"amount": "5.00"})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["highest_bid_amount"], "5.00")
+        self.assertEqual(data["minimum_bid"], "5.50")
+        self.assertEqual(data["bid_count"], 1)
+
+    def test_accepts_json_body(self):
+        response = self.client.post(self.url, {"amount": 6}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bid"]["amount"], "6.00")
+
+    def test_rejects_bid_below_minimum(self):
+        self.client.post(self.url, {"amount": "5.00"})
+        response = self.client.post(self.url, {"amount": "5.25"})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Bid.objects.filter(product=self.product).count(), 1)
+
+    def test_rejects_owner_and_closed_auctions(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.post(self.url, {"amount": "9.00"}).status_code, 409)
+
+        Product.objects.filter(pk=self.product.pk).update(end_time=timezone.now() - timedelta(minutes=1))
+        self.client.force_login(self.bidder)
+        self.assertEqual(self.client.post(self.url, {"amount": "9.00"}).status_code, 409)
+
+    def test_rejects_malformed_amount(self):
+        for amount in ("", "abc", "NaN", "-1", "1e12"):
+            response = self.client.post(self.url, {"amount": amount})
+            self.assertEqual(response.status_code, 400, amount)
+
+
+class BidStatsTests(TestCase):
+    """The denormalized highest_bid / highest_bid_amount / bid_count columns."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.alice = User.objects.create_user(username="alice")
+        self.bob = User.objects.create_user(username="bob")
+        self.product = make_auction(self.owner)
+
+    def bid(self, bidder, amount, product=None):
+        return Bid.objects.create(product=product or self.product, bidder=bidder, amount=Decimal(amount))
+
+    def assertStats(self, product, leader, count):
+        product.refresh_from_db()
+        self.assertEqual(product.bid_count, count)
+        self.assertEqual(product.highest_bid_id, leader.pk if leader else None)
+        self.assertEqual(product.highest_bid_amount, leader.amount if leader else None)
+
+    def test_sequential_bids(self):
+        first = self.bid(self.alice, "5.00")
+        self.assertStats(self.product, first, 1)
+        second = self.bid(self.bob, "7.00")
+        self.assertStats(self.product, second, 2)
+        self.bid(self.alice, "6.00")
+        self.assertStats(self.product, second, 3)
+
+    def test_ties_go_to_the_newest_bid(self):
+        self.bid(self.alice, "5.00")
+        tie = self.bid(self.bob, "5.00")
+        self.assertStats(self.product, tie, 2)
+
+        # A recount picks the same leader
+        Product.objects.filter(pk=self.product.pk).refresh_bid_stats()
+        self.assertStats(self.product, tie, 2)
+
+    def test_deleting_bids_recounts(self):
+        first = self.bid(self.alice, "5.00")
+        second = self.bid(self.bob, "7.00")
+        third = self.bid(self.alice, "6.00")
+
+        second.delete()
+        self.assertStats(self.product, third, 2)
+        first.delete()
+        self.assertStats(self.product, third, 1)
+        Bid.objects.filter(product=self.product).delete()
+        self.assertStats(self.product, None, 0)
+
+    def test_editing_bids_recounts(self):
+        first = self.bid(self.alice, "5.00")
+        second = self.bid(self.bob, "7.00")
+
+        second.amount = Decimal("4.00")
+        second.save()
+        self.assertStats(self.product, first, 2)
+
+        other = make_auction(self.owner, title="Rye")
+        first = Bid.objects.get(pk=first.pk)
+        first.product = other
+        first.save()
+        self.assertStats(self.product, second, 1)
+        self.assertStats(other, first, 1)
+
+    def test_backfill_command_matches_the_bid_table(self):
+        other = make_auction(self.owner, title="Rye")
+        self.bid(self.alice, "5.00")
+        leader = self.bid(self.bob, "8.00")
+        self.bid(self.alice, "6.00", product=other)
+        other_leader = self.bid(self.bob, "6.50", product=other)
+        untouched = make_auction(self.owner, title="Bagels")
+        Product.objects.update(highest_bid=None, highest_bid_amount=Decimal("99.00"), bid_count=42)
+
+        out = io.StringIO()
+        call_command("backfill_bid_stats", batch_size=1, stdout=out)
+
+        self.assertIn("Refreshed bid stats on 3 products", out.getvalue())
+        self.assertStats(self.product, leader, 2)
+        self.assertStats(other, other_leader, 2)
+        self.assertStats(untouched, None, 0)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentBidTests(TransactionTestCase):
+    """Needs a database with row locks (PostgreSQL); skipped on SQLite."""
+
+    BIDDERS = 20
+    ATTEMPTS = 300
+
+    def test_parallel_bids_form_a_strict_ladder(self):
+        owner = User.objects.create_user(username="baker")
+        bidders = [User.objects.create_user(username=f"bidder{i}") for i in range(self.BIDDERS)]
+        product = make_auction(owner)
+        start = threading.Barrier(8)
+
+        def attempt(index):
+            try:
+                if index < 8:
+                    start.wait()
+                # Everyone bids what they last saw as the minimum, so most
+                # attempts race against a bid that lands first
+                current = Product.objects.get(pk=product.pk)
+                try:
+                    auctions.place_bid(product.pk, bidders[index % self.BIDDERS], current.get_minimum_bid())
+                    return True
+                except ValidationError:
+                    return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            accepted = sum(pool.map(attempt, range(self.ATTEMPTS)))
+
+        amounts = list(
+            Bid.objects.filter(product=product).order_by("id").values_list("amount", flat=True)
+        )
+        self.assertEqual(len(amounts), accepted)
+        self.assertGreater(accepted, 1)
+        for previous, current in zip(amounts, amounts[1:]):
+            self.assertGreaterEqual(current, previous + INCREMENT)
+
+        product.refresh_from_db()
+        self.assertEqual(product.bid_count, accepted)
+        self.assertEqual(product.highest_bid_amount, amounts[-1])
+        self.assertEqual(product.highest_bid_id, Bid.objects.filter(product=product).latest("id").id)
+
+
+class SettleAuctionTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.bidder = User.objects.create_user(username="shopper")
+        self.profile = CustomerProfile.objects.create(user=self.bidder)
+
+    def ended(self, minutes_ago, **kwargs):
+        product = make_auction(self.owner, **kwargs)
+        Product.objects.filter(pk=product.pk).update(end_time=timezone.now() - timedelta(minutes=minutes_ago))
+        return product
+
+    def test_settles_due_auctions_in_batches_oldest_first(self):
+        newest, oldest, middle = self.ended(1), self.ended(30), self.ended(10)
+        running = make_auction(self.owner)
+        before = auctions.stats()
+
+        lags = auctions.settle_due_auctions(batch_size=2)
+        self.assertEqual(len(lags), 2)
+        self.assertGreaterEqual(lags[0], 30 * 60)
+        self.assertEqual(
+            set(Product.objects.filter(status="expired").values_list("pk", flat=True)), {oldest.pk, middle.pk}
+        )
+
+        self.assertEqual(len(auctions.settle_due_auctions(batch_size=2)), 1)
+        self.assertEqual(auctions.settle_due_auctions(batch_size=2), [])
+        newest.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((newest.status, running.status), ("expired", "listed"))
+        after = auctions.stats()
+        self.assertEqual(after["settled"] - before["settled"], 3)
+        self.assertEqual(after["batches"] - before["batches"], 2)
+
+    def test_winner_gets_the_product_in_their_cart(self):
+        product = make_auction(self.owner)
+        bid, _ = auctions.place_bid(product.pk, self.bidder, Decimal("7.50"))
+        Product.objects.filter(pk=product.pk).update(end_time=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(len(auctions.settle_due_auctions()), 1)
+
+        product.refresh_from_db()
+        self.assertEqual(product.status, "reserved")
+        self.assertEqual(product.winning_bid_id, bid.pk)
+        item = CartItem.objects.get(cart__customer=self.profile, product=product)
+        self.assertEqual((item.quantity, item.unit_price_cents), (1, 750))
+
+    def test_auction_without_bids_expires(self):
+        product = self.ended(5)
+
+        auctions.settle_due_auctions()
+
+        product.refresh_from_db()
+        self.assertEqual(product.status, "expired")
+        self.assertIsNone(product.winning_bid_id)
+        self.assertFalse(CartItem.objects.filter(product=product).exists())
+
+    def test_read_paths_leave_settlement_to_the_worker(self):
+        BusinessRegistration.objects.create(
+            user=self.owner, name="Corner Bakery", business_type="bakery", address="1 Main St, Chicago, IL",
+            phone_number="3125550100", email="baker@example.com", owner_name="Baker",
+        )
+        product = make_auction(self.owner)
+        auctions.place_bid(product.pk, self.bidder, Decimal("6.00"))
+        Product.objects.filter(pk=product.pk).update(end_time=timezone.now() - timedelta(minutes=1))
+        self.client.force_login(self.bidder)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("business:product_detail_public", args=[product.pk]))
+            self.client.get(reverse("business:my_bids"))
+        self.assertContains(response, "Bidding has ended")
+
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("UPDATE", "INSERT", "DELETE"))]
+        self.assertEqual(writes, [])
+        product.refresh_from_db()
+        self.assertTrue(product.is_awaiting_settlement())
+
+    def test_backlog_counts_due_auctions_and_oldest_lag(self):
+        self.assertEqual(auctions.backlog(), {"due": 0, "oldest_lag_seconds": 0})
+        self.ended(30)
+        self.ended(5)
+        make_auction(self.owner)
+
+        backlog = auctions.backlog()
+        self.assertEqual(backlog["due"], 2)
+        self.assertAlmostEqual(backlog["oldest_lag_seconds"], 30 * 60, delta=5)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentSettleTests(TransactionTestCase):
+    """Needs a database with row locks (PostgreSQL); skipped on SQLite."""
+
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        owner = User.objects.create_user(username="baker")
+        products = [make_auction(owner, title=f"Loaf {i}") for i in range(3)]
+        Product.objects.update(end_time=timezone.now() - timedelta(minutes=1))
+        locked, released = threading.Event(), threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    Product.objects.select_for_update().get(pk=products[0].pk)
+                    locked.set()
+                    released.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            started = time.monotonic()
+            lags = auctions.settle_due_auctions()
+            self.assertLess(time.monotonic() - started, 5, "waited on the locked row")
+        finally:
+            released.set()
+            thread.join()
+
+        self.assertEqual(len(lags), 2)
+        statuses = dict(Product.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[products[0].pk], "listed")
+        self.assertEqual({statuses[p.pk] for p in products[1:]}, {"expired"})
+        # The next run picks up what was skipped
+        self.assertEqual(len(auctions.settle_due_auctions()), 1)
+
+
+@override_settings(LIVE_UPDATES_BACKEND="local")
+class LiveUpdatesTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.bidder = User.objects.create_user(username="shopper")
+        self.product = make_auction(self.owner)
+
+    def test_price_tier_boundaries(self):
+        end = timezone.now()
+        self.assertEqual(live.next_price_change(end, end - timedelta(hours=2)), end - timedelta(minutes=60))
+        self.assertEqual(live.next_price_change(end, end - timedelta(minutes=60)), end - timedelta(minutes=30))
+        self.assertEqual(live.next_price_change(end, end - timedelta(minutes=10)), end)
+        self.assertIsNone(live.next_price_change(end, end))
+        self.assertIsNone(live.next_price_change(None, end))
+
+    def test_bids_reach_product_and_business_subscribers_on_commit(self):
+        product_sub = live.subscribe(live.product_key(self.product.pk))
+        owner_sub = live.subscribe(live.owner_key(self.owner.pk))
+        self.addCleanup(product_sub.close)
+        self.addCleanup(owner_sub.close)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            auctions.place_bid(self.product.pk, self.bidder, Decimal("6.00"))
+            self.assertIsNone(product_sub.get(timeout=0))
+
+        for subscription in (product_sub, owner_sub):
+            message = subscription.get(timeout=0)
+            self.assertEqual(message["event"], "bid")
+            self.assertEqual(message["data"]["highest_bid_amount"], "6.00")
+            self.assertEqual(message["data"]["minimum_bid"], "6.50")
+
+    def test_product_stream(self):
+        # RequestFactory rather than the test client, which wraps streaming
+        # responses in its own connection handling
+        request = RequestFactory().get(reverse("business:product_events", args=[self.product.pk]))
+        response = views.product_events(request, self.product.pk)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = iter(response.streaming_content)
+
+        self.assertTrue(next(events).startswith(b"retry:"))
+        self.assertIn(b'"current_price": "9.00"', next(events))
+        self.assertEqual(live.stats()["subscriptions"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            auctions.place_bid(self.product.pk, self.bidder, Decimal("7.00"))
+        chunk = next(events)
+        self.assertTrue(chunk.startswith(b"event: bid"), chunk)
+
+        # Closing fires request_finished; keep it from closing the test's connection
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertEqual(live.stats()["subscriptions"], 0)
+
+    @override_settings(LIVE_THREAD_STREAMS=1)
+    def test_thread_streams_past_the_cap_are_turned_away(self):
+        url = reverse("business:product_events", args=[self.product.pk])
+        first = views.product_events(RequestFactory().get(url), self.product.pk)
+        next(iter(first.streaming_content))
+
+        busy = views.product_events(RequestFactory().get(url), self.product.pk)
+        self.assertEqual(busy.status_code, 503)
+        self.assertEqual(busy["Retry-After"], str(live.BUSY_RETRY_SECONDS))
+        self.assertTrue(busy.content.startswith(b"retry: "))
+
+        request_finished.disconnect(close_old_connections)
+        try:
+            first.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        # Closing the first stream frees its slot
+        second = views.product_events(RequestFactory().get(url), self.product.pk)
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(next(iter(second.streaming_content)).startswith(b"retry:"))
+        request_finished.disconnect(close_old_connections)
+        try:
+            second.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertEqual(live.stats()["subscriptions"], 0)
+
+    def test_stream_pushes_price_tier_change(self):
+        product = make_auction(self.owner, end_time=timezone.now() + timedelta(minutes=60, seconds=0.3))
+        subscription = live.subscribe(live.product_key(product.pk))
+        events = live.stream(subscription, [product])
+
+        next(events)  # retry
+        started = time.monotonic()
+        chunk = next(events)
+
+        self.assertTrue(chunk.startswith("event: price"), chunk)
+        self.assertIn('"current_price": "8.50"', chunk)
+        self.assertLess(time.monotonic() - started, 5)
+        events.close()
+
+    def test_async_stream_delivers_messages_and_price_tiers(self):
+        product = make_auction(self.owner, end_time=timezone.now() + timedelta(minutes=60, seconds=0.3))
+
+        async def read():
+            events = live.astream([live.product_key(product.pk)], [product], snapshot=True)
+            chunks = [await anext(events), await anext(events)]  # retry, snapshot
+            # Published from another thread, as the listener thread would
+            await asyncio.to_thread(live.publish, "bid", {"bid_count": 1}, product_id=product.pk)
+            chunks.append(await anext(events))
+            chunks.append(await anext(events))
+            await events.aclose()
+            return chunks
+
+        chunks = asyncio.run(read())
+
+        self.assertTrue(chunks[1].startswith("event: snapshot"), chunks[1])
+        self.assertTrue(chunks[2].startswith("event: bid"), chunks[2])
+        self.assertTrue(chunks[3].startswith("event: price"), chunks[3])
+        self.assertEqual(live.stats()["subscriptions"], 0)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Needs PostgreSQL LISTEN/NOTIFY")
+@override_settings(LIVE_UPDATES_BACKEND="postgres")
+class PostgresLiveUpdatesTests(TransactionTestCase):
+
+    def test_notify_reaches_listener(self):
+        owner = User.objects.create_user(username="baker")
+        bidder = User.objects.create_user(username="shopper")
+        product = make_auction(owner)
+        subscription = live.subscribe(live.product_key(product.pk))
+        self.addCleanup(live.stop)
+        self.addCleanup(subscription.close)
+
+        # The listener thread connects asynchronously; ping until it's up
+        deadline = time.monotonic() + 10
+        while subscription.get(timeout=0.2) is None:
+            self.assertLess(time.monotonic(), deadline, "listener never came up")
+            live.publish("ping", {}, product_id=product.pk)
+
+        auctions.place_bid(product.pk, bidder, Decimal("6.00"))
+        while True:
+            message = subscription.get(timeout=5)
+            self.assertIsNotNone(message)
+            if message["event"] == "bid":
+                break
+        self.assertEqual(message["data"]["bid_count"], 1)
+
+
+class BusinessPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="baker")
+        self.business = BusinessRegistration.objects.create(
+            user=self.owner,
+            name="Corner Bakery",
+            business_type="bakery",
+            address="1 Main St, Chicago, IL",
+            phone_number="3125550100",
+            email="baker@example.com",
+            owner_name="Baker",
+        )
+        self.product = make_auction(self.owner)
+        self.url = reverse("business:business_public", args=[self.business.pk])
+
+    def test_anonymous_page_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertContains(first, "Sourdough")
+        self.assertNotContains(first, 'name="csrfmiddlewaretoken"')
+
+        # Only the business lookup; products, count and rendering are cached
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+
+    def test_product_change_moves_to_new_version(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = "Rye"
+            self.product.save()
+
+        self.assertContains(self.client.get(self.url), "Rye")
+
+    def test_bid_moves_to_new_version(self):
+        bidder = User.objects.create_user(username="shopper")
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            auctions.place_bid(self.product.pk, bidder, Decimal("7.25"))
+
+        self.assertContains(self.client.get(self.url), "7.25")
+
+    def test_logged_in_page_keeps_per_user_parts(self):
+        customer = User.objects.create_user(username="shopper")
+        self.client.get(self.url)
+        self.client.force_login(customer)
+
+        response = self.client.get(self.url)
+
+        self.assertContains(response, "Buy Now")
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_registration_without_user_renders_empty_page(self):
+        self.business.user = None
+        self.business.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Corner Bakery")
+        self.assertNotContains(response, "Sourdough")
+
+    def test_entries_expire_at_next_price_tier(self):
+        self.product.end_time = timezone.now() + timedelta(minutes=61)
+        self.assertAlmostEqual(page_cache._timeout([self.product]), 60, delta=2)
+        self.product.end_time = None
+        self.assertEqual(page_cache._timeout([self.product]), page_cache.CACHE_TIMEOUT)
+
+
+class RoleCacheTests(TestCase):
+
+    def setUp(self):
+        # Group names are only cached across requests in a cache every process shares
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.enterContext(override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        }))
+        self.group = Group.objects.create(name="BUSINESS")
+        self.user = User.objects.create_user(username="baker")
+
+    def fresh(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_group_names_are_memoized_and_cached(self):
+        user = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertFalse(views.is_business(user))
+            self.assertTrue(roles.is_customer(user))
+        # A later request loads a new user object but hits the cache
+        user = self.fresh()
+        with self.assertNumQueries(0):
+            self.assertFalse(views.is_business(user))
+
+    def test_per_process_cache_is_only_used_within_a_request(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertFalse(roles.cache_is_shared())
+            user = self.fresh()
+            with self.assertNumQueries(1):
+                self.assertFalse(roles.is_business(user))
+                self.assertFalse(roles.is_business(user))
+
+            # A change no invalidation here hears of, as if made in another worker
+            User.groups.through.objects.create(user=self.user, group=self.group)
+            self.assertTrue(roles.is_business(self.fresh()))
+
+    def test_membership_changes_invalidate(self):
+        self.assertFalse(roles.is_business(self.fresh()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertTrue(roles.is_business(self.user))
+        self.assertTrue(roles.is_business(self.fresh()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(roles.is_business(self.fresh()))
+
+        self.group.user_set.add(self.user)
+        self.assertTrue(roles.is_business(self.fresh()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.clear()
+        self.assertFalse(roles.is_business(self.fresh()))
+
+    def test_group_rename_and_delete_invalidate(self):
+        self.user.groups.add(self.group)
+        self.assertTrue(roles.is_business(self.fresh()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.name = "FORMER-BUSINESS"
+            self.group.save()
+        self.assertFalse(roles.is_business(self.fresh()))
+
+        self.group.name = "BUSINESS"
+        self.group.save()
+        self.assertTrue(roles.is_business(self.fresh()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertFalse(roles.is_business(self.fresh()))
+
+    def test_business_views_skip_the_group_query_once_cached(self):
+        self.user.groups.add(self.group)
+        self.client.force_login(self.user)
+        url = reverse("business:product_list")
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            # session, user and the product page; no auth_group lookup
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+def make_upload(name="photo.jpg", size=(1600, 1200)):
+    # Noise, so the JPEG is about as heavy as a real photo
+    image = Image.frombytes("RGB", size, random.Random(7).randbytes(size[0] * size[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class ImageVariantTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.owner = User.objects.create_user(username="baker")
+        self.business = BusinessRegistration.objects.create(
+            user=self.owner,
+            name="Corner Bakery",
+            business_type="bakery",
+            address="1 Main St, Chicago, IL",
+            phone_number="3125550100",
+            email="baker@example.com",
+            owner_name="Baker",
+        )
+
+    def build(self, product):
+        self.assertTrue(images.build_variants("business.Product", product.pk))
+        product.refresh_from_db()
+        return product.image_variants
+
+    def test_upload_schedules_variants_after_commit(self):
+        with mock.patch.object(images.threading, "Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = make_auction(self.owner, image=make_upload())
+        thread.assert_called_once_with(
+            target=images._build_in_thread, args=("business.Product", product.pk), daemon=True
+        )
+
+        # Saving again without a new file doesn't rebuild
+        variants = self.build(product)
+        with mock.patch.object(images.threading, "Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save()
+        thread.assert_not_called()
+        self.assertEqual(variants["source"], product.image.name)
+
+    def test_variants_are_small_webp_with_a_jpeg_thumbnail(self):
+        product = make_auction(self.owner, image=make_upload())
+        variants = self.build(product)
+
+        self.assertEqual([width for width, _ in variants["webp"]], list(images.WIDTHS))
+        with default_storage.open(variants["thumb"]) as f:
+            self.assertEqual(Image.open(f).size, (images.THUMB_WIDTH, 240))
+        original = default_storage.size(product.image.name)
+        for width, name in variants["webp"]:
+            with default_storage.open(name) as f:
+                self.assertEqual(Image.open(f).format, "WEBP")
+            self.assertLess(default_storage.size(name) * 5, original)
+
+        response = self.client.get(reverse("business:business_public", args=[self.business.pk]))
+        self.assertContains(response, '<source type="image/webp" srcset="')
+        self.assertContains(response, default_storage.url(variants["thumb"]))
+        self.assertNotContains(response, product.image.url)
+
+    def test_small_images_are_not_scaled_up(self):
+        product = make_auction(self.owner, image=make_upload(size=(200, 100)))
+        variants = self.build(product)
+        self.assertEqual([width for width, _ in variants["webp"]], [160, 200])
+
+    def test_replacing_or_removing_the_image_cleans_up(self):
+        product = make_auction(self.owner, image=make_upload())
+        first = self.build(product)
+
+        product.image = make_upload("other.jpg")
+        product.save()
+        second = self.build(product)
+        self.assertEqual(second["source"], product.image.name)
+        self.assertFalse(default_storage.exists(first["thumb"]))
+        self.assertTrue(default_storage.exists(second["thumb"]))
+
+        product.image = None
+        product.save()
+        self.assertEqual(self.build(product), {})
+        self.assertFalse(default_storage.exists(second["thumb"]))
+
+    def test_a_newer_upload_wins_over_an_older_build(self):
+        product = make_auction(self.owner, image=make_upload())
+        render = images.render
+
+        def upload_meanwhile(source):
+            newer = default_storage.save("products/newer.jpg", make_upload("newer.jpg"))
+            Product.objects.filter(pk=product.pk).update(image=newer)
+            return render(source)
+
+        with mock.patch.object(images, "render", side_effect=upload_meanwhile):
+            self.assertFalse(images.build_variants("business.Product", product.pk))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+        self.assertEqual(default_storage.listdir(f"{images.VARIANTS_DIR}/products")[1], [])
+
+    def test_unreadable_files_keep_the_original(self):
+        product = make_auction(
+            self.owner, image=SimpleUploadedFile("menu.jpg", b"not an image", content_type="image/jpeg")
+        )
+        with self.assertLogs("business.images", "WARNING"):
+            self.assertEqual(self.build(product), {"source": product.image.name})
+
+        response = self.client.get(reverse("business:business_public", args=[self.business.pk]))
+        self.assertContains(response, f'src="{product.image.url}"')
+        self.assertNotContains(response, "image/webp")
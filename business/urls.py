@@ -23,6 +23,9 @@ urlpatterns = [
     path("public/<int:business_id>/delete-logo/", views.delete_business_logo, name="delete_business_logo"),
     path("products/<int:pk>/public/", views.product_detail_public, name="product_detail_public"),
     path("products/<int:product_id>/bid/", views.place_bid, name="place_bid"),
+    path("products/<int:product_id>/bid.json", views.place_bid_json, name="place_bid_json"),
+    path("products/<int:product_id>/events/", views.product_events, name="product_events"),
+    path("public/<int:business_id>/events/", views.business_events, name="business_events"),
     path("my-bids/", views.my_bids, name="my_bids"),
 
 ]
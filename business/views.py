@@ -5,81 +5,53 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
+from market import reservations
+from market.models import Cart
+from users import roles
 from users.models import BusinessRegistration
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.utils.http import url_has_allowed_host_and_scheme
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.db import connection
+from django.views.decorators.http import require_GET
 
+from . import auctions, live, page_cache
 from .forms import ListingForm, ProductForm, BidForm
+from .geocoding import schedule_business_geocode
 from .models import Listing, Product, Bid
-from django.db.models import Prefetch
 from django.contrib import messages
-import requests
+from django.core.exceptions import ValidationError
+from decimal import Decimal, InvalidOperation
+import json
 
-def is_business(u):
-    return u.is_authenticated and u.groups.filter(name="BUSINESS").exists()
+# Bid.amount is max_digits=10, decimal_places=2
+MAX_BID_AMOUNT = Decimal("100000000")
 
+# Products a business page stream watches for price-tier changes
+LIVE_PRODUCTS_LIMIT = 200
 
-def geocode_address(address_string):
-    """
-    Geocode an address string to lat/lng using Nominatim (OpenStreetMap)
-    Returns: dict with 'latitude', 'longitude', 'address', 'city', 'state', 'zip_code'
-    """
-    if not address_string or not address_string.strip():
-        return None
-    
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        'q': address_string,
-        'format': 'json',
-        'limit': 1,
-        'addressdetails': 1
-    }
-    headers = {
-        'User-Agent': 'LastBite-App/1.0'
-    }
-    
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        data = response.json()
-        
-        if data and len(data) > 0:
-            result = data[0]
-            address_details = result.get('address', {})
-            
-            # Extract address components
-            street_number = address_details.get('house_number', '')
-            street = address_details.get('road', '')
-            street_address = f"{street_number} {street}".strip() if street_number else street
-            
-            return {
-                'latitude': float(result['lat']),
-                'longitude': float(result['lon']),
-                'address': street_address or address_details.get('street', ''),
-                'city': address_details.get('city') or address_details.get('town') or address_details.get('village', ''),
-                'state': address_details.get('state', ''),
-                'zip_code': address_details.get('postcode', '')
-            }
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-    
-    return None
+
+def is_business(u):
+    return roles.is_business(u)
 
 
 def get_business_location(user):
     """
-    Get location data from user's business registration
-    Returns geocoded location dict or None
+    Get location data stored on the user's business registration.
+    Returns a location dict, or None while the address is still being geocoded.
     """
-    try:
-        business = BusinessRegistration.objects.filter(user=user).first()
-        if business and business.address:  # CHANGED: using 'address' field
-            return geocode_address(business.address)
-    except Exception as e:
-        print(f"Error getting business location: {e}")
-    
-    return None
+    business = BusinessRegistration.objects.filter(user=user).first()
+    if business is None:
+        return None
+
+    location = business.location()
+    if location is None and business.address and business.geocoded_at is None:
+        # Registration predates stored coordinates or the background job was missed
+        schedule_business_geocode(business.pk)
+    return location
 
 
 @login_required
@@ -117,7 +89,7 @@ def listing_create(request):
                 listing.state = location_data['state']
                 listing.zip_code = location_data['zip_code']
             else:
-                messages.warning(request, "Could not geocode your business location. Listing will not appear on map.")
+                messages.warning(request, "Your business location is still being looked up. Listing will appear on the map once it is ready.")
             
             listing.save()
             return redirect(f"{reverse('business:listing_detail', args=[listing.pk])}?created=1")
@@ -200,7 +172,7 @@ def product_create(request):
                 product.state = location_data['state']
                 product.zip_code = location_data['zip_code']
             else:
-                messages.warning(request, "Could not geocode your business location. Product will not appear on map.")
+                messages.warning(request, "Your business location is still being looked up. Product will appear on the map once it is ready.")
 
             product.save()
             messages.success(request, "Product created successfully!")
@@ -213,29 +185,28 @@ def product_create(request):
 @user_passes_test(is_business)
 def product_list(request):
     """List all products for the business"""
-    products = Product.objects.filter(owner=request.user, quantity__gt=0).order_by("-created_at")
+    products = (
+        Product.objects.filter(owner=request.user, quantity__gt=0)
+        .with_current_price()
+        .order_by("-created_at")
+    )
     return render(request, "business/product_list.html", {"products": products})
 
 @login_required
 def product_detail_public(request, pk: int):
     """Public product detail view for customers"""
-    product = get_object_or_404(Product, pk=pk, status="listed")
-    
-    # Auto-process expiration if needed (this will update status if expired)
-    product.process_expiration_if_needed()
-    
-    # Refresh from DB if status changed
-    if product.status != 'listed' or product.quantity <= 0:
-        product.refresh_from_db()
-        # If status changed, redirect or show appropriate message
-        if product.status == 'expired':
-            messages.info(request, "This product's bidding period has ended.")
-        elif product.status == 'reserved':
-            messages.info(request, "This product has been reserved for the winning bidder.")
-        elif product.quantity <= 0:
-            messages.info(request, "This product is out of stock.")
-            return redirect('business:business_public', business_id=product.owner.business.id)
-    
+    product = get_object_or_404(
+        Product.objects.select_related('highest_bid__bidder'), pk=pk, status="listed"
+    )
+
+    if product.quantity <= 0:
+        messages.info(request, "This product is out of stock.")
+        return redirect('business:business_public', business_id=product.owner.business.id)
+
+    # Settlement is done by the settle_auctions worker; just say so until it runs
+    if product.is_awaiting_settlement():
+        messages.info(request, "This product's bidding period has ended. The winner is being determined.")
+
     # Get bidding info
     highest_bid = product.get_highest_bid()
     is_bidding_open = product.is_bidding_open()
@@ -253,8 +224,15 @@ def product_detail_public(request, pk: int):
     
     is_owner = request.user.is_authenticated and request.user == product.owner
 
+    # Units other shoppers' carts are holding can't be bought; this shopper's own hold can
+    cart_id = None
+    if request.user.is_authenticated:
+        cart_id = Cart.objects.filter(customer__user=request.user).values_list("pk", flat=True).first()
+    available = reservations.available_quantity(product, cart=cart_id)
+
     return render(request, "business/product_detail_public.html", {
         "product": product,
+        "available": available,
         "highest_bid": highest_bid,
         "is_bidding_open": is_bidding_open,
         "min_bid": min_bid,
@@ -267,16 +245,12 @@ def product_detail_public(request, pk: int):
 @user_passes_test(is_business)
 def product_detail(request, pk: int):
     """View product details"""
-    product = get_object_or_404(Product, pk=pk, owner=request.user)
+    product = get_object_or_404(
+        Product.objects.select_related('highest_bid__bidder'), pk=pk, owner=request.user
+    )
     created = request.GET.get("created") == "1"
 
-    # Auto-process expiration if needed
-    product.process_expiration_if_needed()
-    product.refresh_from_db()
-
-    is_customer = False
-    if request.user.is_authenticated:
-        is_customer = not request.user.groups.filter(name="BUSINESS").exists()
+    is_customer = roles.is_customer(request.user)
 
      # Get bidding info
     highest_bid = product.get_highest_bid()
@@ -344,43 +318,79 @@ def product_delete(request, pk: int):
     return render(request, "business/product_delete.html", {"product": product})
     
 
+def _bid_redirect(request, product_id):
+    next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('business:product_detail_public', pk=product_id)
+
+
 @require_POST
 @login_required
 def place_bid(request, product_id: int):
     """Place a bid on a product"""
     product = get_object_or_404(Product, pk=product_id)
-    
-    # Auto-process expiration first
-    product.process_expiration_if_needed()
-    product.refresh_from_db()
-    
-    # Check if bidding is open (this will also process if needed)
+
+    # Check if bidding is open (closed once end_time has passed)
     if not product.is_bidding_open():
         messages.error(request, "Bidding is not open for this product.")
-        next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
-        if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
-            return redirect(next_url)
-        return redirect('business:product_detail_public', pk=product_id)
-    
+        return _bid_redirect(request, product_id)
+
     form = BidForm(request.POST, product=product, user=request.user)
-    
+
     if form.is_valid():
-        bid = form.save(commit=False)
-        bid.product = product
-        bid.bidder = request.user
-        bid.save()
-        messages.success(request, f"Your bid of ${bid.amount:.2f} has been placed!")
-        next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
-        if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
-            return redirect(next_url)
-        return redirect('business:product_detail_public', pk=product_id)
+        try:
+            # The form check ran without a lock; place_bid re-checks with the row locked
+            bid, _ = auctions.place_bid(product_id, request.user, form.cleaned_data['amount'])
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+        else:
+            messages.success(request, f"Your bid of ${bid.amount:.2f} has been placed!")
     else:
         for error in form.errors.values():
             messages.error(request, error[0])
-        next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
-        if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
-            return redirect(next_url)
-        return redirect('business:product_detail_public', pk=product_id)
+    return _bid_redirect(request, product_id)
+
+
+@require_POST
+@login_required
+def place_bid_json(request, product_id: int):
+    """
+    JSON variant of place_bid for AJAX and scripted clients: no redirect or
+    flash messages. Accepts `amount` as form data or in a JSON body.
+    Rejected bids (outbid, closed, own product) return 409.
+    """
+    if request.content_type == "application/json":
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
+    else:
+        payload = request.POST
+
+    try:
+        amount = Decimal(str(payload.get("amount")))
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite() or not (0 < amount < MAX_BID_AMOUNT):
+        return JsonResponse({"success": False, "error": "Invalid amount"}, status=400)
+
+    try:
+        bid, product = auctions.place_bid(product_id, request.user, amount.quantize(Decimal("0.01")))
+    except Product.DoesNotExist:
+        return JsonResponse({"success": False, "error": "Product not found"}, status=404)
+    except ValidationError as e:
+        return JsonResponse({"success": False, "error": e.messages[0]}, status=409)
+
+    return JsonResponse({
+        "success": True,
+        "bid": {"id": bid.id, "amount": str(bid.amount)},
+        "highest_bid_amount": str(product.highest_bid_amount),
+        "minimum_bid": str(product.get_minimum_bid()),
+        "bid_count": product.bid_count,
+    })
 
 @login_required
 @user_passes_test(is_business)
@@ -477,28 +487,36 @@ def business_public(request, business_id: int):
     - Shows 'best sellers' (top 5 most recent for now)
     - Shows active listings with pagination + 'View More' button
     """
-    business = get_object_or_404(BusinessRegistration, pk=business_id)
+    business = get_object_or_404(BusinessRegistration.objects.select_related("user"), pk=business_id)
     owner_user = business.user
-
-    products_qs = (
-        Product.objects.filter(owner=owner_user, status="listed", quantity__gt=0)
-        .prefetch_related(
-            Prefetch('bids', queryset=Bid.objects.select_related('bidder').order_by('-amount', '-created_at'))
+    number = page_cache.page_number(request.GET.get("page"))
+    # A registration without a user has no products; nothing worth caching
+    cached = owner_user is not None and not request.user.is_authenticated
+    if owner_user is not None:
+        # Read before any query so a write landing mid-render moves to a newer version
+        version = page_cache.content_version(owner_user.pk)
+
+    # Anonymous visitors all see the same page, so it's cached whole
+    if cached:
+        html = page_cache.get_html(business.pk, version, number)
+        if html is not None:
+            return HttpResponse(html)
+
+    if owner_user is None:
+        best_sellers = []
+        page_obj = Paginator(Product.objects.none(), page_cache.PAGE_SIZE).get_page(number)
+    else:
+        # Bid state is denormalized onto Product, so no bid prefetch is needed
+        products_qs = (
+            Product.objects.filter(owner=owner_user, status="listed", quantity__gt=0)
+            .select_related('highest_bid')
+            .with_current_price()
+            .order_by("-created_at")
         )
-        .order_by("-created_at")
-    )
+        best_sellers, page_obj = page_cache.page_data(business.pk, version, products_qs, number)
 
-    best_sellers = products_qs[:5]
-
-    paginator = Paginator(products_qs, 6)
-    page_number = request.GET.get("page", "1")
-    page_obj = paginator.get_page(page_number)
-
-    is_customer = False
-    is_owner = False
-    if request.user.is_authenticated:
-        is_customer = not request.user.groups.filter(name="BUSINESS").exists()
-        is_owner = (request.user == owner_user)
+    is_customer = roles.is_customer(request.user)
+    is_owner = request.user.is_authenticated and request.user == owner_user
 
     context = {
         "business": business,
@@ -510,4 +528,57 @@ def business_public(request, business_id: int):
         "is_customer": is_customer,
         "is_owner": is_owner,
     }
-    return render(request, "business/business_public.html", context)
\ No newline at end of file
+    response = render(request, "business/business_public.html", context)
+    if cached:
+        page_cache.set_html(business.pk, version, number, response.content, best_sellers + page_obj.object_list)
+    return response
+
+def _event_stream_response(request, keys, products, snapshot=False):
+    # Under ASGI the stream waits on the event loop instead of a worker thread
+    if isinstance(request, ASGIRequest):
+        events = live.astream(keys, products, snapshot=snapshot)
+    else:
+        try:
+            subscription = live.subscribe(*keys, limit=settings.LIVE_THREAD_STREAMS)
+        except live.TooManyStreams:
+            # Keep threads free for ordinary requests; the page retries later
+            response = HttpResponse(
+                f"retry: {live.BUSY_RETRY_SECONDS * 1000}\n\n", content_type="text/event-stream", status=503
+            )
+            response["Retry-After"] = str(live.BUSY_RETRY_SECONDS)
+            return response
+        events = live.stream(subscription, products, snapshot=snapshot)
+    # The stream is long-lived and never queries again; don't hold a connection
+    if not connection.in_atomic_block:
+        connection.close()
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx and similar proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@require_GET
+def product_events(request, product_id: int):
+    """
+    Server-sent events for a product page: a snapshot, then `bid`, `price`
+    and `settled` events as they happen. See business/live.py.
+    """
+    product = get_object_or_404(Product, pk=product_id)
+    return _event_stream_response(request, [live.product_key(product.pk)], [product], snapshot=True)
+
+
+@require_GET
+def business_events(request, business_id: int):
+    """
+    Server-sent events for a public business page: a snapshot of its timed
+    products, then their bids, price tiers and settlements.
+    """
+    business = get_object_or_404(BusinessRegistration, pk=business_id)
+    products = list(
+        Product.objects.filter(owner_id=business.user_id, status="listed", quantity__gt=0, end_time__isnull=False)
+        .only("id", "owner_id", "base_price", "min_price", "end_time", "highest_bid_amount", "bid_count")
+        .order_by("end_time")[:LIVE_PRODUCTS_LIMIT]
+    )
+    # The snapshot catches a reconnecting page up on what it missed
+    return _event_stream_response(request, [live.owner_key(business.user_id)], products, snapshot=True)
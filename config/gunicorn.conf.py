@@ -0,0 +1,90 @@
+# File location: config/gunicorn.conf.py
+
+"""
+Gunicorn settings for SERVER_MODE=gunicorn (see entrypoint.sh).
+
+Everything can be overridden from the environment:
+
+- GUNICORN_WORKERS: processes; defaults to 2 x CPUs + 1, capped by the
+  database connection budget below.
+- GUNICORN_THREADS: threads per worker (gthread). Every open live-update
+  stream (business/live.py) holds one thread for up to
+  STREAM_MAX_SECONDS; a worker holds at most LIVE_THREAD_STREAMS of them
+  (default: half of these threads) and turns further pages away with a 503,
+  so the rest of the threads stay free for ordinary requests.
+- GUNICORN_WORKER_CLASS: "gthread" (default, WSGI) or "asgi", which runs
+  uvicorn workers on config.asgi so streams wait on the event loop and
+  hold no threads. "asgi" needs `pip install uvicorn-worker`.
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER: recycle a worker
+  after this many requests (jittered so they don't all restart at once).
+- GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT: seconds before a silent
+  worker is killed, and how long a stopping worker gets to finish.
+
+Database connections: each worker can hold up to
+  (threads, or DB_POOL_MAX_SIZE with DB_CONNECTION_STRATEGY=pool)
+  + BACKGROUND_CONNECTIONS (the live-updates LISTEN connection and the
+    geocoding / image-variant threads)
+so all workers together need workers x that. It has to fit in
+DB_MAX_CONNECTIONS (Postgres' max_connections, 100 by default) less
+DB_RESERVED_CONNECTIONS for everything else: the settle_auctions worker,
+migrations and other management commands, psql, superuser slots. The
+default worker count is lowered to fit; an explicit GUNICORN_WORKERS
+that doesn't fit refuses to start rather than fail under load with
+"too many clients".
+"""
+import multiprocessing
+import os
+
+ASGI_WORKER_CLASS = "uvicorn_worker.UvicornWorker"
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# Connections a worker holds besides its request threads
+BACKGROUND_CONNECTIONS = 2
+
+db_max_connections = int(os.environ.get("DB_MAX_CONNECTIONS", 100))
+db_reserved_connections = int(os.environ.get("DB_RESERVED_CONNECTIONS", 10))
+if os.environ.get("DB_CONNECTION_STRATEGY", "persistent") == "pool":
+    connections_per_worker = int(os.environ.get("DB_POOL_MAX_SIZE", "10")) + BACKGROUND_CONNECTIONS
+else:
+    connections_per_worker = threads + BACKGROUND_CONNECTIONS
+max_workers = (db_max_connections - db_reserved_connections) // connections_per_worker
+if max_workers < 1:
+    raise RuntimeError(
+        f"One worker needs {connections_per_worker} database connections, more than the "
+        f"{db_max_connections - db_reserved_connections} DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS "
+        f"leaves; lower GUNICORN_THREADS (or DB_POOL_MAX_SIZE)"
+    )
+
+if "GUNICORN_WORKERS" in os.environ:
+    workers = int(os.environ["GUNICORN_WORKERS"])
+    if workers > max_workers:
+        raise RuntimeError(
+            f"GUNICORN_WORKERS={workers} x {connections_per_worker} database connections each is over the "
+            f"budget of {db_max_connections - db_reserved_connections}; use at most {max_workers} workers, "
+            f"fewer threads, or raise DB_MAX_CONNECTIONS along with Postgres' max_connections"
+        )
+else:
+    workers = min(multiprocessing.cpu_count() * 2 + 1, max_workers)
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class == "asgi":
+    worker_class = ASGI_WORKER_CLASS
+if worker_class == ASGI_WORKER_CLASS:
+    wsgi_app = "config.asgi:application"
+else:
+    wsgi_app = "config.wsgi:application"
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Live-update streams keep writing a keepalive every 15s, so a 30s timeout
+# only catches workers that are genuinely stuck
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = "-"
+errorlog = "-"
@@ -11,8 +11,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # Before staticfiles, so runserver leaves static files to WhiteNoise too
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     
     #'landing.apps.LandingConfig',
@@ -62,6 +67,11 @@ AUTH_USER_MODEL = "users.User"
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serves /static/ from the app process, before sessions and auth run
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Below WhiteNoise so static files aren't recorded (as "unresolved");
+    # times and counts the SQL of everything below it
+    'dashboard.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -105,6 +115,69 @@ DATABASES = {
     }
 }
 
+# How requests get a database connection (DB_CONNECTION_STRATEGY):
+# - "persistent" (default): each worker thread keeps its connection for
+#   DB_CONN_MAX_AGE seconds and health-checks it before reuse. Best for
+#   runserver and gunicorn gthread workers.
+# - "pool": psycopg3's connection pool, one per process; connections are
+#   checked out per request. Use it for ASGI workers, where persistent
+#   connections are not safe. Size DB_POOL_MAX_SIZE to at least
+#   GUNICORN_THREADS, and keep workers x max size under Postgres'
+#   max_connections.
+# config/gunicorn.conf.py checks either way that the workers' connections
+# fit in DB_MAX_CONNECTIONS.
+# - "none": a new connection per request.
+DB_CONNECTION_STRATEGY = os.environ.get("DB_CONNECTION_STRATEGY", "persistent")
+if DB_CONNECTION_STRATEGY == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+elif DB_CONNECTION_STRATEGY == "pool":
+    # Django requires CONN_MAX_AGE = 0 (the default) with a pool
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            # Seconds a request waits for a free connection before erroring
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            # Seconds before a connection is replaced, and before an idle one is closed
+            "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", "300")),
+        },
+    }
+elif DB_CONNECTION_STRATEGY != "none":
+    raise ImproperlyConfigured(
+        f"DB_CONNECTION_STRATEGY must be persistent, pool or none, not {DB_CONNECTION_STRATEGY!r}"
+    )
+
+
+# Cache (CACHE_BACKEND):
+# - "locmem" (default): per process. Fine for runserver, but with several
+#   gunicorn workers or the background workers, invalidations made in one
+#   process don't reach the others, so use a shared backend there. (Role
+#   checks in users/roles.py don't cache across requests on locmem.)
+# - "file": shared by every process on one host, at CACHE_LOCATION.
+# - "redis": any Redis-compatible server at CACHE_LOCATION.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND == "locmem":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "lastbite"}}
+elif CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", "/tmp/lastbite-cache"),
+        }
+    }
+elif CACHE_BACKEND == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_LOCATION", "redis://redis:6379/1"),
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be locmem, file or redis, not {CACHE_BACKEND!r}")
+CACHES["default"]["KEY_PREFIX"] = "lastbite"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +220,14 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'lastbite' / 'staticfiles'
 
+# Hashed file names plus gzip/brotli copies, built by collectstatic (see config/storage.py)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "config.storage.StaticFilesStorage"},
+}
+# Cache lifetime of static files without a hash in their name; hashed ones get ten years
+WHITENOISE_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", "0" if DEBUG else "3600"))
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -165,4 +246,36 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "LastBite <no-reply@lastbite.local>"
 
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', 'pk_test_51SSVWz3py5SuWYn8jbvvWC9KwBisUDX34JOvh3ilMMYEF3Mg8hMTO3TlHMcrQ7kcYdYn3J92aEgshv38gwpRBdZn00QN4NNeHN')
-STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51SSVWz3py5SuWYn8uSSXApjqlCCstppeOv9iodqHw8M2wjhJZ6xMybhuKy6suntvNl44qFX7P6nAsWKV6fsZSAkT00HlLkedwK')
\ No newline at end of file
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', 'sk_test_51SSVWz3py5SuWYn8uSSXApjqlCCstppeOv9iodqHw8M2wjhJZ6xMybhuKy6suntvNl44qFX7P6nAsWKV6fsZSAkT00HlLkedwK')
+# Signing secret of the checkout webhook endpoint (whsec_...)
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Point the Stripe client at another API host, e.g. `manage.py fake_stripe` for offline runs
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', '')
+
+# Geocoding cache (business/geocoding.py). Failed lookups are cached for a
+# shorter window so typos don't hit Nominatim on every save.
+GEOCODE_CACHE_TTL = timedelta(days=int(os.environ.get("GEOCODE_CACHE_TTL_DAYS", "30")))
+GEOCODE_NEGATIVE_TTL = timedelta(hours=int(os.environ.get("GEOCODE_NEGATIVE_TTL_HOURS", "24")))
+
+# How long cart lines hold stock (market/reservations.py); refreshed on every
+# cart change and when checkout starts.
+CART_RESERVATION_TTL = timedelta(minutes=int(os.environ.get("CART_RESERVATION_TTL_MINUTES", "15")))
+
+# Live bid/price streams (business/live.py). "postgres" relays through
+# LISTEN/NOTIFY so every worker process sees every update; "local" only
+# reaches streams held by the process that made the change.
+LIVE_UPDATES_BACKEND = os.environ.get("LIVE_UPDATES_BACKEND", "postgres")
+# Under WSGI every open stream pins a request thread for up to 5 minutes, so
+# a process holds at most this many and turns the rest away with a 503 (the
+# page retries later). Defaults to half of GUNICORN_THREADS; ASGI workers
+# don't hold threads for streams and aren't capped.
+LIVE_THREAD_STREAMS = int(
+    os.environ.get("LIVE_THREAD_STREAMS", max(1, int(os.environ.get("GUNICORN_THREADS", "8")) // 2))
+)
+
+# Request metrics (dashboard/metrics.py)
+# Send per-request SQL and timing in a Server-Timing header; on by default in DEBUG only
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1" if DEBUG else "0") == "1"
+# Bearer token that lets a Prometheus scraper read /user-dashboard/api/metrics/
+# without a staff session; empty disables token access
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
@@ -18,7 +18,7 @@ urlpatterns = [
 ]
 
 
+# Static files are served by WhiteNoise (see MIDDLEWARE)
 if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     if getattr(settings, "MEDIA_URL", None):
         urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,73 @@
+# File location: dashboard/distance.py
+
+"""
+Haversine distance helpers.
+
+`calculate_distance` handles a single pair of points. `calculate_distances`
+measures one origin against many candidates in a single call, using NumPy
+when it is installed and a pure-Python loop otherwise.
+"""
+import math
+
+from business.geo import EARTH_RADIUS_KM
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate distance between two coordinates using Haversine formula
+    Returns distance in kilometers
+    """
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lon / 2) ** 2)
+    c = 2 * math.asin(math.sqrt(a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def calculate_distances(lat, lng, latitudes, longitudes, use_numpy=True):
+    """
+    Distances in km from (lat, lng) to every (latitudes[i], longitudes[i]).
+    Accepts any sequences of numbers (floats or Decimals) of equal length and
+    returns a sequence of floats in the same order.
+    """
+    if np is not None and use_numpy:
+        return _distances_numpy(lat, lng, latitudes, longitudes)
+    return _distances_python(lat, lng, latitudes, longitudes)
+
+
+def _distances_numpy(lat, lng, latitudes, longitudes):
+    lat_rad = math.radians(float(lat))
+    lng_rad = math.radians(float(lng))
+    lats = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lngs = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    a = (np.sin((lats - lat_rad) / 2) ** 2
+         + math.cos(lat_rad) * np.cos(lats) * np.sin((lngs - lng_rad) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _distances_python(lat, lng, latitudes, longitudes):
+    lat_rad = math.radians(float(lat))
+    lng_rad = math.radians(float(lng))
+    cos_lat = math.cos(lat_rad)
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+
+    distances = []
+    for row_lat, row_lng in zip(latitudes, longitudes):
+        row_lat = radians(float(row_lat))
+        row_lng = radians(float(row_lng))
+        a = (sin((row_lat - lat_rad) / 2) ** 2
+             + cos_lat * cos(row_lat) * sin((row_lng - lng_rad) / 2) ** 2)
+        distances.append(2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0))))
+    return distances
@@ -0,0 +1,51 @@
+# File location: dashboard/management/commands/bench_distance.py
+
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from dashboard import distance
+from dashboard.distance import calculate_distance, calculate_distances
+
+ORIGIN = (41.8781, -87.6298)  # Chicago
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark scalar vs. batched Haversine throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000, 100_000, 1_000_000])
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        lat, lng = ORIGIN
+
+        if distance.np is None:
+            self.stdout.write(self.style.WARNING("numpy is not installed; skipping the numpy column"))
+
+        self.stdout.write(
+            f"{'points':>10} {'scalar pts/s':>14} {'python pts/s':>14} {'numpy pts/s':>14}"
+        )
+        for size in options['sizes']:
+            # Decimals, as they come off the DecimalField columns
+            lats = [Decimal(f'{rng.uniform(25, 49):.6f}') for _ in range(size)]
+            lngs = [Decimal(f'{rng.uniform(-124, -67):.6f}') for _ in range(size)]
+
+            scalar = self._throughput(size, lambda: [
+                calculate_distance(lat, lng, float(a), float(b)) for a, b in zip(lats, lngs)
+            ])
+            python = self._throughput(size, lambda: calculate_distances(lat, lng, lats, lngs, use_numpy=False))
+            if distance.np is not None:
+                numpy = f"{self._throughput(size, lambda: calculate_distances(lat, lng, lats, lngs)):>14,.0f}"
+            else:
+                numpy = f"{'-':>14}"
+
+            self.stdout.write(f"{size:>10} {scalar:>14,.0f} {python:>14,.0f} {numpy}")
+
+    def _throughput(self, size, fn):
+        start = time.perf_counter()
+        fn()
+        return size / (time.perf_counter() - start)
@@ -0,0 +1,109 @@
+# File location: dashboard/management/commands/bench_nearby.py
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from business.geo import encode_geohash
+from business.models import Product
+from dashboard.distance import calculate_distance
+from dashboard.views import get_nearby_listings
+
+User = get_user_model()
+
+# Continental US, so a city-sized radius only touches a small slice of rows
+LAT_RANGE = (25.0, 49.0)
+LNG_RANGE = (-124.0, -67.0)
+SEARCH_POINT = (41.8781, -87.6298)  # Chicago
+
+
+class Command(BaseCommand):
+    help = 'Benchmark nearby-listings latency: full-table scan vs. geohash/bounding-box lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--radius', type=float, default=10, help='Search radius in km')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        radius = options['radius']
+
+        self.stdout.write(f"{'products':>10} {'full scan ms':>14} {'spatial ms':>12} {'matches':>8}")
+        for size in options['sizes']:
+            # Seeded rows are rolled back so the benchmark never leaves data behind
+            with transaction.atomic():
+                owner = User.objects.create_user(username=f'bench-nearby-{size}', password=None)
+                self._seed(owner, size, rng)
+
+                full_ms = self._time(lambda: self._full_scan(radius), options['repeat'])
+                spatial_ms = self._time(lambda: self._spatial(owner, radius), options['repeat'])
+                matches = len(self._full_scan(radius))
+
+                transaction.set_rollback(True)
+
+            self.stdout.write(f"{size:>10} {full_ms:>14.1f} {spatial_ms:>12.1f} {matches:>8}")
+
+    def _seed(self, owner, size, rng):
+        batch = []
+        for i in range(size):
+            # Half the rows cluster around the search point, half spread nationwide
+            if i % 2:
+                lat = rng.gauss(SEARCH_POINT[0], 0.5)
+                lng = rng.gauss(SEARCH_POINT[1], 0.5)
+            else:
+                lat = rng.uniform(*LAT_RANGE)
+                lng = rng.uniform(*LNG_RANGE)
+            batch.append(Product(
+                owner=owner,
+                title=f'Bench product {i}',
+                base_price=Decimal('5.00'),
+                quantity=1,
+                status='listed',
+                latitude=Decimal(f'{lat:.6f}'),
+                longitude=Decimal(f'{lng:.6f}'),
+                geohash=encode_geohash(lat, lng),
+            ))
+            if len(batch) >= 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+    def _full_scan(self, radius):
+        """The previous implementation: Haversine over every listed product."""
+        lat, lng = SEARCH_POINT
+        products = Product.objects.filter(
+            latitude__isnull=False,
+            longitude__isnull=False,
+            quantity__gt=0,
+            status='listed',
+        )
+        return [
+            p.id for p in products
+            if calculate_distance(lat, lng, float(p.latitude), float(p.longitude)) <= radius
+        ]
+
+    def _spatial(self, owner, radius):
+        request = RequestFactory().get('/', {
+            'lat': SEARCH_POINT[0],
+            'lng': SEARCH_POINT[1],
+            'radius': radius,
+        })
+        request.user = owner
+        return get_nearby_listings(request)
+
+    def _time(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
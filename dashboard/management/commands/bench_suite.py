@@ -0,0 +1,229 @@
+# File location: dashboard/management/commands/bench_suite.py
+
+import json
+import statistics
+import subprocess
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from business import auctions, page_cache
+from business.models import Product
+from dashboard import seed, stats
+from market import checkout
+from market.models import Cart, CartItem
+from users import roles
+from users.models import BusinessRegistration
+
+User = get_user_model()
+
+PREFIX = 'bench'
+CART_SIZE = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot paths (nearby search, browse, business page, cart, bidding, checkout) '
+        'at several seeded data sizes and write JSON results for comparison between commits. '
+        'Seeds into the configured database (rolled back afterwards), so it needs DEBUG or --yes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10, 100],
+            help='Numbers of businesses to seed (each with --products-per-business products)',
+        )
+        parser.add_argument('--products-per-business', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench-results.json')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Flag a target whose median got more than this many percent slower',
+        )
+        parser.add_argument(
+            '--yes', action='store_true',
+            help='Run even with DEBUG off, i.e. possibly against a production database',
+        )
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options['yes']):
+            raise CommandError(
+                "bench_suite writes seed data to the configured database "
+                f"({connection.settings_dict['NAME']}) and times requests against it. "
+                "Run it with DEBUG on, or pass --yes if that database is safe to use."
+            )
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'commit': self._commit(),
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'products_per_business': options['products_per_business'],
+            'sizes': {},
+        }
+        # The test client's host must be allowed even where ALLOWED_HOSTS is locked down
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for size in options['sizes']:
+                results['sizes'][str(size)] = self._run_size(size, options)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"✓ Wrote {options['output']}"))
+
+        if baseline is not None:
+            self._compare(baseline, results, options['threshold'])
+
+    def _run_size(self, size, options):
+        # Seeded rows are rolled back so the benchmark never leaves data behind
+        with transaction.atomic():
+            data = seed.seed(
+                businesses=size,
+                products_per_business=options['products_per_business'],
+                seed=options['seed'],
+                prefix=PREFIX,
+            )
+            self.stdout.write(f"\n{size} businesses, {data['products']} products")
+            self.stdout.write(f"{'target':<24} {'median ms':>10} {'p95 ms':>10} {'queries':>8}")
+
+            timings = {}
+            for name, prepare, run in self._targets(data):
+                timings[name] = self._time(prepare, run, options['repeat'])
+                t = timings[name]
+                self.stdout.write(f"{name:<24} {t['median_ms']:>10.1f} {t['p95_ms']:>10.1f} {t['queries']:>8}")
+
+            transaction.set_rollback(True)
+        self._forget(data)
+        return {'products': data['products'], 'targets': timings}
+
+    def _forget(self, data):
+        """
+        Drop what the runs cached about the rolled-back rows, and nothing
+        else: the cache may be shared with a running site.
+        """
+        for owner_id in data['owner_ids']:
+            page_cache.bump(owner_id)
+        roles.invalidate([*data['owner_ids'], *data['customer_ids']])
+        for user_id in data['customer_ids']:
+            stats.invalidate(user_id)
+
+    def _targets(self, data):
+        """(name, prepare, run) triples; prepare runs untimed before every run."""
+        customer = User.objects.get(pk=data['customer_ids'][0])
+        bidder = User.objects.get(pk=data['customer_ids'][-1])
+        client = Client()
+        client.force_login(customer)
+
+        first = Product.objects.get(pk=data['product_ids'][0])
+        nearby = {'lat': str(first.latitude), 'lng': str(first.longitude), 'radius': 10}
+        business = BusinessRegistration.objects.get(user_id=data['owner_ids'][0])
+        cart = Cart.objects.get(customer__user=customer)
+        auction = (
+            Product.objects.filter(pk__in=data['product_ids'], enable_bidding=True)
+            .exclude(owner=bidder).first()
+        )
+        # Every product but the auction, so a checkout never sells it out
+        for_sale = [pk for pk in data['product_ids'] if not auction or pk != auction.pk]
+
+        def fill_cart():
+            CartItem.objects.filter(cart=cart).delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product_id=pk, unit_price_cents=100, quantity=1)
+                for pk in for_sale[:CART_SIZE]
+            ])
+
+        def bid():
+            product = Product.objects.get(pk=auction.pk)
+            auctions.place_bid(product.pk, bidder, product.get_minimum_bid() + Decimal('1.00'))
+
+        targets = [
+            ('get_nearby_listings', None,
+             lambda: client.get(reverse('dashboard:get_nearby_listings'), nearby)),
+            ('get_nearby_businesses', None,
+             lambda: client.get(reverse('dashboard:get_nearby_businesses'), nearby)),
+            ('dynamic_pricing', None,
+             lambda: client.get(reverse('market:dynamic_pricing'))),
+            ('business_public', lambda: page_cache.bump(business.user_id),
+             lambda: client.get(reverse('business:business_public', args=[business.pk]))),
+            ('business_public_cached', None,
+             lambda: client.get(reverse('business:business_public', args=[business.pk]))),
+            ('cart_detail', fill_cart,
+             lambda: client.get(reverse('market:cart_detail'))),
+            ('checkout_fulfilment', fill_cart,
+             lambda: checkout.fulfill_cart(cart, f'cs_bench_{uuid.uuid4().hex}')),
+        ]
+        if auction is not None:
+            targets.append(('place_bid', None, bid))
+        return targets
+
+    def _time(self, prepare, run, repeat):
+        samples = []
+        queries = 0
+        for _ in range(repeat):
+            if prepare:
+                prepare()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = run()
+                samples.append((time.perf_counter() - start) * 1000)
+            status = getattr(response, 'status_code', 200)
+            if status != 200:
+                raise CommandError(f"Benchmark request failed with status {status}")
+            queries = len(ctx)
+        samples.sort()
+        return {
+            'median_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            # From the last run, once caches and the cart are warm
+            'queries': queries,
+        }
+
+    def _compare(self, baseline, results, threshold):
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or 'baseline'} (median ms, queries):")
+        regressions = 0
+        for size, current in results['sizes'].items():
+            before = baseline.get('sizes', {}).get(size)
+            if before is None:
+                continue
+            for name, now in current['targets'].items():
+                old = before['targets'].get(name)
+                if old is None:
+                    continue
+                change = (now['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0
+                flag = ''
+                if change > threshold or now['queries'] > old['queries']:
+                    flag = '  <-- regression'
+                    regressions += 1
+                self.stdout.write(
+                    f"{size:>6} {name:<24} {old['median_ms']:>8.1f} -> {now['median_ms']:>8.1f} ({change:+.0f}%)"
+                    f"  {old['queries']} -> {now['queries']}{flag}"
+                )
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"{regressions} regression(s) over {threshold:g}% or in query count"))
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
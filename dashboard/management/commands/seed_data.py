@@ -0,0 +1,41 @@
+# File location: dashboard/management/commands/seed_data.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import seed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Seed deterministic synthetic businesses, products, bids, carts and orders (see dashboard/seed.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=50)
+        parser.add_argument('--products-per-business', type=int, default=20)
+        parser.add_argument('--customers', type=int, help='Default: 2 per business')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default=seed.DEFAULT_PREFIX, help='Username prefix of seeded users')
+        parser.add_argument('--flush', action='store_true', help='Delete earlier data with this prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['flush']:
+            deleted = seed.flush(prefix)
+            self.stdout.write(f"Deleted {deleted} seeded users and their data")
+        elif User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users prefixed {prefix!r} already exist; pass --flush to replace them")
+
+        summary = seed.seed(
+            businesses=options['businesses'],
+            products_per_business=options['products_per_business'],
+            customers=options['customers'],
+            seed=options['seed'],
+            prefix=prefix,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Seeded {summary['businesses']} businesses, {summary['products']} products, "
+            f"{summary['customers']} customers, {summary['bids']} bids, "
+            f"{summary['cart_items']} cart items, {summary['orders']} orders"
+        ))
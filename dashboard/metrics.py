@@ -0,0 +1,156 @@
+# File location: dashboard/metrics.py
+
+"""
+Per-view request metrics: SQL query count, SQL time, total time and
+response size, recorded by dashboard.middleware.RequestMetricsMiddleware
+and tagged with the resolved URL name.
+
+Each metric is a histogram per view, so percentiles can be read with
+Prometheus' histogram_quantile() from the text served by the staff-only
+metrics endpoint (`render_prometheus`), or estimated here by `stats()`.
+Like the other stats() counters in this project, the numbers are per
+process: with several gunicorn workers, each scrape sees one worker.
+Gauges read from the database at scrape time (`render_gauges`, e.g. the
+auction settlement backlog) are the same whichever worker answers.
+"""
+import threading
+from bisect import bisect_left
+
+# Upper bounds of each bucket; values above the last one land in +Inf
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+METRICS = {
+    # name: (help, buckets)
+    'lastbite_request_duration_seconds': ("Time spent handling the request", DURATION_BUCKETS),
+    'lastbite_request_sql_seconds': ("Time spent in SQL queries", DURATION_BUCKETS),
+    'lastbite_request_sql_queries': ("SQL queries run", QUERY_BUCKETS),
+    'lastbite_response_size_bytes': ("Response body size (streaming responses excluded)", SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    """Prometheus-style histogram: per-bucket counts plus sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0-1) by interpolating inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    # Beyond the last bound; the bound is the best we can say
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+_lock = threading.Lock()
+_histograms = {}  # (metric name, view name) -> Histogram
+_responses = {}  # (view name, status code) -> count
+
+
+def record(view, status, duration, sql_queries, sql_seconds, size=None):
+    """Record one request to view; size is None for streaming responses."""
+    values = {
+        'lastbite_request_duration_seconds': duration,
+        'lastbite_request_sql_seconds': sql_seconds,
+        'lastbite_request_sql_queries': sql_queries,
+        'lastbite_response_size_bytes': size,
+    }
+    with _lock:
+        for name, value in values.items():
+            if value is None:
+                continue
+            histogram = _histograms.get((name, view))
+            if histogram is None:
+                histogram = _histograms[(name, view)] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+        _responses[(view, status)] = _responses.get((view, status), 0) + 1
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _responses.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        histograms = {
+            key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in _histograms.items()
+        }
+        responses = dict(_responses)
+
+    lines = [
+        "# HELP lastbite_http_responses_total Responses by view and status code",
+        "# TYPE lastbite_http_responses_total counter",
+    ]
+    for (view, status), count in sorted(responses.items()):
+        lines.append(f'lastbite_http_responses_total{{view="{_label(view)}",status="{status}"}} {count}')
+
+    for name, (help_text, _) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, view), (counts, total, count, buckets) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            view = _label(view)
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{view="{view}"}} {_number(total)}')
+            lines.append(f'{name}_count{{view="{view}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def render_gauges(gauges):
+    """Point-in-time values, {name: (help, value)}, in the same text format."""
+    lines = []
+    for name, (help_text, value) in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def stats():
+    """Per-view request counts with estimated p50/p95/p99 of each metric."""
+    with _lock:
+        result = {}
+        for (name, view), histogram in _histograms.items():
+            metric = name.removeprefix('lastbite_')
+            result.setdefault(view, {})[metric] = {
+                'count': histogram.count,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99),
+            }
+        return result
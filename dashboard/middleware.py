@@ -0,0 +1,49 @@
+# File location: dashboard/middleware.py
+
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request and count its SQL, then record both per URL name in
+    dashboard.metrics. With settings.SERVER_TIMING on, the numbers also go
+    out in a Server-Timing header, where browser dev tools show them.
+    Keep it right after WhiteNoise in MIDDLEWARE, so the rest of the
+    middleware is timed too but static files are not.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        size = None if response.streaming else len(response.content)
+        metrics.record(view, response.status_code, duration, queries[0], queries[1], size)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={queries[1] * 1000:.1f};desc="{queries[0]} queries", '
+                f'total;dur={duration * 1000:.1f}'
+            )
+        return response
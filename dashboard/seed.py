@@ -0,0 +1,173 @@
+# File location: dashboard/seed.py
+
+"""
+Deterministic synthetic data for local load tests and benchmarks.
+
+`seed` creates businesses clustered around real US metro areas, their
+products, bids, customer carts and past orders. Everything is drawn from
+random.Random(seed), so the same arguments always produce the same rows;
+only timestamps move, since they are relative to now (products must still
+be on sale when the data is used). Rows are written with bulk_create, so
+no geocoding or cache-invalidation signals fire; all seeded users share a
+username prefix, and `flush` deletes them and everything they own.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.utils import timezone
+
+from business.geo import encode_geohash
+from business.models import Bid, Product
+from market.models import Cart, CartItem, Order
+from users.models import BusinessRegistration, CustomerProfile
+
+User = get_user_model()
+
+DEFAULT_PREFIX = 'seed'
+
+# (city, state, latitude, longitude); businesses spread around these
+CLUSTERS = (
+    ('Chicago', 'IL', 41.8781, -87.6298),
+    ('New York', 'NY', 40.7128, -74.0060),
+    ('Los Angeles', 'CA', 34.0522, -118.2437),
+    ('Houston', 'TX', 29.7604, -95.3698),
+    ('Seattle', 'WA', 47.6062, -122.3321),
+    ('Atlanta', 'GA', 33.7490, -84.3880),
+)
+# Standard deviation of a business's distance from its cluster centre, in degrees (~10 km)
+CLUSTER_SPREAD = 0.09
+
+TITLES = ('Sourdough', 'Bagels', 'Croissants', 'Salad bowl', 'Sushi set', 'Muffins', 'Soup', 'Burrito', 'Pastries')
+
+BATCH_SIZE = 2000
+
+
+def _location(rng):
+    city, state, lat, lng = rng.choice(CLUSTERS)
+    return city, state, rng.gauss(lat, CLUSTER_SPREAD), rng.gauss(lng, CLUSTER_SPREAD)
+
+
+def seed(businesses=50, products_per_business=20, customers=None, seed=42, prefix=DEFAULT_PREFIX):
+    """
+    Create the data set and return a summary of row counts plus the
+    business owner, customer and product ids, for callers that need to
+    pick targets from it. customers defaults to 2 per business.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    customers = businesses * 2 if customers is None else customers
+
+    with transaction.atomic():
+        business_group, _ = Group.objects.get_or_create(name='BUSINESS')
+        owners = User.objects.bulk_create(
+            [User(username=f'{prefix}-biz-{i}') for i in range(businesses)], batch_size=BATCH_SIZE
+        )
+        business_group.user_set.add(*owners)
+
+        locations = {}
+        registrations = []
+        for i, owner in enumerate(owners):
+            city, state, lat, lng = _location(rng)
+            locations[owner.pk] = (city, state, lat, lng)
+            registrations.append(BusinessRegistration(
+                user=owner,
+                name=f'{rng.choice(TITLES)} House {i}',
+                business_type=rng.choice(BusinessRegistration.BUSINESS_TYPE_CHOICES)[0],
+                address=f'{i} Main St, {city}, {state}',
+                normalized_address=f'{i} Main St',
+                city=city,
+                state=state,
+                phone_number='5555550100',
+                email=f'{prefix}-biz-{i}@example.com',
+                owner_name=f'Owner {i}',
+                latitude=Decimal(f'{lat:.6f}'),
+                longitude=Decimal(f'{lng:.6f}'),
+                geocoded_at=now,
+            ))
+        BusinessRegistration.objects.bulk_create(registrations, batch_size=BATCH_SIZE)
+
+        products = []
+        for owner in owners:
+            city, state, lat, lng = locations[owner.pk]
+            for _ in range(products_per_business):
+                base = Decimal(rng.randrange(300, 3000)) / 100
+                products.append(Product(
+                    owner=owner,
+                    title=rng.choice(TITLES),
+                    base_price=base,
+                    min_price=(base * Decimal('0.5')).quantize(Decimal('0.01')),
+                    quantity=rng.randint(1, 10),
+                    status='listed',
+                    end_time=now + timedelta(minutes=rng.randint(10, 360)),
+                    enable_bidding=rng.random() < 0.4,
+                    city=city,
+                    state=state,
+                    latitude=Decimal(f'{lat:.6f}'),
+                    longitude=Decimal(f'{lng:.6f}'),
+                    geohash=encode_geohash(lat, lng),
+                ))
+        products = Product.objects.bulk_create(products, batch_size=BATCH_SIZE)
+
+        shoppers = User.objects.bulk_create(
+            [User(username=f'{prefix}-customer-{i}') for i in range(customers)], batch_size=BATCH_SIZE
+        )
+        profiles = CustomerProfile.objects.bulk_create(
+            [CustomerProfile(user=user) for user in shoppers], batch_size=BATCH_SIZE
+        )
+        carts = Cart.objects.bulk_create([Cart(customer=profile) for profile in profiles], batch_size=BATCH_SIZE)
+
+        bids = []
+        bidding = [product for product in products if product.enable_bidding]
+        for product in bidding:
+            amount = product.min_price
+            for bidder in rng.sample(shoppers, min(len(shoppers), rng.randint(0, 4))):
+                amount += Decimal(rng.randrange(10, 100)) / 100
+                bids.append(Bid(product=product, bidder=bidder, amount=amount))
+        Bid.objects.bulk_create(bids, batch_size=BATCH_SIZE)
+        # bulk_create skips Bid.save, which keeps the denormalized columns up to date
+        Product.objects.filter(pk__in=[product.pk for product in bidding]).refresh_bid_stats()
+
+        items = []
+        orders = []
+        for cart, profile in zip(carts, profiles):
+            for product in rng.sample(products, min(len(products), rng.randint(0, 3))):
+                items.append(CartItem(
+                    cart=cart,
+                    product=product,
+                    unit_price_cents=int(product.base_price * 100),
+                    quantity=1,
+                ))
+            for product in rng.sample(products, min(len(products), rng.randint(0, 5))):
+                orders.append(Order(
+                    customer=profile,
+                    product=product,
+                    stripe_session_id=f'cs_seed_{rng.getrandbits(64):016x}',
+                    total_cents=int(product.base_price * 100),
+                    quantity=1,
+                ))
+        CartItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+
+    return {
+        'businesses': len(owners),
+        'products': len(products),
+        'customers': len(shoppers),
+        'bids': len(bids),
+        'cart_items': len(items),
+        'orders': len(orders),
+        'owner_ids': [owner.pk for owner in owners],
+        'customer_ids': [user.pk for user in shoppers],
+        'product_ids': [product.pk for product in products],
+    }
+
+
+def flush(prefix=DEFAULT_PREFIX):
+    """Delete every seeded user and, by cascade, what they own. Returns the number of users."""
+    users = User.objects.filter(username__startswith=f'{prefix}-')
+    count = users.count()
+    users.delete()
+    return count
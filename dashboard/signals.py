@@ -0,0 +1,24 @@
+# File location: dashboard/signals.py
+
+"""
+Keep the cached dashboard stats (dashboard/stats.py) in step with cart and
+order writes. Cart lines have no per-row receiver: the paths that write
+them send market.signals.cart_changed once, and a receiver on CartItem
+would also stop Django from fast-deleting a cart's lines.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from market.models import Order
+from market.signals import cart_changed
+from . import stats
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    stats.invalidate_customer(instance.customer_id)
+
+
+@receiver(cart_changed)
+def bulk_cart_changed(sender, customer_id, **kwargs):
+    stats.invalidate_customer(customer_id)
@@ -395,6 +395,7 @@ function displayBusinesses(businesses) {
         // Get first listing image if available
         const firstProduct = business.products && business.products.length > 0 ? business.products[0] : null;
         const businessImage = firstProduct && firstProduct.image ? firstProduct.image : null;
+        const businessImageSrcset = businessImage && firstProduct.image_srcset ? firstProduct.image_srcset : '';
         
         // Create popup content with link to business public page
         // CHANGED: Use business_id instead of owner_id
@@ -402,6 +403,7 @@ function displayBusinesses(businesses) {
             <div class="business-popup" style="min-width: 240px; max-width: 300px;">
                 ${businessImage ? `
                     <img src="${businessImage}" 
+                         ${businessImageSrcset ? `srcset="${businessImageSrcset}" sizes="300px"` : ''}
                          alt="${business.owner_name}" 
                          style="width: 100%; height: 140px; object-fit: cover; border-radius: 8px; margin-bottom: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
                 ` : ''}
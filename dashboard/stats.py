@@ -0,0 +1,97 @@
+# File location: dashboard/stats.py
+
+"""
+Per-customer dashboard numbers: items in cart, cart subtotal, total spent.
+
+`customer_stats` answers all of them with one query and caches the result
+per user for CACHE_TIMEOUT seconds, so dashboard-stats.js polling is served
+from the cache. dashboard/signals.py drops the entry whenever an order
+changes or a write path sends market.signals.cart_changed.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from market.models import CartItem, Order
+from users.models import CustomerProfile
+
+CACHE_TIMEOUT = 300
+
+EMPTY_STATS = {
+    'total_cart_items': 0,
+    'total_spent': 0.0,
+    'cart_subtotal': 0.0,
+    'favorites_count': 0,
+}
+
+
+def cache_key(user_id):
+    return f"dashboard:stats:{user_id}"
+
+
+def _total(queryset, expression):
+    """Correlated SUM(expression) over queryset for the outer customer, 0 when empty."""
+    summed = (
+        queryset.order_by()
+        .annotate(_group=Value(1))
+        .values('_group')
+        .annotate(total=Sum(expression))
+        .values('total')
+    )
+    return Coalesce(Subquery(summed, output_field=IntegerField()), 0)
+
+
+def compute_stats(user_id):
+    """Read the dashboard numbers for user_id straight from the database (one query)."""
+    row = (
+        CustomerProfile.objects.filter(user_id=user_id)
+        .annotate(
+            cart_items=_total(CartItem.objects.filter(cart__customer=OuterRef('pk')), 'quantity'),
+            cart_cents=_total(
+                CartItem.objects.filter(cart__customer=OuterRef('pk')),
+                F('unit_price_cents') * F('quantity'),
+            ),
+            spent_cents=_total(
+                Order.objects.filter(customer=OuterRef('pk'), total_cents__isnull=False),
+                'total_cents',
+            ),
+        )
+        .values('cart_items', 'cart_cents', 'spent_cents')
+        .first()
+    )
+    if row is None:
+        # User doesn't have a customer profile yet
+        return dict(EMPTY_STATS)
+    return {
+        'total_cart_items': row['cart_items'],
+        'total_spent': round(row['spent_cents'] / 100, 2),
+        'cart_subtotal': round(row['cart_cents'] / 100, 2),
+        'favorites_count': 0,
+    }
+
+
+def customer_stats(user):
+    """Dashboard numbers for user, from the cache when possible."""
+    key = cache_key(user.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats(user.pk)
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate(user_id):
+    """
+    Drop user_id's cached stats now and again once the current transaction
+    commits, so a read that lands mid-transaction can't re-cache old numbers.
+    """
+    key = cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_customer(customer_id):
+    user_id = CustomerProfile.objects.filter(pk=customer_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate(user_id)
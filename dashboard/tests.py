@@ -0,0 +1,739 @@
+# dashboard/tests.py
+
+import io
+import json
+import gzip
+import os
+import random
+import runpy
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+
+from business import geocoding
+from business.models import Bid, GeocodeCache, Listing, Product, ZipCodeCentroid
+from market import checkout
+from market.models import Bag, Cart, CartItem, Order
+from users.models import BusinessRegistration, CustomerProfile, VendorProfile
+
+from . import distance, metrics, seed, stats
+from .distance import calculate_distance, calculate_distances
+
+User = get_user_model()
+
+CHICAGO = (41.8781, -87.6298)
+
+# For tests that render {% static %} without running collectstatic first, so
+# there's no manifest for config.storage.StaticFilesStorage to read
+UNHASHED_STATIC = override_settings(STORAGES={
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+
+
+def make_business(index):
+    owner = User.objects.create_user(username=f"biz{index}")
+    BusinessRegistration.objects.create(
+        user=owner,
+        name=f"Business {index}",
+        business_type="bakery",
+        address=f"{index} Main St, Chicago, IL",
+        phone_number="3125550100",
+        email=f"biz{index}@example.com",
+        owner_name=f"Owner {index}",
+    )
+    return owner
+
+
+def make_product(owner, lat_offset=0.0, **kwargs):
+    defaults = {
+        "owner": owner,
+        "title": "Bagels",
+        "base_price": Decimal("6.00"),
+        "quantity": 3,
+        "status": "listed",
+        "latitude": Decimal(f"{CHICAGO[0] + lat_offset:.6f}"),
+        "longitude": Decimal(f"{CHICAGO[1]:.6f}"),
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class DistanceTests(TestCase):
+
+    def test_known_distances(self):
+        # Chicago to New York, and one degree of latitude on a 6371 km sphere
+        self.assertAlmostEqual(calculate_distance(41.8781, -87.6298, 40.7128, -74.0060), 1144.29, places=2)
+        self.assertAlmostEqual(calculate_distance(0, 0, 1, 0), 111.195, places=3)
+        self.assertAlmostEqual(calculate_distance(0, 179.9, 0, -179.9), calculate_distance(0, 0, 0, 0.2), places=9)
+
+    @unittest.skipIf(distance.np is None, "NumPy isn't installed")
+    def test_numpy_and_python_paths_agree(self):
+        rng = random.Random(3)
+        latitudes = [Decimal(f"{rng.uniform(-90, 90):.6f}") for _ in range(500)] + [CHICAGO[0], -CHICAGO[0]]
+        longitudes = [Decimal(f"{rng.uniform(-180, 180):.6f}") for _ in range(500)] + [CHICAGO[1], CHICAGO[1] + 180]
+
+        vectorized = calculate_distances(*CHICAGO, latitudes, longitudes)
+        looped = calculate_distances(*CHICAGO, latitudes, longitudes, use_numpy=False)
+
+        self.assertEqual(len(vectorized), len(looped))
+        for fast, slow, lat, lng in zip(vectorized, looped, latitudes, longitudes):
+            self.assertAlmostEqual(float(fast), slow, places=6)
+            self.assertAlmostEqual(slow, calculate_distance(*CHICAGO, float(lat), float(lng)), places=6)
+
+
+class NearbyBusinessesTests(TestCase):
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username="shopper")
+        self.client.force_login(self.customer)
+        self.url = reverse("dashboard:get_nearby_businesses")
+        self.params = {"lat": CHICAGO[0], "lng": CHICAGO[1], "radius": 10}
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.json()
+
+    def test_groups_products_by_business(self):
+        near = make_business(1)
+        far = make_business(2)
+        make_product(near, lat_offset=0.01)
+        make_product(near, lat_offset=0.02)
+        make_product(far, lat_offset=0.05)
+        make_product(far, lat_offset=5)  # well outside the radius
+
+        _, data = self._count_queries()
+
+        self.assertEqual(data["count"], 2)
+        first, second = data["businesses"]
+        self.assertEqual(first["business_id"], near.business.id)
+        self.assertEqual(first["product_count"], 2)
+        self.assertEqual(len(first["products"]), 2)
+        self.assertAlmostEqual(first["distance"], 1.11, places=2)
+        self.assertEqual(second["business_id"], far.business.id)
+        self.assertEqual(second["product_count"], 1)
+
+    def test_skips_owners_without_business_registration(self):
+        plain_user = User.objects.create_user(username="nobiz")
+        make_product(plain_user)
+
+        _, data = self._count_queries()
+
+        self.assertEqual(data["count"], 0)
+
+    def test_query_count_is_constant(self):
+        owner = make_business(0)
+        make_product(owner)
+        baseline, _ = self._count_queries()
+
+        for index in range(1, 20):
+            owner = make_business(index)
+            for offset in range(3):
+                make_product(owner, lat_offset=offset * 0.001)
+
+        queries, data = self._count_queries()
+
+        self.assertEqual(data["count"], 20)
+        self.assertEqual(queries, baseline)
+
+
+class GeocodeZipcodeTests(TestCase):
+
+    def setUp(self):
+        geocoding.clear_memory_cache()
+        self.client.force_login(User.objects.create_user(username="shopper"))
+        self.url = reverse("dashboard:geocode_zipcode")
+
+    def test_gazetteer_answers_without_network(self):
+        ZipCodeCentroid.objects.create(
+            zip_code="60601", latitude=Decimal("41.885500"), longitude=Decimal("-87.621800"),
+            city="Chicago", state="IL",
+        )
+
+        with mock.patch("business.geocoding.requests.get", side_effect=AssertionError("network used")):
+            response = self.client.post(self.url, {"zip_code": "60601-1234"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["latitude"], 41.8855)
+        self.assertEqual(response.json()["display_name"], "Chicago, IL 60601")
+
+    def test_unknown_zip_is_negatively_cached(self):
+        empty = mock.Mock(status_code=200, json=mock.Mock(return_value=[]))
+        with mock.patch("business.geocoding.requests.get", return_value=empty) as get:
+            first = self.client.post(self.url, {"zip_code": "00000"})
+            geocoding.clear_memory_cache()
+            second = self.client.post(self.url, {"zip_code": "00000"})
+
+        self.assertEqual(first.status_code, 404)
+        self.assertEqual(second.status_code, 404)
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(GeocodeCache.objects.filter(kind="zip", query="00000", found=False).exists())
+
+    def test_nominatim_outage_is_not_a_missing_zip(self):
+        with mock.patch("business.geocoding.requests.get", side_effect=requests.Timeout("read timed out")):
+            response = self.client.post(self.url, {"zip_code": "60601"})
+            with self.assertRaises(geocoding.GeocoderUnavailable):
+                geocoding.geocode_address("1 Main St, Chicago, IL")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["success"])
+        # Nothing was cached, so the next request tries Nominatim again
+        self.assertFalse(GeocodeCache.objects.exists())
+        found = mock.Mock(status_code=200, json=mock.Mock(return_value=[
+            {"lat": "41.8855", "lon": "-87.6218", "display_name": "Chicago, IL 60601"},
+        ]))
+        with mock.patch("business.geocoding.requests.get", return_value=found):
+            self.assertEqual(self.client.post(self.url, {"zip_code": "60601"}).status_code, 200)
+
+
+class BusinessGeocodeTests(TestCase):
+    """BusinessRegistration address changes and the background geocode they trigger."""
+
+    LOCATION = {
+        "latitude": 41.885512, "longitude": -87.621834, "address": "1 Main St, Chicago, IL 60601",
+        "city": "Chicago", "state": "IL", "zip_code": "60601", "display_name": "1 Main St",
+    }
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        # TestCase never commits, so no geocoding thread starts unless a test runs the callbacks
+        self.business = BusinessRegistration.objects.create(
+            user=self.owner, name="Corner Bakery", business_type="bakery", address="1 Main St, Chicago, IL",
+            phone_number="3125550100", email="baker@example.com", owner_name="Baker",
+        )
+        BusinessRegistration.objects.filter(pk=self.business.pk).update(
+            latitude=Decimal("41.885512"), longitude=Decimal("-87.621834"), geocoded_at=timezone.now(),
+        )
+
+    def fresh(self, *fields):
+        queryset = BusinessRegistration.objects.only(*fields) if fields else BusinessRegistration.objects
+        return queryset.get(pk=self.business.pk)
+
+    def test_new_address_is_geocoded_after_commit(self):
+        with mock.patch.object(geocoding.threading, "Thread") as thread:
+            with self.captureOnCommitCallbacks() as callbacks:
+                business = BusinessRegistration.objects.create(
+                    name="Rye House", business_type="bakery", address="2 Main St, Chicago, IL",
+                    phone_number="3125550101", email="rye@example.com", owner_name="Rye",
+                )
+            thread.assert_not_called()
+            for callback in callbacks:
+                callback()
+        thread.assert_called_once_with(
+            target=geocoding._geocode_business_in_thread, args=(business.pk,), daemon=True
+        )
+
+    def test_address_change_clears_coordinates_and_regeocodes(self):
+        for address, update_fields in (("5 State St, Chicago, IL", None), ("7 State St, Chicago, IL", ["address"])):
+            business = self.fresh()
+            business.address = address
+            with mock.patch.object(geocoding.threading, "Thread") as thread:
+                with self.captureOnCommitCallbacks(execute=True):
+                    business.save(update_fields=update_fields)
+
+            thread.assert_called_once()
+            stored = self.fresh()
+            self.assertEqual((stored.latitude, stored.longitude, stored.geocoded_at), (None, None, None))
+            self.assertIsNone(stored.location())
+            BusinessRegistration.objects.filter(pk=business.pk).update(
+                latitude=Decimal("41.885512"), longitude=Decimal("-87.621834"), geocoded_at=timezone.now(),
+            )
+
+    def test_other_changes_keep_coordinates(self):
+        business = self.fresh()
+        business.name = "Corner Bakery & Cafe"
+        # Saving the same address again isn't a change either
+        business.address = business.address
+        with mock.patch.object(geocoding.threading, "Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                business.save()
+                # A deferred address was never loaded, so it can't have changed
+                deferred = self.fresh("name")
+                deferred.name = "Corner Bakery"
+                deferred.save()
+
+        thread.assert_not_called()
+        self.assertEqual(self.fresh().latitude, Decimal("41.885512"))
+
+    def test_geocode_copies_location_to_products_and_listings(self):
+        product = make_product(self.owner, latitude=None, longitude=None)
+        listing = Listing.objects.create(owner=self.owner, title="Rolls", price=Decimal("3.00"))
+        other = make_product(make_business(1))
+
+        with mock.patch.object(geocoding, "geocode_address", return_value=self.LOCATION):
+            self.assertTrue(geocoding.geocode_business(self.business.pk))
+
+        business = self.fresh()
+        self.assertEqual((business.latitude, business.longitude), (Decimal("41.885512"), Decimal("-87.621834")))
+        self.assertEqual((business.city, business.zip_code), ("Chicago", "60601"))
+        self.assertEqual(business.normalized_address, self.LOCATION["address"])
+        product.refresh_from_db()
+        listing.refresh_from_db()
+        for row in (product, listing):
+            self.assertEqual((row.latitude, row.longitude), (Decimal("41.885512"), Decimal("-87.621834")))
+            self.assertEqual(row.address, self.LOCATION["address"])
+        self.assertEqual(product.geohash, geocoding.encode_geohash(41.885512, -87.621834))
+        other.refresh_from_db()
+        self.assertEqual(other.latitude, Decimal(f"{CHICAGO[0]:.6f}"))
+
+    def test_address_changed_while_geocoding_keeps_the_newer_address(self):
+        def move(address):
+            BusinessRegistration.objects.filter(pk=self.business.pk).update(address="9 Elm St", latitude=None)
+            return self.LOCATION
+
+        with mock.patch.object(geocoding, "geocode_address", side_effect=move):
+            self.assertFalse(geocoding.geocode_business(self.business.pk))
+
+        self.assertIsNone(self.fresh().latitude)
+
+
+class DashboardStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.shopper = User.objects.create_user(username="shopper")
+        self.customer = CustomerProfile.objects.create(user=self.shopper)
+        self.cart = Cart.objects.create(customer=self.customer)
+        self.product = make_product(make_business(1), quantity=10)
+        # Stale price: the product now sells at 6.00
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2, unit_price_cents=500)
+        Order.objects.create(customer=self.customer, product=self.product, total_cents=1250)
+        Order.objects.create(customer=self.customer, product=self.product, total_cents=None)
+        self.url = reverse("dashboard:get_dashboard_stats")
+        self.client.force_login(self.shopper)
+
+    def fetch(self):
+        return self.client.get(self.url).json()["stats"]
+
+    def test_numbers_come_from_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            numbers = stats.compute_stats(self.shopper.pk)
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(numbers, {
+            "total_cart_items": 2,
+            "total_spent": 12.5,
+            "cart_subtotal": 10.0,
+            "favorites_count": 0,
+        })
+        self.assertEqual(stats.compute_stats(make_business(2).pk), stats.EMPTY_STATS)
+
+    def test_polling_is_served_from_cache(self):
+        self.fetch()
+        with CaptureQueriesContext(connection) as cold:
+            cache.clear()
+            self.fetch()
+        with CaptureQueriesContext(connection) as warm:
+            self.fetch()
+
+        self.assertEqual(len(warm), len(cold) - 1)
+
+    def test_cart_and_order_writes_invalidate(self):
+        self.assertEqual(self.fetch()["total_cart_items"], 2)
+        item = self.cart.items.get()
+
+        self.client.post(reverse("market:add_to_cart"), {"product_id": self.product.pk, "quantity": 1})
+        self.assertEqual(self.fetch()["total_cart_items"], 3)
+
+        self.client.post(reverse("market:update_cart_item", args=[item.pk]), {"quantity": 2})
+        self.assertEqual(self.fetch()["total_cart_items"], 2)
+
+        # Bulk paths: the cart page reprices lines with bulk_update...
+        CartItem.objects.filter(pk=item.pk).update(unit_price_cents=500)
+        cache.clear()
+        self.assertEqual(self.fetch()["cart_subtotal"], 10.0)
+        self.client.get(reverse("market:cart_detail"))
+        self.assertEqual(self.fetch()["cart_subtotal"], 12.0)
+
+        # ...and checkout bulk_creates orders
+        checkout.fulfill_cart(self.cart, "cs_test_1")
+        numbers = self.fetch()
+        self.assertEqual(numbers["total_cart_items"], 0)
+        self.assertEqual(numbers["total_spent"], 24.5)
+
+        self.client.post(reverse("market:add_to_cart"), {"product_id": self.product.pk, "quantity": 1})
+        self.assertEqual(self.fetch()["total_cart_items"], 1)
+        self.client.post(reverse("market:remove_cart_item", args=[self.cart.items.get().pk]))
+        self.assertEqual(self.fetch()["total_cart_items"], 0)
+
+    def test_clearing_a_cart_is_one_delete(self):
+        CartItem.objects.create(cart=self.cart, quantity=1, unit_price_cents=100, listing_title="Tea")
+
+        # No per-row signal receivers on CartItem, so Django can fast-delete
+        with self.assertNumQueries(1):
+            self.cart.items.all().delete()
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.customer = User.objects.create_user(username="shopper")
+        self.client.force_login(self.customer)
+        make_product(make_business(1), lat_offset=0.01)
+        self.url = reverse("dashboard:get_nearby_businesses")
+        self.params = {"lat": CHICAGO[0], "lng": CHICAGO[1], "radius": 10}
+
+    @override_settings(SERVER_TIMING=True)
+    def test_records_queries_per_view(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, self.params)
+
+        view = metrics.stats()["dashboard:get_nearby_businesses"]
+        self.assertEqual(view["request_sql_queries"]["count"], 1)
+        self.assertEqual(view["response_size_bytes"]["count"], 1)
+        # Session and user lookups in other middleware are counted too
+        self.assertIn(
+            f'lastbite_request_sql_queries_sum{{view="dashboard:get_nearby_businesses"}} {len(ctx)}\n',
+            metrics.render_prometheus(),
+        )
+        self.assertIn(f'desc="{len(ctx)} queries"', response["Server-Timing"])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        response = self.client.get(self.url, self.params)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_prometheus_endpoint_is_staff_only(self):
+        self.client.get(self.url, self.params)
+        metrics_url = reverse("dashboard:get_metrics")
+
+        self.assertEqual(self.client.get(metrics_url).status_code, 403)
+
+        self.customer.is_staff = True
+        self.customer.save()
+        response = self.client.get(metrics_url)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE lastbite_request_sql_queries histogram", body)
+        self.assertIn('lastbite_request_duration_seconds_count{view="dashboard:get_nearby_businesses"} 1', body)
+        self.assertIn('lastbite_request_sql_queries_bucket{view="dashboard:get_nearby_businesses",le="+Inf"} 1', body)
+        # Read from the database, so the same whichever process answers
+        self.assertIn("# TYPE lastbite_auction_settle_lag_seconds gauge", body)
+        self.assertIn("lastbite_auctions_awaiting_settlement 0\n", body)
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_prometheus_endpoint_accepts_token(self):
+        self.client.logout()
+        metrics_url = reverse("dashboard:get_metrics")
+
+        self.assertEqual(self.client.get(metrics_url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(metrics_url, HTTP_AUTHORIZATION="Bearer scrape-me").status_code, 200)
+        # Headers arrive latin-1 decoded, so they can hold non-ASCII characters
+        self.assertEqual(self.client.get(metrics_url, HTTP_AUTHORIZATION="Bearer scrapé-me").status_code, 403)
+
+    def test_histogram_quantiles(self):
+        histogram = metrics.Histogram((10, 20, 30))
+        for value in range(1, 31):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.quantile(0.5), 15)
+        self.assertEqual(histogram.quantile(1.0), 30)
+        self.assertIsNone(metrics.Histogram((1,)).quantile(0.5))
+
+
+@UNHASHED_STATIC
+class SeedDataTests(TestCase):
+
+    def _products(self, prefix):
+        return list(
+            Product.objects.filter(owner__username__startswith=f"{prefix}-")
+            .order_by("owner__username", "pk")
+            .values_list("title", "base_price", "quantity", "latitude", "bid_count")
+        )
+
+    def test_same_seed_gives_same_data(self):
+        first = seed.seed(businesses=3, products_per_business=4, seed=7, prefix="one")
+        second = seed.seed(businesses=3, products_per_business=4, seed=7, prefix="two")
+
+        self.assertEqual(first["products"], 12)
+        self.assertEqual({k: v for k, v in first.items() if not k.endswith("_ids")},
+                         {k: v for k, v in second.items() if not k.endswith("_ids")})
+        self.assertEqual(self._products("one"), self._products("two"))
+
+    def test_bid_columns_match_bid_rows(self):
+        data = seed.seed(businesses=3, products_per_business=10, seed=1)
+
+        for product in Product.objects.filter(pk__in=data["product_ids"], bid_count__gt=0):
+            bids = Bid.objects.filter(product=product)
+            self.assertEqual(product.bid_count, bids.count())
+            self.assertEqual(product.highest_bid_amount, max(bid.amount for bid in bids))
+
+    def test_flush_removes_seeded_rows(self):
+        seed.seed(businesses=2, products_per_business=2)
+        self.assertEqual(seed.flush(), 6)  # 2 businesses + 4 customers
+        self.assertFalse(Product.objects.exists())
+
+    def test_bench_suite_writes_results(self):
+        cache.set("unrelated", "kept")
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "results.json")
+            call_command(
+                "bench_suite", sizes=[2], products_per_business=3, repeat=1, output=output, yes=True,
+                stdout=io.StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+        targets = results["sizes"]["2"]["targets"]
+        self.assertIn("get_nearby_businesses", targets)
+        self.assertIn("checkout_fulfilment", targets)
+        self.assertGreater(targets["dynamic_pricing"]["queries"], 0)
+        # Everything seeded was rolled back
+        self.assertFalse(User.objects.filter(username__startswith="bench-").exists())
+        # Only the entries about the seeded rows were dropped, not the whole cache
+        self.assertEqual(cache.get("unrelated"), "kept")
+
+    def test_bench_suite_needs_debug_or_yes(self):
+        with self.assertRaisesMessage(CommandError, "pass --yes"):
+            call_command("bench_suite", sizes=[2], stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username__startswith="bench-").exists())
+
+
+@UNHASHED_STATIC
+class QueryBudgetTests(TestCase):
+    """
+    N+1 guard: renders every URL of the apps in NAMESPACES twice, with the
+    acting users owning SIZES[0] and then SIZES[1] of everything (products,
+    listings, bids, orders, cart lines) on top of seeded background data,
+    and fails when a view's query count grows with the data or goes over
+    its budget in query_budgets.json. Every URL needs an entry there:
+
+        "app:name": {"as": "customer" | "owner" | "staff" | "anonymous",
+                     "kwargs": {"pk": "@product"},   # @name = fixture object id
+                     "query": {"page": 1}, "status": 200, "max_queries": 9}
+        "app:name": {"skip": "why it can't be rendered with a GET"}
+    """
+
+    NAMESPACES = ("business", "market", "dashboard", "users")
+    BUDGET_FILE = Path(__file__).with_name("query_budgets.json")
+    SIZES = (2, 6)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username="budget-owner")
+        Group.objects.get_or_create(name="BUSINESS")[0].user_set.add(cls.owner)
+        cls.business = BusinessRegistration.objects.create(
+            user=cls.owner,
+            name="Budget Bakery",
+            business_type="bakery",
+            address="1 Main St, Chicago, IL",
+            phone_number="3125550100",
+            email="budget@example.com",
+            owner_name="Owner",
+        )
+        BusinessRegistration.objects.filter(pk=cls.business.pk).update(
+            latitude=Decimal(str(CHICAGO[0])), longitude=Decimal(str(CHICAGO[1])),
+        )
+        cls.customer = User.objects.create_user(username="budget-customer")
+        cls.profile = CustomerProfile.objects.create(user=cls.customer)
+        cls.cart = Cart.objects.create(customer=cls.profile)
+        cls.bidder = User.objects.create_user(username="budget-bidder")
+        cls.staff = User.objects.create_user(username="budget-staff", is_staff=True)
+        vendor_user = User.objects.create_user(username="budget-vendor")
+        cls.vendor = VendorProfile.objects.create(user=vendor_user, business_name="Vendor", address="2 Main St")
+
+    def _grow(self, total):
+        """Bring everything the acting users own up to total of each, plus background data."""
+        now = timezone.now()
+        seed.seed(businesses=total, products_per_business=3, prefix=f"budget{total}")
+        for i in range(Product.objects.filter(owner=self.owner).count(), total):
+            product = make_product(
+                self.owner, lat_offset=0.001 * i, title=f"Budget product {i}",
+                enable_bidding=True, min_price=Decimal("2.00"), end_time=now + timedelta(hours=3),
+            )
+            Bid.objects.create(product=product, bidder=self.customer, amount=Decimal("3.00"))
+            Bid.objects.create(product=product, bidder=self.bidder, amount=Decimal("3.50"))
+            Listing.objects.create(owner=self.owner, title=f"Budget listing {i}", price=Decimal("4.00"))
+            bag = Bag.objects.create(
+                vendor=self.vendor, title=f"Budget bag {i}", base_price_cents=500, current_price_cents=400,
+                ready_after=now, pickup_by=now + timedelta(hours=2),
+            )
+            CartItem.objects.create(cart=self.cart, product=product, unit_price_cents=600, quantity=1)
+            Order.objects.create(customer=self.profile, product=product, total_cents=600, stripe_session_id="cs_budget")
+            Order.objects.create(customer=self.profile, bag=bag, total_cents=400)
+
+    def _fixtures(self):
+        return {
+            "product": Product.objects.filter(owner=self.owner).order_by("pk").first().pk,
+            "listing": Listing.objects.filter(owner=self.owner).order_by("pk").first().pk,
+            "business": self.business.pk,
+            "cart_item": CartItem.objects.filter(cart=self.cart).order_by("pk").first().pk,
+        }
+
+    def _url_names(self):
+        resolver = get_resolver()
+        names = set()
+        for namespace in self.NAMESPACES:
+            for pattern in resolver.namespace_dict[namespace][1].url_patterns:
+                if isinstance(pattern, URLPattern) and pattern.name:
+                    names.add(f"{namespace}:{pattern.name}")
+        return names
+
+    def _count(self, name, budget, fixtures):
+        kwargs = {
+            key: fixtures[value[1:]] if isinstance(value, str) and value.startswith("@") else value
+            for key, value in budget.get("kwargs", {}).items()
+        }
+        self.client.logout()
+        user = {"customer": self.customer, "owner": self.owner, "staff": self.staff}.get(budget.get("as", "anonymous"))
+        if user is not None:
+            self.client.force_login(user)
+        # Cached pages would hide what the view itself costs
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name, kwargs=kwargs), budget.get("query", {}))
+        self.assertEqual(response.status_code, budget.get("status", 200), f"{name} answered {response.status_code}")
+        return len(ctx)
+
+    def test_views_stay_within_query_budgets(self):
+        with open(self.BUDGET_FILE) as f:
+            budgets = json.load(f)
+        names = self._url_names()
+        self.assertEqual(sorted(names - budgets.keys()), [], f"URLs missing from {self.BUDGET_FILE.name}")
+        self.assertEqual(sorted(budgets.keys() - names), [], f"{self.BUDGET_FILE.name} lists unknown URLs")
+        measured = {name: budget for name, budget in budgets.items() if "skip" not in budget}
+
+        counts = {}
+        for size in self.SIZES:
+            self._grow(size)
+            fixtures = self._fixtures()
+            for name, budget in measured.items():
+                counts.setdefault(name, []).append(self._count(name, budget, fixtures))
+
+        for name, budget in measured.items():
+            small, large = counts[name]
+            with self.subTest(view=name):
+                self.assertEqual(
+                    large, small,
+                    f"{name} ran {small} queries with {self.SIZES[0]} rows each and {large} with {self.SIZES[1]}",
+                )
+                self.assertLessEqual(large, budget["max_queries"], f"{name} is over its query budget")
+
+
+class StaticFilesTests(TestCase):
+    ASSET = "dashboard/js/dashboard.js"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=cls.static_root,
+            WHITENOISE_AUTOREFRESH=False,
+            STORAGES={**settings.STORAGES, "staticfiles": {"BACKEND": "config.storage.StaticFilesStorage"}},
+        ))
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def setUp(self):
+        # WhiteNoise indexes STATIC_ROOT when the middleware is built, so use a fresh client
+        self.client = Client()
+        self.url = staticfiles_storage.url(self.ASSET)
+        with open(Path(__file__).parent / "static" / self.ASSET, "rb") as f:
+            self.source = f.read()
+
+    def get(self, url, encoding=None):
+        headers = {"accept-encoding": encoding} if encoding else {}
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertRegex(self.url, r"^/static/dashboard/js/dashboard\.[0-9a-f]{12}\.js$")
+        hashed = Path(self.static_root) / self.url.removeprefix("/static/")
+        for suffix in ("", ".gz", ".br"):
+            self.assertTrue(hashed.with_name(hashed.name + suffix).exists(), suffix)
+
+    def test_files_missing_from_the_manifest_are_hashed_on_the_fly(self):
+        added = Path(self.static_root) / "dashboard" / "added-later.css"
+        added.write_text("body { color: black; }")
+        self.addCleanup(added.unlink)
+
+        self.assertRegex(staticfiles_storage.url("dashboard/added-later.css"), r"added-later\.[0-9a-f]{12}\.css$")
+
+    def test_files_missing_from_static_root_raise(self):
+        with self.assertRaises(ValueError):
+            staticfiles_storage.url("dashboard/never-collected.css")
+
+    def test_static_hits_stay_out_of_request_metrics(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.get(self.url)
+        self.assertEqual(metrics.stats(), {})
+
+    def test_hashed_files_are_cached_forever(self):
+        response, _ = self.get(self.url)
+        self.assertIn("max-age=315360000", response["Cache-Control"])
+        self.assertIn("immutable", response["Cache-Control"])
+
+        # The unhashed name still works, but isn't cached for long
+        response, _ = self.get(f"/static/{self.ASSET}")
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+    def test_encoding_is_negotiated(self):
+        response, body = self.get(self.url, "gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertLess(len(body), len(self.source))
+
+        response, body = self.get(self.url, "gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(body), self.source)
+
+        response, body = self.get(self.url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(body, self.source)
+
+
+class GunicornConfigTests(TestCase):
+    """config/gunicorn.conf.py keeps the workers' database connections under max_connections."""
+
+    CONFIG = Path(__file__).resolve().parent.parent / "config" / "gunicorn.conf.py"
+
+    def load(self, cpus=8, **env):
+        environ = {key: value for key, value in os.environ.items() if not key.startswith(("GUNICORN_", "DB_"))}
+        with mock.patch.dict(os.environ, {**environ, **env}, clear=True), \
+                mock.patch("multiprocessing.cpu_count", return_value=cpus):
+            return runpy.run_path(str(self.CONFIG))
+
+    def test_default_workers_fit_the_connection_budget(self):
+        config = self.load(cpus=8)
+        # 17 workers x (8 threads + 2) would be 170 connections; 90 fit
+        self.assertEqual(config["workers"], 9)
+        self.assertLessEqual(config["workers"] * config["connections_per_worker"], 90)
+
+        self.assertEqual(self.load(cpus=1)["workers"], 3)
+        self.assertEqual(self.load(cpus=8, DB_MAX_CONNECTIONS="300")["workers"], 17)
+
+    def test_pool_size_is_what_counts_with_a_pool(self):
+        config = self.load(cpus=8, DB_CONNECTION_STRATEGY="pool", DB_POOL_MAX_SIZE="4")
+        self.assertEqual(config["connections_per_worker"], 6)
+        self.assertEqual(config["workers"], 15)
+
+    def test_explicit_workers_over_budget_refuse_to_start(self):
+        self.assertEqual(self.load(GUNICORN_WORKERS="9")["workers"], 9)
+        with self.assertRaisesMessage(RuntimeError, "use at most 9 workers"):
+            self.load(GUNICORN_WORKERS="10")
+        with self.assertRaisesMessage(RuntimeError, "lower GUNICORN_THREADS"):
+            self.load(GUNICORN_THREADS="100")
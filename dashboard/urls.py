@@ -13,6 +13,8 @@ urlpatterns = [
     path('api/nearby-businesses/', views.get_nearby_businesses, name='get_nearby_businesses'),
     path('api/geocode-zipcode/', views.geocode_zipcode, name='geocode_zipcode'),
     path('api/stats/', views.get_dashboard_stats, name='get_dashboard_stats'),
+    path('api/geocode-stats/', views.get_geocode_stats, name='get_geocode_stats'),
+    path('api/metrics/', views.get_metrics, name='get_metrics'),
 
     path('product/<int:product_id>/', views.view_product, name='view_product'),
 ]
\ No newline at end of file
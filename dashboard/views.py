@@ -1,63 +1,28 @@
 # File location: dashboard/views.py
 
+import hmac
+
+from django.conf import settings
 from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.http import require_http_methods
+from business import auctions, geocoding, images
 from business.models import Listing, Product
-from users.models import BusinessRegistration, CustomerProfile
-from market.models import Order, Cart
+from users.models import BusinessRegistration
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Q, Sum
-import math
-import requests
+from django.db.models import Count, Min, Q
+from . import metrics, stats
+from .distance import calculate_distances
 
 User = get_user_model()
 
 @login_required
 def user_dashboard(request):
-    # Initialize default values
-    total_cart_items = 0  
-    total_spent = 0.0
-    cart_subtotal = 0.0
-    favorites_count = 0
-    
-    # Get customer profile if exists
-    try:
-        customer_profile = CustomerProfile.objects.get(user=request.user)
-        
-        # Get total items in cart (sum of all quantities)
-        # CHANGED: Count items in current cart instead of completed orders
-        try:
-            cart = Cart.objects.get(customer=customer_profile)
-            # Sum all quantities from cart items
-            total_cart_items = cart.items.aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            # Get cart subtotal
-            cart_subtotal = cart.total_cents() / 100  # Convert cents to dollars
-        except Cart.DoesNotExist:
-            total_cart_items = 0
-            cart_subtotal = 0.0
-        
-        # Get total amount spent (sum of all completed orders)
-        total_spent_cents = Order.objects.filter(
-            customer=customer_profile,
-            total_cents__isnull=False
-        ).aggregate(total=Sum('total_cents'))['total'] or 0
-        total_spent = total_spent_cents / 100  # Convert cents to dollars
-            
-    except CustomerProfile.DoesNotExist:
-        # User doesn't have a customer profile yet
-        pass
-    
     context = {
         'page_title': 'Dashboard - LastBite',
         'user': request.user,
-        'total_cart_items': total_cart_items,  
-        'total_spent': total_spent,
-        'cart_subtotal': cart_subtotal,
-        'favorites_count': favorites_count,
+        **stats.customer_stats(request.user),
     }
     return render(request, 'dashboard/user_dashboard.html', context)
 
@@ -76,23 +41,22 @@ def get_nearby_listings(request):
     except (TypeError, ValueError):
         return JsonResponse({'error': 'Invalid coordinates'}, status=400)
     
-    # Get all listings with location data
+    # Only candidates inside the radius's bounding box leave the database
     products = Product.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False,
         quantity__gt=0,  # Only show available items
         status="listed"
-    )
+    ).within_bounding_box(user_lat, user_lng, radius).select_related('owner')
     
+    products = list(products)
+    distances = calculate_distances(
+        user_lat, user_lng,
+        [product.latitude for product in products],
+        [product.longitude for product in products],
+    )
+
     nearby_products = []
-    
-    for product in products:
-        # Calculate distance using Haversine formula
-        distance = calculate_distance(
-            user_lat, user_lng, 
-            float(product.latitude), float(product.longitude)
-        )
-        
+
+    for product, distance in zip(products, distances):
         if distance <= radius:
             nearby_products.append({
                 'id': product.id,
@@ -100,14 +64,15 @@ def get_nearby_listings(request):
                 'price': str(product.base_price),
                 'quantity': product.quantity,
                 'notes': product.description or product.notes or '',
-                'image': product.image.url if product.image else None,
+                'image': images.variant_url(product.image, product.image_variants),
+                'image_srcset': images.srcset(product.image, product.image_variants),
                 'address': product.address,
                 'city': product.city,
                 'state': product.state,
                 'zip_code': product.zip_code,
                 'latitude': float(product.latitude),
                 'longitude': float(product.longitude),
-                'distance': round(distance, 2),
+                'distance': round(float(distance), 2),
                 'owner_name': product.owner.get_full_name() or product.owner.username
             })
     
@@ -135,82 +100,81 @@ def get_nearby_businesses(request):
     except (TypeError, ValueError):
         return JsonResponse({'error': 'Invalid coordinates'}, status=400)
     
-    # Get all listings with location data and available quantity
-    products = Product.objects.filter(
-        latitude__isnull=False,
-        longitude__isnull=False,
-        quantity__gt=0,
-        status="listed"
-    ).select_related('owner')
-    
-    # Group listings by owner and calculate distances
-    businesses_dict = {}
-    
-    for product in products:
-        # Calculate distance
-        distance = calculate_distance(
-            user_lat, user_lng,
-            float(product.latitude), float(product.longitude)
+    # Products in range whose owner has a business registration.
+    # Distance is computed in SQL so grouping can happen in the database.
+    products = (
+        Product.objects.filter(
+            quantity__gt=0,
+            status="listed",
+            owner__business__isnull=False,
         )
-        
-        # Only include if within radius
-        if distance <= radius:
-            owner_id = product.owner.id
-            
-            # Get BusinessRegistration ID for this owner
-            business_registration = BusinessRegistration.objects.filter(user=product.owner).first()
-            business_reg_id = business_registration.id if business_registration else None
-            
-            # Skip if no business registration found
-            if not business_reg_id:
-                continue
-            
-            # Initialize business entry if not exists
-            if owner_id not in businesses_dict:
-                # Use the first listing's location as the business location
-                businesses_dict[owner_id] = {
-                    'owner_id': owner_id,
-                    'business_id': business_reg_id,
-                    'owner_name': product.owner.get_full_name() or product.owner.username,
-                    'owner_username': product.owner.username,
-                    'latitude': float(product.latitude),
-                    'longitude': float(product.longitude),
-                    'address': product.address,
-                    'city': product.city,
-                    'state': product.state,
-                    'zip_code': product.zip_code,
-                    'distance': distance,
-                    'product_count': 0,
-                    'products': []
-                }
-            
-            # Add listing to this business
-            businesses_dict[owner_id]['product_count'] += 1
-            businesses_dict[owner_id]['products'].append({
-                'id': product.id,
-                'title': product.title,
-                'price': str(product.base_price),
-                'image': product.image.url if product.image else None,
-            })
-            
-            # Update distance if this listing is closer
-            if distance < businesses_dict[owner_id]['distance']:
-                businesses_dict[owner_id]['distance'] = distance
-                businesses_dict[owner_id]['latitude'] = float(product.latitude)
-                businesses_dict[owner_id]['longitude'] = float(product.longitude)
-                businesses_dict[owner_id]['address'] = product.address
-                businesses_dict[owner_id]['city'] = product.city
-                businesses_dict[owner_id]['state'] = product.state
-                businesses_dict[owner_id]['zip_code'] = product.zip_code
-    
-    # Convert to list and sort by distance
+        .within_bounding_box(user_lat, user_lng, radius)
+        .with_distance(user_lat, user_lng)
+        .filter(distance__lte=radius)
+    )
+
+    # One row per owner: closest product distance and product count
+    summaries = (
+        products.order_by()
+        .values(
+            'owner_id',
+            'owner__business__id',
+            'owner__username',
+            'owner__first_name',
+            'owner__last_name',
+        )
+        .annotate(min_distance=Min('distance'), product_count=Count('id'))
+        .order_by('min_distance')
+    )
+
+    businesses_dict = {}
+    for row in summaries:
+        full_name = f"{row['owner__first_name']} {row['owner__last_name']}".strip()
+        businesses_dict[row['owner_id']] = {
+            'owner_id': row['owner_id'],
+            'business_id': row['owner__business__id'],
+            'owner_name': full_name or row['owner__username'],
+            'owner_username': row['owner__username'],
+            'latitude': None,
+            'longitude': None,
+            'address': '',
+            'city': '',
+            'state': '',
+            'zip_code': '',
+            'distance': round(row['min_distance'], 2),
+            'product_count': row['product_count'],
+            'products': []
+        }
+
+    # Product cards, closest first, so the first product seen for an owner
+    # gives the business its map location
+    product_rows = products.order_by('distance', 'id').only(
+        'id', 'owner_id', 'title', 'base_price', 'image', 'image_variants',
+        'latitude', 'longitude', 'address', 'city', 'state', 'zip_code',
+    )
+    for product in product_rows:
+        business = businesses_dict.get(product.owner_id)
+        if business is None:
+            continue
+
+        if not business['products']:
+            business['latitude'] = float(product.latitude)
+            business['longitude'] = float(product.longitude)
+            business['address'] = product.address
+            business['city'] = product.city
+            business['state'] = product.state
+            business['zip_code'] = product.zip_code
+
+        business['products'].append({
+            'id': product.id,
+            'title': product.title,
+            'price': str(product.base_price),
+            'image': images.variant_url(product.image, product.image_variants),
+            'image_srcset': images.srcset(product.image, product.image_variants),
+        })
+
     businesses_list = list(businesses_dict.values())
-    businesses_list.sort(key=lambda x: x['distance'])
-    
-    # Round distances
-    for business in businesses_list:
-        business['distance'] = round(business['distance'], 2)
-    
+
     return JsonResponse({
         'success': True,
         'count': len(businesses_list),
@@ -218,26 +182,6 @@ def get_nearby_businesses(request):
     })
 
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate distance between two coordinates using Haversine formula
-    Returns distance in kilometers
-    """
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(delta_lat / 2) ** 2 +
-         math.cos(lat1_rad) * math.cos(lat2_rad) *
-         math.sin(delta_lon / 2) ** 2)
-    c = 2 * math.asin(math.sqrt(a))
-    
-    return R * c
-
-
 @login_required
 @require_http_methods(["POST"])
 def geocode_zipcode(request):
@@ -249,40 +193,66 @@ def geocode_zipcode(request):
     if not zip_code:
         return JsonResponse({'error': 'Zip code required'}, status=400)
     
-    # Use Nominatim API (free, no API key needed)
-    url = f"https://nominatim.openstreetmap.org/search"
-    params = {
-        'postalcode': zip_code,
-        'country': 'US',  # Adjust if needed
-        'format': 'json',
-        'limit': 1
-    }
-    headers = {
-        'User-Agent': 'LastBite-App/1.0'  # Required by Nominatim
-    }
-    
+    # Offline gazetteer first, then the geocode cache, then Nominatim
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        data = response.json()
-        
-        if data and len(data) > 0:
-            return JsonResponse({
-                'success': True,
-                'latitude': float(data[0]['lat']),
-                'longitude': float(data[0]['lon']),
-                'display_name': data[0].get('display_name', '')
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'error': 'Zip code not found'
-            }, status=404)
-    
-    except Exception as e:
+        location = geocoding.geocode_zipcode(zip_code)
+    except geocoding.GeocoderUnavailable:
         return JsonResponse({
             'success': False,
-            'error': f'Geocoding failed: {str(e)}'
-        }, status=500)
+            'error': 'Location lookup is unavailable right now, please try again shortly'
+        }, status=503)
+
+    if location:
+        return JsonResponse({
+            'success': True,
+            'latitude': location['latitude'],
+            'longitude': location['longitude'],
+            'display_name': location['display_name']
+        })
+
+    return JsonResponse({
+        'success': False,
+        'error': 'Zip code not found'
+    }, status=404)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_http_methods(["GET"])
+def get_geocode_stats(request):
+    """
+    Geocoding cache hit/miss counters for this worker process (staff only)
+    """
+    return JsonResponse({
+        'success': True,
+        'stats': geocoding.stats()
+    })
+
+
+@require_http_methods(["GET"])
+def get_metrics(request):
+    """
+    Per-view request metrics of this worker process, plus the auction
+    settlement backlog from the database, in Prometheus text format.
+    Staff only; a scraper can instead send "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    allowed = request.user.is_authenticated and request.user.is_staff
+    if not allowed and settings.METRICS_TOKEN:
+        # compare_digest only takes ASCII str, so compare bytes
+        allowed = hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+        )
+    if not allowed:
+        return HttpResponseForbidden()
+    backlog = auctions.backlog()
+    gauges = {
+        'lastbite_auctions_awaiting_settlement': ("Auctions past end_time not settled yet", backlog['due']),
+        'lastbite_auction_settle_lag_seconds': (
+            "Seconds since the oldest unsettled auction ended", backlog['oldest_lag_seconds']
+        ),
+    }
+    body = metrics.render_prometheus() + metrics.render_gauges(gauges)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @login_required
@@ -291,42 +261,11 @@ def get_dashboard_stats(request):
     """
     API endpoint to get real-time dashboard statistics
     Returns: JSON with total_cart_items, total_spent, cart_subtotal, favorites_count
+    Served from the per-customer cache (see dashboard/stats.py).
     """
-    stats = {
-        'total_cart_items': 0, 
-        'total_spent': 0.0,
-        'cart_subtotal': 0.0,
-        'favorites_count': 0,
-    }
-    
-    try:
-        customer_profile = CustomerProfile.objects.get(user=request.user)
-        
-        # Total items in cart (sum of quantities)
-        # CHANGED: Count cart items instead of orders
-        try:
-            cart = Cart.objects.get(customer=customer_profile)
-            stats['total_cart_items'] = cart.items.aggregate(
-                total=Sum('quantity')
-            )['total'] or 0
-            stats['cart_subtotal'] = round(cart.total_cents() / 100, 2)
-        except Cart.DoesNotExist:
-            stats['total_cart_items'] = 0
-            stats['cart_subtotal'] = 0.0
-        
-        # Total spent
-        total_spent_cents = Order.objects.filter(
-            customer=customer_profile,
-            total_cents__isnull=False
-        ).aggregate(total=Sum('total_cents'))['total'] or 0
-        stats['total_spent'] = round(total_spent_cents / 100, 2)
-            
-    except CustomerProfile.DoesNotExist:
-        pass
-    
     return JsonResponse({
         'success': True,
-        'stats': stats
+        'stats': stats.customer_stats(request.user)
     })
     
 @login_required
@@ -20,7 +20,22 @@ else:
     raise SystemExit("Database never became ready.")
 PY
 
-# Run migrations & launch dev server
+# Run migrations & launch the server
 python manage.py migrate --noinput
-python manage.py collectstatic --noinput || true
-exec python manage.py runserver 0.0.0.0:8000
+
+# SERVER_MODE=gunicorn for production serving; settings in config/gunicorn.conf.py
+case "${SERVER_MODE:-dev}" in
+  gunicorn)
+    # {% static %} needs the manifest, so a failed collectstatic must stop the deploy
+    python manage.py collectstatic --noinput
+    exec gunicorn --config config/gunicorn.conf.py
+    ;;
+  dev)
+    python manage.py collectstatic --noinput || true
+    exec python manage.py runserver 0.0.0.0:8000
+    ;;
+  *)
+    echo "Unknown SERVER_MODE '${SERVER_MODE}' (expected dev or gunicorn)" >&2
+    exit 1
+    ;;
+esac
@@ -0,0 +1,184 @@
+# File location: market/checkout.py
+
+"""
+Checkout fulfilment: turn a paid cart into orders.
+
+When a Checkout Session is created, `save_pending_checkout` records the
+cart lines it charges for; the webhook worker fulfils from that copy.
+
+`fulfill_cart` runs in one transaction. It locks the cart, then every
+product paid for (ordered by id, so two checkouts sharing products always
+lock in the same order and can't deadlock), decrements stock with a
+single UPDATE, bulk-creates the orders and takes the paid lines out of
+the cart. Two shoppers paying for the last unit at the same moment are
+serialized on the product row lock; the second one sees the decremented
+quantity. Units held by other carts' unexpired reservations are not for
+sale. The cart's stock reservations (market/reservations.py) are
+released once the stock is sold.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from business.models import Product
+from business.signals import products_changed
+from . import reservations
+from .models import Bag, Cart, CartItem, Order, PendingCheckout, Reservation
+from .signals import cart_changed
+
+# item is the Product or Bag that ran out (None once deleted); total_cents is what the line was charged
+Shortage = namedtuple("Shortage", "item requested available total_cents")
+
+
+def cart_lines(cart):
+    """The cart's lines as plain dicts, the form PendingCheckout.lines stores them in."""
+    return [
+        {
+            'product_id': item.product_id,
+            'bag_id': item.bag_id,
+            'listing_id': item.listing_id,
+            'unit_price_cents': item.unit_price_cents,
+            'quantity': item.quantity,
+        }
+        for item in cart.items.order_by('pk')
+    ]
+
+
+def _line_total(line):
+    return line['unit_price_cents'] * line['quantity']
+
+
+def save_pending_checkout(cart, session_id):
+    """Record what the Checkout Session session_id charges for (the cart as it is now)."""
+    lines = cart_lines(cart)
+    return PendingCheckout.objects.create(
+        stripe_session_id=session_id,
+        customer_id=cart.customer_id,
+        lines=lines,
+        amount_total_cents=sum(_line_total(line) for line in lines),
+    )
+
+
+def fulfill_cart(cart, session_id, payment_intent_id=None, lines=None):
+    """
+    Create orders for the lines paid for in session_id that are still in
+    stock. lines defaults to the cart's current contents; the webhook
+    passes the ones saved when the session was created. Lines asking for
+    more than is left are skipped and reported. The paid lines are then
+    taken out of the cart, leaving anything added since.
+    Returns (orders, shortages); orders is empty if session_id was
+    already fulfilled.
+    """
+    with transaction.atomic():
+        # Serializes repeat calls for the same cart (e.g. a reloaded success page)
+        Cart.objects.select_for_update().get(pk=cart.pk)
+        if lines is None:
+            lines = cart_lines(cart)
+        if Order.objects.filter(stripe_session_id=session_id).exists():
+            _remove_paid_lines(cart, lines)
+            return [], []
+
+        product_ids = sorted({line['product_id'] for line in lines if line['product_id']})
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+        }
+        # Other carts' unexpired holds come off the stock, even if this cart's own hold has lapsed
+        held = reservations.reserved_quantities(product_ids, exclude_cart=cart)
+        bags = Bag.objects.in_bulk([line['bag_id'] for line in lines if line['bag_id']])
+
+        orders = []
+        shortages = []
+        decrements = {}
+        bag_ids = []
+        for line in lines:
+            quantity = line['quantity']
+            if line['product_id']:
+                product = products.get(line['product_id'])
+                if product is None:
+                    # Deleted since it was paid for
+                    shortages.append(Shortage(None, quantity, 0, _line_total(line)))
+                    continue
+                available = product.quantity - held.get(product.pk, 0) - decrements.get(product.pk, 0)
+                # Ensure don't oversell
+                if quantity > available:
+                    shortages.append(Shortage(product, quantity, available, _line_total(line)))
+                    continue
+                decrements[product.pk] = decrements.get(product.pk, 0) + quantity
+            elif line['bag_id']:
+                bag = bags.get(line['bag_id'])
+                if bag is None or bag.status != 'listed' or bag.pk in bag_ids:
+                    shortages.append(Shortage(bag, quantity, 0, _line_total(line)))
+                    continue
+                bag_ids.append(bag.pk)
+            else:
+                continue
+
+            orders.append(Order(
+                product_id=line['product_id'],
+                bag_id=line['bag_id'],
+                customer_id=cart.customer_id,
+                status='reserved',
+                stripe_session_id=session_id,
+                payment_intent_id=payment_intent_id,
+                total_cents=_line_total(line),
+                quantity=quantity,
+            ))
+
+        if decrements:
+            amount = Case(
+                *[When(pk=pk, then=Value(quantity)) for pk, quantity in decrements.items()],
+                output_field=IntegerField(),
+            )
+            # SET expressions all see the pre-update row, so the status check
+            # compares the old quantity with the amount taken
+            Product.objects.filter(pk__in=decrements).update(
+                quantity=F('quantity') - amount,
+                status=Case(When(quantity__lte=amount, then=Value('sold')), default=F('status')),
+            )
+            products_changed.send(
+                sender=Product,
+                owner_ids={products[pk].owner_id for pk in decrements},
+            )
+        if bag_ids:
+            Bag.objects.filter(pk__in=bag_ids, status='listed').update(status='reserved')
+
+        orders = Order.objects.bulk_create(orders)
+        _remove_paid_lines(cart, lines)
+        cart_changed.send(sender=Order, customer_id=cart.customer_id)
+
+    return orders, shortages
+
+
+def _remove_paid_lines(cart, lines):
+    """
+    Take the paid quantities out of the cart and its stock holds. Lines
+    added or topped up after the session was created stay, along with
+    their share of the hold.
+    """
+    paid = {}
+    for line in lines:
+        key = (line['product_id'], line['bag_id'], line['listing_id'])
+        paid[key] = paid.get(key, 0) + line['quantity']
+
+    gone = []
+    for item in cart.items.order_by('pk'):
+        key = (item.product_id, item.bag_id, item.listing_id)
+        taken = min(paid.get(key, 0), item.quantity)
+        if not taken:
+            continue
+        paid[key] -= taken
+        if taken == item.quantity:
+            gone.append(item)
+        else:
+            item.quantity -= taken
+            item.save(update_fields=['quantity'])
+            if item.product_id:
+                Reservation.objects.filter(cart=cart, product_id=item.product_id).update(quantity=item.quantity)
+
+    if gone:
+        CartItem.objects.filter(pk__in=[item.pk for item in gone]).delete()
+        Reservation.objects.filter(
+            cart=cart, product_id__in=[item.product_id for item in gone if item.product_id]
+        ).delete()
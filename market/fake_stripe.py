@@ -0,0 +1,204 @@
+# File location: market/fake_stripe.py
+
+"""
+A small stand-in for the Stripe API, for offline runs and load tests.
+
+It implements just what the checkout flow uses:
+
+- POST /v1/checkout/sessions       create a session (stripe.checkout.Session.create)
+- GET  /v1/checkout/sessions/<id>  read it back
+- GET  /pay/<id>                   "pay" in a browser: marks the session paid,
+                                   delivers a signed checkout.session.completed
+                                   webhook, then redirects to success_url
+- POST /pay/<id>                   the same for scripts; answers with JSON
+
+Point the app at it with STRIPE_API_BASE=http://localhost:12111 and give
+both sides the same STRIPE_WEBHOOK_SECRET. `manage.py fake_stripe` runs it
+as a server; tests can start it on a free port with `FakeStripe().start()`.
+"""
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_PORT = 12111
+DEFAULT_WEBHOOK_SECRET = "whsec_fake"
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Stripe-Signature header for payload (str), as Stripe computes it."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def checkout_completed_event(session):
+    """A checkout.session.completed event wrapping session."""
+    return {
+        "id": f"evt_fake_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {"object": session},
+    }
+
+
+def post_webhook(url, secret):
+    """Webhook deliverer that POSTs signed events to url; returns the HTTP status."""
+    def deliver(event):
+        payload = json.dumps(event)
+        req = urlrequest.Request(url, data=payload.encode(), method="POST", headers={
+            "Content-Type": "application/json",
+            "Stripe-Signature": sign_payload(payload, secret),
+        })
+        try:
+            with urlrequest.urlopen(req, timeout=10) as response:
+                return response.status
+        except OSError as e:
+            return getattr(e, "code", 0)
+    return deliver
+
+
+def _unflatten(pairs):
+    """Turn Stripe's form encoding (line_items[0][quantity]=1) back into nested dicts/lists."""
+    data = {}
+    for key, value in pairs:
+        parts = re.findall(r"[^\[\]]+", key)
+        node = data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return _listify(data)
+
+
+def _listify(node):
+    if not isinstance(node, dict):
+        return node
+    if node and all(key.isdigit() for key in node):
+        return [_listify(node[key]) for key in sorted(node, key=int)]
+    return {key: _listify(value) for key, value in node.items()}
+
+
+class FakeStripe:
+    """
+    In-memory Stripe stand-in. deliver is called with each webhook event;
+    by default nothing is delivered (sessions are still marked paid).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, deliver=None):
+        self.sessions = {}
+        self.deliver = deliver
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create_session(self, params):
+        line_items = params.get("line_items", [])
+        session_id = f"cs_fake_{uuid.uuid4().hex}"
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "mode": params.get("mode", "payment"),
+            "status": "open",
+            "payment_status": "unpaid",
+            "payment_intent": None,
+            "client_reference_id": params.get("client_reference_id"),
+            "customer_email": params.get("customer_email"),
+            "success_url": params.get("success_url", ""),
+            "cancel_url": params.get("cancel_url", ""),
+            "amount_total": sum(
+                int(item.get("price_data", {}).get("unit_amount", 0)) * int(item.get("quantity", 1))
+                for item in line_items
+            ),
+            "currency": "usd",
+            "url": f"{self.url}/pay/{session_id}",
+        }
+        with self._lock:
+            self.sessions[session_id] = session
+        return session
+
+    def pay(self, session_id):
+        """Mark a session paid and deliver its webhook. Returns (session, delivery result)."""
+        with self._lock:
+            session = self.sessions[session_id]
+            if session["payment_status"] != "paid":
+                session.update(
+                    status="complete",
+                    payment_status="paid",
+                    payment_intent=f"pi_fake_{uuid.uuid4().hex}",
+                )
+            session = dict(session)
+        delivered = self.deliver(checkout_completed_event(session)) if self.deliver else None
+        return session, delivered
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _not_found(self):
+                self._json(404, {"error": {"type": "invalid_request_error", "message": "No such object"}})
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if match := re.fullmatch(r"/v1/checkout/sessions/([\w-]+)", path):
+                    session = fake.sessions.get(match.group(1))
+                    return self._json(200, session) if session else self._not_found()
+                if match := re.fullmatch(r"/pay/([\w-]+)", path):
+                    if match.group(1) not in fake.sessions:
+                        return self._not_found()
+                    session, _ = fake.pay(match.group(1))
+                    self.send_response(303)
+                    self.send_header("Location", session["success_url"].replace("{CHECKOUT_SESSION_ID}", session["id"]))
+                    self.end_headers()
+                    return None
+                return self._not_found()
+
+            def do_POST(self):
+                path = urlsplit(self.path).path
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode()
+                if path == "/v1/checkout/sessions":
+                    return self._json(200, fake.create_session(_unflatten(parse_qsl(body))))
+                if match := re.fullmatch(r"/pay/([\w-]+)", path):
+                    if match.group(1) not in fake.sessions:
+                        return self._not_found()
+                    session, delivered = fake.pay(match.group(1))
+                    return self._json(200, {"id": session["id"], "webhook_status": delivered})
+                return self._not_found()
+
+        return Handler
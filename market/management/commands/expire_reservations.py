@@ -0,0 +1,32 @@
+# File location: market/management/commands/expire_reservations.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from market import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete expired cart stock reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.SWEEP_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps (with --loop)')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                deleted = reservations.sweep_expired(batch_size=options['batch_size'])
+                if deleted:
+                    self.stdout.write(f"Expired {deleted} reservations")
+                total += deleted
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Expired {total} reservations"))
@@ -0,0 +1,40 @@
+# File location: market/management/commands/fake_stripe.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market import fake_stripe
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Stripe Checkout API (offline runs and load tests)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=fake_stripe.DEFAULT_PORT)
+        parser.add_argument(
+            '--webhook-url',
+            default='http://127.0.0.1:8000/market/webhooks/stripe/',
+            help='Where to deliver checkout.session.completed events',
+        )
+        parser.add_argument(
+            '--webhook-secret',
+            default=settings.STRIPE_WEBHOOK_SECRET or fake_stripe.DEFAULT_WEBHOOK_SECRET,
+            help='Signing secret; must match the app\'s STRIPE_WEBHOOK_SECRET',
+        )
+
+    def handle(self, *args, **options):
+        server = fake_stripe.FakeStripe(
+            host=options['host'],
+            port=options['port'],
+            deliver=fake_stripe.post_webhook(options['webhook_url'], options['webhook_secret']),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ Fake Stripe listening on {server.url}"))
+        self.stdout.write(f"  Run the app with STRIPE_API_BASE={server.url} STRIPE_WEBHOOK_SECRET={options['webhook_secret']}")
+        self.stdout.write(f"  Webhooks go to {options['webhook_url']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,92 @@
+# File location: market/management/commands/loadtest.py
+
+import statistics
+import threading
+import time
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+DEFAULT_PATHS = [
+    '/market/',
+    '/user-dashboard/api/nearby-businesses/?lat=40.7128&lng=-74.0060&radius=25',
+]
+
+
+class Command(BaseCommand):
+    help = 'Hammer a running server with concurrent GETs and report throughput and latency (see README)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS, help='Paths to request (default: market and nearby)')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds per path')
+        parser.add_argument(
+            '--username',
+            help='Send requests logged in as this user (both default paths need a login)',
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['username']:
+            user = get_user_model().objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['username']!r}")
+            # A session in the shared database is valid for the server under test too
+            client = Client()
+            client.force_login(user)
+            headers['Cookie'] = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        self.stdout.write(f"{options['concurrency']} clients, {options['duration']:g}s per path against {options['base_url']}")
+        for path in options['paths']:
+            result = self._run(options['base_url'] + path, headers, options['concurrency'], options['duration'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {path}: {result['rps']:.1f} req/s, "
+                f"p50 {result['p50']:.0f}ms, p95 {result['p95']:.0f}ms, p99 {result['p99']:.0f}ms, "
+                f"{result['requests']} requests, {result['errors']} errors"
+            ))
+
+    def _run(self, url, headers, concurrency, duration):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    with urlrequest.urlopen(urlrequest.Request(url, headers=headers), timeout=30) as response:
+                        response.read()
+                        # A redirect (e.g. to the login page) is not a successful hit
+                        ok = response.status == 200 and response.geturl() == url
+                except (HTTPError, OSError):
+                    ok = False
+                elapsed = time.monotonic() - started
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+        return {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'rps': len(latencies) / elapsed,
+            'p50': cuts[49] * 1000,
+            'p95': cuts[94] * 1000,
+            'p99': cuts[98] * 1000,
+        }
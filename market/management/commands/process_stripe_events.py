@@ -0,0 +1,45 @@
+# File location: market/management/commands/process_stripe_events.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from market import stripe_events
+from market.models import PendingCheckout
+
+
+class Command(BaseCommand):
+    help = 'Fulfil queued Stripe checkout webhook events (create orders, decrement stock)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=stripe_events.PROCESS_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when the queue is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        try:
+            while True:
+                claimed = stripe_events.process_pending_events(batch_size=batch_size)
+
+                # A full batch means more may be waiting; go again straight away
+                if claimed == batch_size:
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        stats = stripe_events.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Processed {stats['processed']} Stripe events "
+            f"({stats['retried']} to retry, {stats['failed']} failed)"
+        ))
+        refunds = PendingCheckout.objects.filter(status=PendingCheckout.NEEDS_REFUND)
+        if refunds.exists():
+            self.stdout.write(self.style.WARNING(
+                f"{refunds.count()} paid checkout(s) had items out of stock and need refunds: "
+                + ", ".join(refunds.order_by('created_at').values_list('stripe_session_id', flat=True)[:20])
+            ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0016_product_browse_idx'),
+        ('market', '0007_stripeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='market.cart')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='business.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], include=('quantity',), name='market_reservation_active_idx'), models.Index(fields=['expires_at'], name='market_reservation_expiry_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'cart'), name='market_reservation_product_cart_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_reservation'),
+        ('users', '0007_businessregistration_logo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_session_id', models.CharField(max_length=255, unique=True)),
+                ('lines', models.JSONField()),
+                ('amount_total_cents', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('fulfilled', 'Fulfilled'), ('needs_refund', 'Needs refund')], default='pending', max_length=20)),
+                ('refund_cents', models.PositiveIntegerField(default=0)),
+                ('shortages', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fulfilled_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkouts', to='users.customerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'needs_refund')), fields=['created_at'], name='market_checkout_refund_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 # market/models.py
 
 from django.db import models
+from django.utils import timezone
 from users.models import VendorProfile, CustomerProfile
 
 class Bag(models.Model):
@@ -93,3 +94,105 @@ class CartItem(models.Model):
 
         name = self.listing_title if self.listing_title else (self.bag.title if self.bag else "Item")
         return f"{name} x{self.quantity}"
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe webhook event, stored as soon as it arrives and fulfilled
+    later by the process_stripe_events worker. event_id is unique, so
+    Stripe's retries of the same event are stored once.
+    """
+    PENDING = "pending"
+    PROCESSED = "processed"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSED, "Processed"),
+        (FAILED, "Failed"),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    stripe_session_id = models.CharField(max_length=255, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Failed attempts are retried with backoff; the worker skips the row until then
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            # The worker's queue: only pending rows are ever scanned
+            models.Index(fields=['next_attempt_at'], name='market_stripeevent_queue_idx', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id} ({self.status})"
+
+
+class PendingCheckout(models.Model):
+    """
+    What a Stripe Checkout Session charges for, saved when the session is
+    created. Fulfilment works from these lines rather than from the cart,
+    which the shopper can keep changing while the webhook is on its way.
+    Lines that can't be fulfilled leave the session in NEEDS_REFUND with
+    refund_cents and the shortages recorded for whoever issues refunds.
+    """
+    PENDING = "pending"
+    FULFILLED = "fulfilled"
+    NEEDS_REFUND = "needs_refund"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (FULFILLED, "Fulfilled"),
+        (NEEDS_REFUND, "Needs refund"),
+    ]
+
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    customer = models.ForeignKey(CustomerProfile, on_delete=models.CASCADE, related_name="checkouts")
+    # [{"product_id", "bag_id", "listing_id", "unit_price_cents", "quantity"}, ...]
+    lines = models.JSONField()
+    amount_total_cents = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    refund_cents = models.PositiveIntegerField(default=0)
+    shortages = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    fulfilled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='market_checkout_refund_idx', condition=models.Q(status='needs_refund')),
+        ]
+
+    def __str__(self):
+        return f"Checkout {self.stripe_session_id} ({self.status})"
+
+
+class Reservation(models.Model):
+    """
+    Stock held for a cart until expires_at (see market/reservations.py).
+    A product's available quantity is its quantity minus the unexpired
+    reservations of other carts. One row per cart and product.
+    """
+    product = models.ForeignKey('business.Product', on_delete=models.CASCADE, related_name='reservations')
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'cart'], name='market_reservation_product_cart_uniq'),
+        ]
+        indexes = [
+            # Sum of active holds per product without touching the table (PostgreSQL INCLUDE)
+            models.Index(fields=['product', 'expires_at'], include=['quantity'], name='market_reservation_active_idx'),
+            # Expiry sweeper
+            models.Index(fields=['expires_at'], name='market_reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} for cart {self.cart_id} until {self.expires_at:%H:%M}"
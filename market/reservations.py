@@ -0,0 +1,127 @@
+# File location: market/reservations.py
+
+"""
+Time-boxed stock reservations for carts.
+
+Adding a product to a cart holds that many units for
+settings.CART_RESERVATION_TTL. What other shoppers can still add is
+
+    product.quantity - sum(unexpired reservations of other carts)
+
+which is answered from market_reservation_active_idx. `reserve` locks the
+product row, so two carts racing for the last unit are serialized and only
+one gets it. Expired rows are ignored by every check and deleted in batches
+by the `expire_reservations` worker.
+"""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from business.models import Product
+from .models import Reservation
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def reserved_quantity(product_id, exclude_cart=None, now=None):
+    """Units of product_id held by unexpired reservations, optionally ignoring one cart."""
+    now = now or timezone.now()
+    reservations = Reservation.objects.filter(product_id=product_id, expires_at__gt=now)
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    return reservations.aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def reserved_quantities(product_ids, exclude_cart=None, now=None):
+    """reserved_quantity for several products in one query: {product_id: units held}."""
+    now = now or timezone.now()
+    reservations = Reservation.objects.filter(product_id__in=product_ids, expires_at__gt=now)
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    return dict(
+        reservations.order_by().values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+
+
+def available_quantity(product, cart=None):
+    """
+    How many units of product cart (a Cart or its id) could hold; its own
+    reservation counts as available.
+    """
+    return max(product.quantity - reserved_quantity(product.pk, exclude_cart=cart), 0)
+
+
+def reserve(cart, product_id, quantity):
+    """
+    Hold quantity units of a product for cart, replacing any earlier hold
+    and restarting its expiry clock. Raises Product.DoesNotExist for
+    unknown products and ValidationError (code 'insufficient_stock',
+    params['available']) when other carts' holds leave too little stock.
+    """
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        now = timezone.now()
+        available = max(product.quantity - reserved_quantity(product.pk, exclude_cart=cart, now=now), 0)
+        if quantity > available:
+            raise ValidationError(
+                "Only %(available)d item(s) available.",
+                code='insufficient_stock',
+                params={'available': available},
+            )
+        reservation, _ = Reservation.objects.update_or_create(
+            cart=cart,
+            product=product,
+            defaults={'quantity': quantity, 'expires_at': now + settings.CART_RESERVATION_TTL},
+        )
+    return reservation
+
+
+def release(cart, product_id=None):
+    """Drop cart's hold on one product, or on everything when product_id is None."""
+    reservations = Reservation.objects.filter(cart=cart)
+    if product_id is not None:
+        reservations = reservations.filter(product_id=product_id)
+    reservations.delete()
+
+
+def reserve_cart(cart):
+    """
+    Re-reserve every product line in cart, e.g. when checkout starts, so
+    stock is held while the shopper pays. Stops at the first line that no
+    longer fits and raises its ValidationError with params['product'] set.
+    """
+    for item in cart.items.filter(product__isnull=False).select_related('product').order_by('product_id'):
+        try:
+            reserve(cart, item.product_id, item.quantity)
+        except ValidationError as e:
+            e.params['product'] = item.product
+            raise
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Delete expired reservations, batch_size rows per statement so the
+    sweeper never holds long locks. Returns the number deleted.
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            Reservation.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += Reservation.objects.filter(pk__in=ids, expires_at__lte=now).delete()[0]
+        if len(ids) < batch_size:
+            break
+    if deleted:
+        logger.info("Expired %d cart reservations", deleted)
+    return deleted
@@ -0,0 +1,9 @@
+# File location: market/signals.py
+
+from django.dispatch import Signal
+
+# Sent once by every path that writes a customer's cart lines (CartItem has
+# no per-row receivers, so its deletes stay fast), and after order rows
+# change through bulk paths that skip post_save/post_delete (bulk_create,
+# update). Receivers get customer_id, the CustomerProfile pk.
+cart_changed = Signal()
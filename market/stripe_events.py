@@ -0,0 +1,193 @@
+# File location: market/stripe_events.py
+
+"""
+Webhook-driven checkout fulfilment.
+
+The webhook view only verifies the signature and stores the event
+(`record_event`); the `process_stripe_events` worker fulfils it later
+(`process_pending_events`). Events are claimed with SELECT ... FOR UPDATE
+SKIP LOCKED so several workers can share the queue, and fulfilment is
+idempotent on stripe_session_id (see market.checkout.fulfill_cart), so a
+session delivered twice, or as two different event types, is fulfilled
+once. Failed events are retried with exponential backoff, up to
+MAX_ATTEMPTS times; a session whose amount doesn't match what was saved
+at checkout (RejectedSession) fails at once.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from business.models import Product
+from . import checkout
+from .models import Bag, Cart, Order, PendingCheckout, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+# async_payment_succeeded covers payment methods that settle after the redirect
+FULFILMENT_EVENT_TYPES = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+}
+PROCESS_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = timedelta(seconds=30)
+
+_lock = threading.Lock()
+_stats = {"batches": 0, "processed": 0, "retried": 0, "failed": 0, "needs_refund": 0}
+
+
+def record_event(event):
+    """
+    Store a verified webhook event for the worker.
+    Returns (stripe_event, created); created is False for a redelivery and
+    None for event types we don't fulfil (those are not stored).
+    """
+    if event['type'] not in FULFILMENT_EVENT_TYPES:
+        return None, None
+    session = event['data']['object']
+    return StripeEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'type': event['type'],
+            'stripe_session_id': session['id'],
+            'payload': event,
+        },
+    )
+
+
+class RejectedSession(Exception):
+    """A paid session that must not be fulfilled; its event fails without retries."""
+
+
+def fulfill_session(session):
+    """
+    Turn a paid Checkout Session into orders from the lines saved when it
+    was created (market.models.PendingCheckout), not from the cart as it
+    is now. Lines that are out of stock put the session in NEEDS_REFUND.
+    Returns the orders created.
+    """
+    if session.get('payment_status') != 'paid':
+        # Delayed payment methods send async_payment_succeeded when they clear
+        return []
+
+    pending = (
+        PendingCheckout.objects.select_for_update()
+        .filter(stripe_session_id=session['id']).first()
+    )
+    if pending is None:
+        raise RejectedSession(f"Checkout session {session['id']} was not created here")
+    if session.get('amount_total') != pending.amount_total_cents:
+        raise RejectedSession(
+            f"Checkout session {session['id']} charged {session.get('amount_total')} cents, "
+            f"expected {pending.amount_total_cents}"
+        )
+    if pending.status != PendingCheckout.PENDING:
+        return []
+
+    cart, _ = Cart.objects.get_or_create(customer_id=pending.customer_id)
+    orders, shortages = checkout.fulfill_cart(
+        cart, session['id'], session.get('payment_intent'), lines=pending.lines
+    )
+
+    pending.fulfilled_at = timezone.now()
+    if shortages:
+        pending.status = PendingCheckout.NEEDS_REFUND
+        pending.refund_cents = sum(shortage.total_cents for shortage in shortages)
+        pending.shortages = [
+            {
+                'product_id': shortage.item.pk if isinstance(shortage.item, Product) else None,
+                'bag_id': shortage.item.pk if isinstance(shortage.item, Bag) else None,
+                'requested': shortage.requested,
+                'available': shortage.available,
+                'total_cents': shortage.total_cents,
+            }
+            for shortage in shortages
+        ]
+        logger.error(
+            "Checkout %s needs a refund of %d cents: %d line(s) out of stock",
+            session['id'], pending.refund_cents, len(shortages),
+        )
+        with _lock:
+            _stats["needs_refund"] += 1
+    else:
+        pending.status = PendingCheckout.FULFILLED
+    pending.save(update_fields=['status', 'refund_cents', 'shortages', 'fulfilled_at'])
+    return orders
+
+
+def process_pending_events(batch_size=PROCESS_BATCH_SIZE):
+    """
+    Claim and fulfil up to batch_size pending events.
+    Each event runs in its own savepoint, so one bad event doesn't hold up
+    the rest of the batch. Returns the number of events claimed.
+    """
+    processed = retried = failed = 0
+
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.filter(status=StripeEvent.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        for event in events:
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    fulfill_session(event.payload['data']['object'])
+            except RejectedSession as e:
+                logger.error("Stripe event %s rejected: %s", event.event_id, e)
+                event.last_error = str(e)
+                event.status = StripeEvent.FAILED
+                failed += 1
+            except Exception as e:
+                logger.exception("Stripe event %s failed (attempt %d)", event.event_id, event.attempts)
+                event.last_error = str(e)
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = StripeEvent.FAILED
+                    failed += 1
+                else:
+                    event.next_attempt_at = timezone.now() + RETRY_BACKOFF * 2 ** (event.attempts - 1)
+                    retried += 1
+            else:
+                event.status = StripeEvent.PROCESSED
+                event.processed_at = timezone.now()
+                event.last_error = ''
+                processed += 1
+            event.save(update_fields=['attempts', 'status', 'last_error', 'next_attempt_at', 'processed_at'])
+
+    if events:
+        with _lock:
+            _stats["batches"] += 1
+            _stats["processed"] += processed
+            _stats["retried"] += retried
+            _stats["failed"] += failed
+    return len(events)
+
+
+def session_status(session_id, user):
+    """
+    Where a checkout session is in fulfilment, for the success page:
+    'complete', 'partial' (some lines sold out and are to be refunded),
+    'unfulfilled' (paid, but nothing was left in stock), 'failed', or
+    'processing' (webhook not received or not yet handled).
+    """
+    pending = PendingCheckout.objects.filter(stripe_session_id=session_id, customer__user=user).first()
+    if pending is None:
+        return 'processing'
+    if pending.status == PendingCheckout.FULFILLED:
+        return 'complete'
+    if pending.status == PendingCheckout.NEEDS_REFUND:
+        return 'partial' if Order.objects.filter(stripe_session_id=session_id).exists() else 'unfulfilled'
+    statuses = set(StripeEvent.objects.filter(stripe_session_id=session_id).values_list('status', flat=True))
+    if statuses and statuses <= {StripeEvent.FAILED}:
+        return 'failed'
+    return 'processing'
+
+
+def stats():
+    """Snapshot of this process's webhook processing counters."""
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,556 @@
+# market/tests.py
+
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from business.models import Bid, Product
+from users.models import BusinessRegistration, CustomerProfile
+
+from . import checkout, fake_stripe, reservations, stripe_events, views
+from .models import Cart, CartItem, Order, PendingCheckout, Reservation, StripeEvent
+
+User = get_user_model()
+
+# For tests that render {% static %} without running collectstatic first, so
+# there's no manifest for config.storage.StaticFilesStorage to read
+UNHASHED_STATIC = override_settings(STORAGES={
+    **settings.STORAGES,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+
+
+def make_product(owner, **kwargs):
+    defaults = {
+        "owner": owner,
+        "title": "Croissants",
+        "base_price": Decimal("8.00"),
+        "quantity": 2,
+        "status": "listed",
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+@UNHASHED_STATIC
+class MarketBrowseTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.url = reverse("market:dynamic_pricing")
+        self.client.force_login(User.objects.create_user(username="shopper"))
+
+    def walk_pages(self, params=None):
+        """Follow next-page links to the end; returns product ids in page order."""
+        seen = []
+        response = self.client.get(self.url, params or {})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(product.pk for product in response.context["products"])
+            if not response.context["next_query"]:
+                return seen
+            response = self.client.get(self.url + "?" + response.context["next_query"])
+
+    def test_cursor_pages_cover_every_product_once(self):
+        created = timezone.now()
+        products = [make_product(self.owner) for _ in range(views.BROWSE_PAGE_SIZE * 2 + 3)]
+        # Half the rows share a timestamp so the id tiebreak is exercised
+        Product.objects.filter(pk__in=[p.pk for p in products[::2]]).update(created_at=created)
+        make_product(self.owner, quantity=0)
+        make_product(self.owner, status="draft")
+
+        expected = list(
+            Product.objects.browsable().order_by("-created_at", "-id").values_list("pk", flat=True)
+        )
+        self.assertEqual(self.walk_pages(), expected)
+
+    def test_query_count_does_not_grow_with_depth(self):
+        for _ in range(views.BROWSE_PAGE_SIZE * 3):
+            make_product(self.owner)
+
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(self.url + "?" + first.context["next_query"])
+        self.assertEqual(len(deep_page), len(first_page))
+
+    def test_filters(self):
+        now = timezone.now()
+        chicago = make_product(self.owner, city="Chicago", base_price=Decimal("4.00"))
+        soon = make_product(self.owner, city="Evanston", end_time=now + timedelta(minutes=20))
+        later = make_product(self.owner, city="Chicago", base_price=Decimal("20.00"), end_time=now + timedelta(hours=3))
+
+        self.assertEqual(set(self.walk_pages({"city": "chicago"})), {chicago.pk, later.pk})
+        self.assertEqual(self.walk_pages({"ending_soon": "1"}), [soon.pk])
+        # Price filters apply to the discounted price: 20.00 * 0.9 = 18.00
+        self.assertEqual(self.walk_pages({"min_price": "18", "max_price": "18"}), [later.pk])
+        self.assertEqual(set(self.walk_pages({"max_price": "junk"})), {chicago.pk, soon.pk, later.pk})
+
+    def test_malformed_cursor_restarts_from_first_page(self):
+        product = make_product(self.owner)
+        for cursor in ("nonsense", "2024-01-01T00:00:00_abc", "2024-01-01T00:00:00_1"):
+            response = self.client.get(self.url, {"after": cursor})
+            self.assertEqual([p.pk for p in response.context["products"]], [product.pk])
+
+
+class CartDetailTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.shopper = User.objects.create_user(username="shopper")
+        self.cart = Cart.objects.create(customer=CustomerProfile.objects.create(user=self.shopper))
+        self.url = reverse("market:cart_detail")
+        self.client.force_login(self.shopper)
+
+    def fill_cart(self, lines):
+        for _ in range(lines):
+            product = make_product(self.owner, end_time=timezone.now() + timedelta(hours=3))
+            CartItem.objects.create(cart=self.cart, product=product, unit_price_cents=800)
+
+    def test_query_count_is_constant(self):
+        self.fill_cart(5)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url)
+
+        self.fill_cart(45)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+
+        self.assertEqual(len(response.context["items"]), 50)
+        self.assertEqual(len(large), len(small))
+
+    def test_stale_prices_are_saved_once(self):
+        self.fill_cart(3)
+
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(self.url)
+        # 8.00 with the 10% discount for more than an hour left
+        self.assertEqual(response.context["total"], 3 * 7.2)
+        self.assertEqual(set(CartItem.objects.values_list("unit_price_cents", flat=True)), {720})
+        self.assertEqual(sum("UPDATE" in q["sql"] for q in first.captured_queries), 1)
+
+        with CaptureQueriesContext(connection) as second:
+            self.client.get(self.url)
+        self.assertFalse(any("UPDATE" in q["sql"] for q in second.captured_queries))
+
+    def test_auction_winner_pays_winning_bid(self):
+        product = make_product(self.owner, enable_bidding=True)
+        bid = Bid.objects.create(product=product, bidder=self.shopper, amount=Decimal("5.25"))
+        Product.objects.filter(pk=product.pk).update(winning_bid=bid)
+        CartItem.objects.create(cart=self.cart, product=product, unit_price_cents=800)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context["total"], 5.25)
+        self.assertEqual(CartItem.objects.get().unit_price_cents, 525)
+
+
+def make_cart(username, *lines):
+    user = User.objects.create_user(username=username)
+    cart = Cart.objects.create(customer=CustomerProfile.objects.create(user=user))
+    for product, quantity in lines:
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity, unit_price_cents=800)
+    return cart
+
+
+class FulfillCartTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+
+    def test_creates_orders_and_decrements_stock(self):
+        bread = make_product(self.owner, quantity=5)
+        cake = make_product(self.owner, quantity=2)
+        cart = make_cart("shopper", (bread, 2), (cake, 2))
+
+        orders, shortages = checkout.fulfill_cart(cart, "cs_test_1", "pi_1")
+
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(shortages, [])
+        bread.refresh_from_db()
+        cake.refresh_from_db()
+        self.assertEqual((bread.quantity, bread.status), (3, "listed"))
+        self.assertEqual((cake.quantity, cake.status), (0, "sold"))
+        self.assertFalse(cart.items.exists())
+        self.assertEqual(
+            set(Order.objects.values_list("stripe_session_id", "payment_intent_id", "total_cents")),
+            {("cs_test_1", "pi_1", 1600)},
+        )
+
+    def test_skips_lines_without_stock(self):
+        bread = make_product(self.owner, quantity=3)
+        cart = make_cart("shopper", (bread, 2), (bread, 2))
+
+        orders, shortages = checkout.fulfill_cart(cart, "cs_test_1")
+
+        self.assertEqual(len(orders), 1)
+        self.assertEqual([(s.requested, s.available) for s in shortages], [(2, 1)])
+        bread.refresh_from_db()
+        self.assertEqual(bread.quantity, 1)
+
+    def test_same_session_is_fulfilled_once(self):
+        bread = make_product(self.owner, quantity=5)
+        cart = make_cart("shopper", (bread, 1))
+        checkout.fulfill_cart(cart, "cs_test_1")
+        CartItem.objects.create(cart=cart, product=bread, quantity=1, unit_price_cents=800)
+
+        self.assertEqual(checkout.fulfill_cart(cart, "cs_test_1"), ([], []))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(cart.items.exists())
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Needs a database with row locks (PostgreSQL); skipped on SQLite."""
+
+    def test_last_unit_is_sold_once(self):
+        owner = User.objects.create_user(username="baker")
+        for attempt in range(10):
+            product = make_product(owner, quantity=1)
+            carts = [make_cart(f"shopper{attempt}-{i}", (product, 1)) for i in range(2)]
+            start = threading.Barrier(len(carts))
+            results = [None] * len(carts)
+
+            def pay(index):
+                try:
+                    start.wait()
+                    results[index] = checkout.fulfill_cart(carts[index], f"cs_{attempt}_{index}")
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=pay, args=(i,)) for i in range(len(carts))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(sorted(len(orders) for orders, _ in results), [0, 1])
+            self.assertEqual(sorted(len(shortages) for _, shortages in results), [0, 1])
+            product.refresh_from_db()
+            self.assertEqual((product.quantity, product.status), (0, "sold"))
+            self.assertEqual(Order.objects.filter(product=product).count(), 1)
+
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.product = make_product(self.owner, quantity=3)
+        self.cart = make_cart("shopper", (self.product, 1))
+        self.shopper = self.cart.customer.user
+        self.url = reverse("market:stripe_webhook")
+        checkout.save_pending_checkout(self.cart, "cs_test_1")
+
+    def deliver(self, event, secret=WEBHOOK_SECRET):
+        payload = json.dumps(event)
+        return self.client.post(
+            self.url, payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=fake_stripe.sign_payload(payload, secret),
+        )
+
+    def paid_event(self, session_id="cs_test_1"):
+        return fake_stripe.checkout_completed_event({
+            "id": session_id,
+            "payment_status": "paid",
+            "payment_intent": "pi_1",
+            "amount_total": 800,
+            "client_reference_id": str(self.shopper.pk),
+        })
+
+    def success_status(self, session_id="cs_test_1"):
+        self.client.force_login(self.shopper)
+        response = self.client.get(reverse("market:checkout_success"), {"session_id": session_id})
+        return response.context["status"]
+
+    def test_rejects_bad_signature(self):
+        response = self.deliver(self.paid_event(), secret="whsec_wrong")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_queues_event_once_and_fulfils_in_worker(self):
+        event = self.paid_event()
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.deliver(self.paid_event())  # same session, different event id
+
+        self.assertEqual(StripeEvent.objects.count(), 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.success_status(), "processing")
+
+        self.assertEqual(stripe_events.process_pending_events(), 2)
+
+        self.assertEqual(Order.objects.filter(stripe_session_id="cs_test_1").count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 2)
+        self.assertEqual(self.success_status(), "complete")
+
+    def test_ignores_other_event_types(self):
+        event = self.paid_event()
+        event["type"] = "payment_intent.created"
+
+        self.assertEqual(self.deliver(event).status_code, 200)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_failures_back_off_then_give_up(self):
+        self.deliver(self.paid_event())
+
+        for attempt in range(1, stripe_events.MAX_ATTEMPTS + 1):
+            with self.assertLogs("market.stripe_events", "ERROR"), \
+                    mock.patch.object(checkout, "fulfill_cart", side_effect=RuntimeError("db down")):
+                self.assertEqual(stripe_events.process_pending_events(), 1)
+            stored = StripeEvent.objects.get()
+            self.assertEqual(stored.attempts, attempt)
+            # Not picked up again until its backoff has passed
+            self.assertEqual(stripe_events.process_pending_events(), 0)
+            StripeEvent.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.FAILED)
+
+
+    def test_fulfils_what_was_paid_for_not_the_cart_now(self):
+        extra = make_product(self.owner, title="Bagels", quantity=5)
+        CartItem.objects.filter(cart=self.cart).update(quantity=2)
+        CartItem.objects.create(cart=self.cart, product=extra, quantity=1, unit_price_cents=300)
+
+        self.deliver(self.paid_event())
+        stripe_events.process_pending_events()
+
+        self.assertEqual(list(Order.objects.values_list("product_id", "quantity")), [(self.product.pk, 1)])
+        # The unpaid extras stay in the cart
+        self.assertEqual(
+            sorted(self.cart.items.values_list("product_id", "quantity")),
+            sorted([(self.product.pk, 1), (extra.pk, 1)]),
+        )
+        self.assertEqual(PendingCheckout.objects.get().status, PendingCheckout.FULFILLED)
+
+    def test_amount_mismatch_is_rejected_without_retries(self):
+        event = self.paid_event()
+        event["data"]["object"]["amount_total"] = 1
+        self.deliver(event)
+
+        with self.assertLogs("market.stripe_events", "ERROR"):
+            stripe_events.process_pending_events()
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.FAILED)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.success_status(), "failed")
+
+    def test_sold_out_sessions_are_recorded_for_refund(self):
+        Product.objects.filter(pk=self.product.pk).update(quantity=0)
+        self.deliver(self.paid_event())
+
+        with self.assertLogs("market.stripe_events", "ERROR"):
+            stripe_events.process_pending_events()
+        pending = PendingCheckout.objects.get()
+        self.assertEqual((pending.status, pending.refund_cents), (PendingCheckout.NEEDS_REFUND, 800))
+        self.assertEqual(pending.shortages[0]["product_id"], self.product.pk)
+        self.assertEqual(self.success_status(), "unfulfilled")
+
+    def test_success_page_stops_reloading(self):
+        self.client.force_login(self.shopper)
+        url = reverse("market:checkout_success")
+        response = self.client.get(url, {"session_id": "cs_test_1"})
+        self.assertContains(response, 'http-equiv="refresh"')
+
+        response = self.client.get(url, {"session_id": "cs_test_1", "checks": views.SUCCESS_PAGE_MAX_CHECKS})
+        self.assertEqual(response.context["status"], "pending")
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class FakeStripeCheckoutTests(TestCase):
+    """Whole checkout flow against the local Stripe stand-in."""
+
+    def setUp(self):
+        self.fake = fake_stripe.FakeStripe(deliver=self.deliver).start()
+        self.addCleanup(self.fake.stop)
+        patcher = mock.patch.object(views.stripe, "api_base", self.fake.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deliver(self, event):
+        payload = json.dumps(event)
+        return self.client.post(
+            reverse("market:stripe_webhook"), payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=fake_stripe.sign_payload(payload, WEBHOOK_SECRET),
+        ).status_code
+
+    def test_checkout_to_order(self):
+        product = make_product(User.objects.create_user(username="baker"), quantity=1)
+        cart = make_cart("shopper", (product, 1))
+        self.client.force_login(cart.customer.user)
+
+        data = self.client.post(reverse("market:create_checkout_session")).json()
+        self.assertEqual(self.fake.sessions[data["sessionId"]]["amount_total"], 800)
+
+        session, delivered = self.fake.pay(data["sessionId"])
+        self.assertEqual(delivered, 200)
+        stripe_events.process_pending_events()
+
+        order = Order.objects.get(stripe_session_id=session["id"])
+        self.assertEqual(order.payment_intent_id, session["payment_intent"])
+        response = self.client.get(reverse("market:checkout_success"), {"session_id": session["id"]})
+        self.assertEqual(response.context["status"], "complete")
+
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="baker")
+        self.product = make_product(self.owner, quantity=3)
+        self.cart = make_cart("shopper")
+        self.other_cart = make_cart("rival")
+        self.client.force_login(self.cart.customer.user)
+
+    def add(self, quantity, cart=None):
+        self.client.force_login((cart or self.cart).customer.user)
+        return self.client.post(reverse("market:add_to_cart"), {"product_id": self.product.pk, "quantity": quantity})
+
+    def held(self, cart=None):
+        reservation = Reservation.objects.filter(cart=cart or self.cart, product=self.product).first()
+        return reservation.quantity if reservation else 0
+
+    def test_cart_changes_move_the_hold(self):
+        self.add(2)
+        self.assertEqual(self.held(), 2)
+        item = CartItem.objects.get(cart=self.cart)
+
+        self.client.post(reverse("market:update_cart_item", args=[item.pk]), {"quantity": 3})
+        self.assertEqual(self.held(), 3)
+
+        self.client.post(reverse("market:remove_cart_item", args=[item.pk]))
+        self.assertEqual(self.held(), 0)
+
+    def test_other_carts_holds_limit_what_can_be_added(self):
+        self.add(2, cart=self.other_cart)
+
+        self.add(2)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.add(1)
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 1)
+        self.assertEqual(reservations.available_quantity(self.product), 0)
+
+        # Once the rival's hold lapses its stock is free again, sweeper or not
+        Reservation.objects.filter(cart=self.other_cart).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.add(2)
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 3)
+
+        with self.assertRaises(ValidationError) as raised:
+            reservations.reserve(self.other_cart, self.product.pk, 1)
+        self.assertEqual(raised.exception.params["available"], 0)
+
+    def test_sweeper_deletes_only_expired_rows(self):
+        past = timezone.now() - timedelta(minutes=1)
+        for i in range(5):
+            Reservation.objects.create(cart=make_cart(f"gone{i}"), product=self.product, quantity=1, expires_at=past)
+        reservations.reserve(self.cart, self.product.pk, 1)
+
+        self.assertEqual(reservations.sweep_expired(batch_size=2), 5)
+        self.assertEqual(list(Reservation.objects.values_list("cart", flat=True)), [self.cart.pk])
+
+    def test_checkout_consumes_the_hold(self):
+        self.add(2)
+
+        checkout.fulfill_cart(self.cart, "cs_test_1")
+
+        self.assertFalse(Reservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+
+    def test_checkout_leaves_stock_held_by_other_carts(self):
+        self.add(2)
+        # This cart's hold lapses and a rival holds what's free
+        Reservation.objects.filter(cart=self.cart).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.add(2, cart=self.other_cart)
+
+        orders, shortages = checkout.fulfill_cart(self.cart, "cs_test_1")
+
+        self.assertEqual(orders, [])
+        self.assertEqual([(s.requested, s.available) for s in shortages], [(2, 1)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+    def test_product_page_shows_what_is_not_held_elsewhere(self):
+        BusinessRegistration.objects.create(
+            user=self.owner, name="Corner Bakery", business_type="bakery", address="1 Main St",
+            phone_number="3125550100", email="baker@example.com", owner_name="Baker",
+        )
+        url = reverse("business:product_detail_public", args=[self.product.pk])
+        self.add(2, cart=self.other_cart)
+        self.add(1)
+
+        response = self.client.get(url)
+        # The shopper's own hold still counts as available to them
+        self.assertEqual(response.context["available"], 1)
+        self.assertContains(response, "in other shoppers' baskets")
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentReservationTests(TransactionTestCase):
+    """Needs a database with row locks (PostgreSQL); skipped on SQLite."""
+
+    def test_concurrent_adds_from_one_shopper_hold_every_unit(self):
+        product = make_product(User.objects.create_user(username="baker"), quantity=5)
+        cart = make_cart("shopper")
+        start = threading.Barrier(4)
+
+        def add():
+            try:
+                client = Client()
+                client.force_login(cart.customer.user)
+                start.wait()
+                client.post(reverse("market:add_to_cart"), {"product_id": product.pk, "quantity": 1})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(CartItem.objects.filter(cart=cart).values_list("quantity", flat=True)), [4])
+        self.assertEqual(Reservation.objects.get(cart=cart).quantity, 4)
+
+    def test_last_unit_is_held_once(self):
+        product = make_product(User.objects.create_user(username="baker"), quantity=1)
+        carts = [make_cart(f"shopper{i}") for i in range(8)]
+        start = threading.Barrier(len(carts))
+        held = []
+
+        def hold(cart):
+            try:
+                start.wait()
+                reservations.reserve(cart, product.pk, 1)
+                held.append(cart.pk)
+            except ValidationError:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hold, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(held), 1)
+        self.assertEqual(list(Reservation.objects.values_list("cart", flat=True)), held)
@@ -16,6 +16,7 @@ urlpatterns = [
     path('create-checkout-session/', views.create_checkout_session, name='create_checkout_session'),
     path('checkout/success/', views.SuccessView.as_view(), name='checkout_success'),
     path('checkout/cancelled/', views.CancelledView.as_view(), name='checkout_cancelled'),
+    path('webhooks/stripe/', views.stripe_webhook, name='stripe_webhook'),
    #path("", views.dynamic_pricing, name="dynamic_pricing"),
     
 ]
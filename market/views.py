@@ -1,22 +1,39 @@
 # market/views
+import json
 import stripe
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import TemplateView
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from . import checkout, reservations, stripe_events
 from .models import Bag, Cart, CartItem, Order
+from .signals import cart_changed
 from business.models import Product, Listing
+from users import roles
 from users.models import CustomerProfile
 from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+
+BROWSE_PAGE_SIZE = 24
+ENDING_SOON_WINDOW = timedelta(hours=1)
+# The success page reloads every 2 s while an order is processing, this many times at most
+SUCCESS_PAGE_MAX_CHECKS = 30
 
 
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
 
 
 def _get_or_create_cart(user):
@@ -38,25 +55,11 @@ def _get_or_create_cart(user):
 def cart_detail(request):
     cart = _get_or_create_cart(request.user)
     if cart:
-        items = cart.items.select_related('product','bag').all()
-        for item in items:
-            if item.product:
-                # Check if product has a winning bid (user won the auction)
-                if item.product.winning_bid and item.product.winning_bid.bidder == request.user:
-                    # Use the winning bid amount instead of current price
-                    winning_price = float(item.product.winning_bid.amount)
-                    item.unit_price = winning_price
-                    item.unit_price_cents = int(winning_price * 100)
-                else:
-                    # Use current price for regular products
-                    current_price = item.product.get_current_price()
-                    item.unit_price = float(current_price)
-                    item.unit_price_cents = int(current_price * 100)
-                item.save(update_fields=['unit_price_cents'])
-            else:
-                item.unit_price = item.unit_price_cents / 100
-
-            item.total_price = item.unit_price * item.quantity
+        items = list(cart.items.select_related('product__winning_bid', 'bag'))
+        changed = _price_cart_items(items, request.user)
+        if changed:
+            CartItem.objects.bulk_update(changed, ['unit_price_cents'])
+            cart_changed.send(sender=CartItem, customer_id=cart.customer_id)
         total = sum(item.total_price for item in items)
     else:
         items = []
@@ -65,6 +68,35 @@ def cart_detail(request):
     return render(request, 'market/cart_detail.html', {'cart': cart, 'items': items, 'total': total})
 
 
+def _price_cart_items(items, user):
+    """
+    Set unit_price / total_price on each cart line from its product's
+    current price, or the winning bid if this user won the auction.
+    Works on rows that already have product__winning_bid joined, so it
+    issues no queries. Returns the lines whose stored price went stale.
+    """
+    changed = []
+    for item in items:
+        product = item.product
+        if product:
+            winning_bid = product.winning_bid
+            if winning_bid and winning_bid.bidder_id == user.pk:
+                # Use the winning bid amount instead of current price
+                price = winning_bid.amount
+            else:
+                price = product.get_current_price()
+            item.unit_price = float(price)
+            price_cents = int(price * 100)
+            if price_cents != item.unit_price_cents:
+                item.unit_price_cents = price_cents
+                changed.append(item)
+        else:
+            item.unit_price = item.unit_price_cents / 100
+
+        item.total_price = item.unit_price * item.quantity
+    return changed
+
+
 @require_POST
 @login_required
 def add_to_cart(request):
@@ -85,33 +117,32 @@ def add_to_cart(request):
             messages.error(request, "This product is no longer available.")
             return redirect(request.META.get('HTTP_REFERER', "market:dynamic_pricing"))
 
-        # Check quantity availability
-        requested_quantity = int(request.POST.get('quantity', 1))
-        if requested_quantity > product.quantity:
-            messages.error(request, f"Only {product.quantity} item(s) available. You requested {requested_quantity}.")
-            return redirect(request.META.get('HTTP_REFERER', "market:dynamic_pricing"))
-
-        current_price = product.get_current_price()
-        unit_price_cents = int(current_price * 100)
+        # Hold the stock for this cart; other carts' unexpired holds count against it.
+        # The cart row lock serializes this shopper's concurrent adds, so the
+        # read, the hold and the write can't interleave.
+        with transaction.atomic():
+            Cart.objects.select_for_update().get(pk=cart.pk)
+            item = CartItem.objects.filter(cart=cart, product=product).first()
+            in_cart = item.quantity if item else 0
+            try:
+                reservations.reserve(cart, product.pk, in_cart + quantity)
+            except ValidationError as e:
+                available = e.params['available']
+                if in_cart:
+                    messages.error(request, f"Only {available} item(s) available. You already have {in_cart} in cart.")
+                else:
+                    messages.error(request, f"Only {available} item(s) available. You requested {quantity}.")
+                return redirect(request.META.get('HTTP_REFERER', "market:dynamic_pricing"))
 
-        
+            current_price = product.get_current_price()
+            unit_price_cents = int(current_price * 100)
 
-        item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={
-                'unit_price_cents': unit_price_cents,
-                'quantity': quantity
-            }
-        )
-        if not created:
-            total_cart_quantity = item.quantity + quantity
-            if total_cart_quantity > product.quantity:
-                messages.error(request, f"Only {product.quantity} item(s) available. You already have {item.quantity} in cart.")
-                return redirect(request.META.get('HTTP_REFERER', "market:dynamic_pricing"))
-            item.unit_price_cents = unit_price_cents
-            item.quantity += quantity
-            item.save()
+            if item is None:
+                CartItem.objects.create(cart=cart, product=product, unit_price_cents=unit_price_cents, quantity=quantity)
+            else:
+                item.unit_price_cents = unit_price_cents
+                item.quantity += quantity
+                item.save()
 
     # Legacy support for bags to ensure compatibility 
     elif bag_id:
@@ -137,6 +168,8 @@ def add_to_cart(request):
             item.quantity += quantity
             item.save()
 
+    cart_changed.send(sender=CartItem, customer_id=cart.customer_id)
+
     # Redirect back to the referring page, or cart if 'next' parameter is provided
     next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
     if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
@@ -152,10 +185,19 @@ def update_cart_item(request, item_id):
     item = get_object_or_404(CartItem, pk=item_id, cart=cart)
     quantity = int(request.POST.get('quantity', item.quantity))
     if quantity <= 0:
+        if item.product_id:
+            reservations.release(cart, item.product_id)
         item.delete()
     else:
+        if item.product_id:
+            try:
+                reservations.reserve(cart, item.product_id, quantity)
+            except ValidationError as e:
+                messages.error(request, f"Only {e.params['available']} item(s) available.")
+                return redirect('market:cart_detail')
         item.quantity = quantity
         item.save()
+    cart_changed.send(sender=CartItem, customer_id=cart.customer_id)
     return redirect('market:cart_detail')
 
 
@@ -164,25 +206,96 @@ def update_cart_item(request, item_id):
 def remove_cart_item(request, item_id):
     cart = _get_or_create_cart(request.user)
     item = get_object_or_404(CartItem, pk=item_id, cart=cart)
+    if item.product_id:
+        reservations.release(cart, item.product_id)
     item.delete()
+    cart_changed.send(sender=CartItem, customer_id=cart.customer_id)
     return redirect('market:cart_detail')
 
 @login_required
 def dynamic_pricing(request):
     """
-    View for dynamic pricing/barter page for products with time_based pricing.
+    Market browse page: listed, in-stock products newest first.
+    Paged with a (created_at, id) cursor so every page costs the same no
+    matter how deep it is. Optional filters: city, min_price/max_price
+    (on the current dynamic price) and ending_soon.
     """
-    products = Product.objects.filter(
-        status="listed",
-        quantity__gt=0,
-    ).select_related("owner")
-
-    return render(request, "market/bag_list.html", {"bags": products, "products": products})
-    bags = Bag.objects.filter(status="listed").select_related("vendor")
-    # Recalculate prices on access
-    for bag in bags:
-        bag.refresh_dynamic_price(save=True)
-    return render(request, "market/bag_list.html", {"bags": bags})
+    now = timezone.now()
+    products = Product.objects.browsable().select_related("owner").with_current_price(now=now)
+
+    city = request.GET.get("city", "").strip()
+    if city:
+        products = products.filter(city__iexact=city)
+
+    min_price = _parse_price(request.GET.get("min_price"))
+    if min_price is not None:
+        products = products.filter(effective_price__gte=min_price)
+    max_price = _parse_price(request.GET.get("max_price"))
+    if max_price is not None:
+        products = products.filter(effective_price__lte=max_price)
+
+    ending_soon = request.GET.get("ending_soon") == "1"
+    if ending_soon:
+        products = products.filter(end_time__gt=now, end_time__lte=now + ENDING_SOON_WINDOW)
+
+    cursor = _decode_cursor(request.GET.get("after"))
+    if cursor:
+        products = products.after_cursor(*cursor)
+
+    # Fetch one extra row to learn whether there is a next page
+    page = list(products.order_by("-created_at", "-id")[:BROWSE_PAGE_SIZE + 1])
+    next_cursor = None
+    if len(page) > BROWSE_PAGE_SIZE:
+        page = page[:BROWSE_PAGE_SIZE]
+        next_cursor = _encode_cursor(page[-1])
+
+    # Carry the filters over to the paging links
+    query = request.GET.copy()
+    query.pop("after", None)
+    first_query = query.urlencode()
+    if next_cursor:
+        query["after"] = next_cursor
+
+    return render(request, "market/bag_list.html", {
+        "products": page,
+        "can_add_to_cart": roles.can_add_to_cart(request.user),
+        "next_query": query.urlencode() if next_cursor else "",
+        "first_query": first_query,
+        "is_first_page": cursor is None,
+        "filters": {
+            "city": city,
+            "min_price": request.GET.get("min_price", ""),
+            "max_price": request.GET.get("max_price", ""),
+            "ending_soon": ending_soon,
+        },
+    })
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def _encode_cursor(product):
+    return f"{product.created_at.isoformat()}_{product.pk}"
+
+
+def _decode_cursor(value):
+    """Parse an `after` cursor; a malformed one just restarts from the first page."""
+    if not value:
+        return None
+    created_at, _, pk = value.rpartition("_")
+    try:
+        created_at = datetime.fromisoformat(created_at)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if timezone.is_naive(created_at):
+        return None
+    return created_at, pk
 
 # Fix the function name (typo: strip_config -> stripe_config)
 @login_required
@@ -248,6 +361,14 @@ def create_checkout_session(request):
     if not line_items:
         return JsonResponse({'error': 'No valid items in cart'}, status=400)
 
+    # Hold everything for the length of the payment
+    try:
+        reservations.reserve_cart(cart)
+    except ValidationError as e:
+        return JsonResponse({
+            'error': f"Only {e.params['available']} of {e.params['product'].title} left. Please update your cart.",
+        }, status=409)
+
     try:
         domain_url = request.build_absolute_uri('/')[:-1]  # Remove trailing slash
         
@@ -262,102 +383,61 @@ def create_checkout_session(request):
             client_reference_id=str(request.user.id) if request.user.is_authenticated else None,
             customer_email=request.user.email if request.user.email else None,
         )
-        
-        return JsonResponse({'sessionId': checkout_session['id']})
+        # Fulfilment works from this copy, not from the cart as it is when the webhook lands
+        checkout.save_pending_checkout(cart, checkout_session['id'])
+
+        return JsonResponse({'sessionId': checkout_session['id'], 'url': checkout_session['url']})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
-class SuccessView(TemplateView):
-    """Success page after payment"""
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """
+    Stripe webhook endpoint. Verifies the signature and queues checkout
+    events for the process_stripe_events worker; no fulfilment happens here,
+    so Stripe gets its 200 straight away.
+    """
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        return JsonResponse({'success': False, 'error': 'Webhook secret not configured'}, status=503)
+
+    try:
+        stripe.Webhook.construct_event(
+            request.body,
+            request.headers.get('Stripe-Signature'),
+            settings.STRIPE_WEBHOOK_SECRET,
+        )
+    except (ValueError, stripe.SignatureVerificationError):
+        return JsonResponse({'success': False, 'error': 'Invalid payload or signature'}, status=400)
+
+    # The signature covers the raw body, so store that rather than the StripeObject
+    stripe_events.record_event(json.loads(request.body))
+    return JsonResponse({'success': True})
+
+
+class SuccessView(LoginRequiredMixin, TemplateView):
+    """
+    Success page after payment. Orders are created by the webhook worker,
+    so this only reports how far along the session is.
+    """
     template_name = 'market/checkout_success.html'
-    
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         session_id = self.request.GET.get('session_id')
-        
-        if session_id:
+        context['status'] = stripe_events.session_status(session_id, self.request.user) if session_id else 'complete'
+        if context['status'] == 'processing':
+            # Reload every couple of seconds, but give up after a while (e.g.
+            # webhooks aren't configured) rather than spinning forever
             try:
-                session = stripe.checkout.Session.retrieve(session_id)
-                context['session'] = session
-                
-                # Process order if payment successful
-                if session.payment_status == 'paid':
-                    existing_orders = Order.objects.filter(stripe_session_id=session_id)
-                    if existing_orders.exists():
-                        cart = _get_or_create_cart(self.request.user)
-                        if cart:
-                            CartItem.objects.filter(cart=cart).delete()
-                        messages.info(self.request, "Order already processed.")
-                    else:
-                        # Process new order
-                        cart = _get_or_create_cart(self.request.user)
-                        if cart:
-                            try:
-                                with transaction.atomic():
-                                    # Create orders for each item
-                                    customer = cart.customer
-                                    # Get items list before clearing to avoid queryset issues
-                                    cart_items = list(cart.items.select_related('bag', 'product').all())
-                                    
-                                    for item in cart_items:
-                                        if item.product:
-                                            # Decrease product quantity
-                                            product = item.product
-                                            order_quantity = item.quantity
-                                            
-                                            # Ensure don't oversell
-                                            if order_quantity > product.quantity:
-                                                messages.error(self.request, f"Not enough stock for {product.title}. Available: {product.quantity}, Requested: {order_quantity}")
-                                                continue
-                                            
-                                            # Decrease quantity
-                                            product.quantity -= order_quantity
-                                            
-                                            # Update status based on remaining quantity
-                                            if product.quantity <= 0:
-                                                product.status = 'sold'
-                                            # If quantity > 0, keep status as 'listed' (don't change to 'reserved')
-                                            
-                                            product.save(update_fields=['quantity', 'status'])
-
-                                            # Create Order for Product
-                                            Order.objects.create(
-                                                product=item.product,
-                                                customer=customer,
-                                                status='reserved',
-                                                stripe_session_id=session_id,
-                                                payment_intent_id=session.payment_intent,
-                                                total_cents=item.total_cents(),
-                                                quantity=item.quantity
-                                            )
-                                        
-                                        
-                                        elif item.bag:
-                                            # Create Order record
-                                            Order.objects.create(
-                                                bag=item.bag,
-                                                customer=customer,
-                                                status='reserved',
-                                                stripe_session_id=session_id,
-                                                payment_intent_id=session.payment_intent,
-                                                total_cents=item.total_cents(),
-                                                quantity=item.quantity
-                                            )
-                                            # Update bag status if needed
-                                            if item.bag.status == 'listed':
-                                                item.bag.status = 'reserved'
-                                                item.bag.save(update_fields=['status'])
-                                    
-                                    # Clear cart INSIDE transaction to ensure it happens atomically
-                                    CartItem.objects.filter(cart=cart).delete()
-                                    
-                                messages.success(self.request, "Payment successful! Your order has been processed.")
-                            except Exception as e:
-                                messages.error(self.request, f"Error processing order: {str(e)}")
-            except Exception as e:
-                messages.error(self.request, f"Error processing order: {str(e)}")
-        
+                checks = max(int(self.request.GET.get('checks', 0)), 0)
+            except ValueError:
+                checks = 0
+            if checks < SUCCESS_PAGE_MAX_CHECKS:
+                context['refresh_query'] = urlencode({'session_id': session_id, 'checks': checks + 1})
+            else:
+                context['status'] = 'pending'
         return context
 
 
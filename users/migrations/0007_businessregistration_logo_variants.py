@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_businessregistration_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessregistration',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -40,6 +40,64 @@ class BusinessRegistration(models.Model):
         blank=True,
         null=True,
     )
+    # Resized copies of logo, filled in by a background job (business/images.py)
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    #geocoded location, filled in by a background job when the address is set or changes
+    normalized_address = models.CharField(max_length=255, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=50, blank=True)
+    zip_code = models.CharField(max_length=10, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geocoded_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.email})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_address = instance.__dict__.get("address")
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            address_changed = bool(self.address)
+        else:
+            loaded = getattr(self, "_loaded_address", None)
+            address_changed = (
+                "address" in self.__dict__ and loaded is not None and self.address != loaded
+            )
+
+        if address_changed:
+            #stale coordinates would put the business in the wrong place on the map
+            self.latitude = None
+            self.longitude = None
+            self.geocoded_at = None
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"latitude", "longitude", "geocoded_at"}
+
+        super().save(*args, **kwargs)
+        self._loaded_address = self.__dict__.get("address")
+
+        if address_changed and self.address:
+            from business.geocoding import schedule_business_geocode
+            schedule_business_geocode(self.pk)
+
+    def location(self):
+        """
+        Stored location in the dict shape products and listings copy from,
+        or None while the address hasn't been geocoded yet.
+        """
+        if self.latitude is None or self.longitude is None:
+            return None
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'address': self.normalized_address,
+            'city': self.city,
+            'state': self.state,
+            'zip_code': self.zip_code,
+        }
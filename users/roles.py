@@ -0,0 +1,90 @@
+# File location: users/roles.py
+
+"""
+Group-based role checks without a query per check.
+
+A user's group names are looked up at most once per request (memoized on
+the user object, which AuthenticationMiddleware loads per request). With a
+shared cache backend (CACHE_BACKEND=file or redis) they are also cached
+per user across requests, and users/signals.py drops the cached entry
+whenever the user's memberships change, a group they belong to is renamed
+or deleted, or the user is deleted. A per-process cache (locmem) would only
+see the invalidations made in its own process, so a revoked BUSINESS user
+could keep access through the other workers; with one, every request looks
+its groups up again. User.role is a column on the user row itself, so
+checks on it already cost nothing and it is not cached here.
+"""
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+BUSINESS = "BUSINESS"
+
+# Backstop for changes the signals can't see (raw SQL, another database
+# client); keeps a missed invalidation from granting access for long
+CACHE_TIMEOUT = 300
+
+# Attribute on the user object holding the names for the current request
+_MEMO_ATTR = "_cached_group_names"
+
+
+def cache_key(user_id):
+    return f"users:groups:{user_id}"
+
+
+def cache_is_shared():
+    """Whether the default cache is seen by every process, so invalidations reach them all."""
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def group_names(user):
+    """Names of the groups user belongs to, as a frozenset; empty for anonymous users."""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, _MEMO_ATTR, None)
+    if names is None:
+        shared = cache_is_shared()
+        key = cache_key(user.pk)
+        names = cache.get(key) if shared else None
+        if names is None:
+            names = frozenset(user.groups.values_list("name", flat=True))
+            if shared:
+                cache.set(key, names, CACHE_TIMEOUT)
+        setattr(user, _MEMO_ATTR, names)
+    return names
+
+
+def is_business(user):
+    return BUSINESS in group_names(user)
+
+
+def is_customer(user):
+    """Signed in and not a business; anonymous visitors are neither."""
+    return user.is_authenticated and not is_business(user)
+
+
+def can_add_to_cart(user):
+    """Signed-in users with no groups, or with any group besides BUSINESS."""
+    if not user.is_authenticated:
+        return False
+    names = group_names(user)
+    return not names or bool(names - {BUSINESS})
+
+
+def forget(user):
+    """Drop the per-request memo from a user object, e.g. after changing its groups."""
+    vars(user).pop(_MEMO_ATTR, None)
+
+
+def invalidate(user_ids):
+    """
+    Drop the cached group names of user_ids now and again once the current
+    transaction commits, so a read that lands mid-transaction can't cache
+    the old memberships for CACHE_TIMEOUT.
+    """
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
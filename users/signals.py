@@ -0,0 +1,42 @@
+# File location: users/signals.py
+
+"""Keep the cached group names (users/roles.py) in step with membership changes."""
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import roles
+from .models import User
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def memberships_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        # user.groups.add(...) and friends
+        roles.forget(instance)
+        roles.invalidate([instance.pk])
+    elif action == "pre_clear":
+        # group.user_set.clear() doesn't say whose memberships it removes
+        roles.invalidate(list(instance.user_set.values_list("pk", flat=True)))
+    else:
+        roles.invalidate(pk_set or ())
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    # A rename changes the names cached for every member
+    if not created:
+        roles.invalidate(list(instance.user_set.values_list("pk", flat=True)))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # The membership rows go by cascade, which sends no m2m_changed
+    roles.invalidate(list(instance.user_set.values_list("pk", flat=True)))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    roles.invalidate([instance.pk])
@@ -6,6 +6,8 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from . import roles
+
 def _safe_next_redirect(request, next_url: str):
     if next_url and url_has_allowed_host_and_scheme(
         url=next_url,
@@ -21,7 +23,7 @@ def _role_target_url(user) -> str:
     Solves issue with redirecting business to user dashboard unless stated otherwise.
     """
     is_business = (
-        user.groups.filter(name="BUSINESS").exists()
+        roles.is_business(user)
         or getattr(user, "is_business", False)   
     )
     if is_business: